@@ -0,0 +1,112 @@
+import sys
+import os
+import time
+import tracemalloc
+import numpy as np
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import kmerCounts
+import predictCt
+
+# compares the previous predictCt.createRow, which built a Python list with one entry per k-mer of the vocabulary, with the
+#  sparse row of the current createRow: the time and the peak memory to create the row of one genome
+# the vocabulary and the k-mer counts of the genome are synthetic, the genome shares most of its k-mers with the vocabulary
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_kmrs, kmrs_per_genome, repeats
+def parseParams(args):
+    num_kmrs = 2000000 # (-v) the number of k-mers in the vocabulary
+    kmrs_per_genome = 30000 # (-l) the number of k-mers counted in the genome
+    repeats = 5 # (-r) the number of rows to create with each version
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-v --num_kmrs:\tthe number of k-mers in the vocabulary. The default is 2000000")
+            print("-l --kmrs_per_genome:\tthe number of k-mers counted in the genome. The default is 30000")
+            print("-r --repeats:\tthe number of rows to create with each version. The default is 5")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-v" or args[i] == "--num_kmrs"):
+            num_kmrs = int(args[i + 1])
+        elif (args[i] == "-l" or args[i] == "--kmrs_per_genome"):
+            kmrs_per_genome = int(args[i + 1])
+        elif (args[i] == "-r" or args[i] == "--repeats"):
+            repeats = int(args[i + 1])
+
+    return num_kmrs, min(kmrs_per_genome, num_kmrs), repeats
+
+
+# the previous createRow: a list of zeros as long as the vocabulary, filled in one k-mer at a time, with the 3 instrument columns
+#  inserted in front of the k-mer columns
+def createRowList(codes, frequencies, instrument, vocabulary):
+    row = []
+    for i in range(len(vocabulary)):
+        row.append(0)
+    col_nums = kmerCounts.columnIds(kmerCounts.vocabularyLookup(vocabulary), codes)
+    found = col_nums >= 0
+    for col_num, frequency in zip(col_nums[found], np.asarray(frequencies)[found]):
+        row[col_num] = frequency
+    for i in range(3):
+        row.insert(0, 0)
+    if (instrument == "ALINITY"):
+        row[0] = 1
+    elif (instrument == "PANTHER"):
+        row[1] = 1
+    elif (instrument == "CEPHEID"):
+        row[2] = 1
+    return np.array(row).reshape(1, -1)
+
+
+# the current createRow (predictCt.createRow without the metadata lookup)
+def createRowSparse(codes, frequencies, instrument, vocabulary):
+    features = predictCt.rowFeatures(kmerCounts.vocabularyLookup(vocabulary), len(vocabulary), codes, frequencies, instrument)
+    return predictCt.stackRows([features], len(vocabulary))
+
+
+# returns the median time in seconds and the peak memory in bytes of creating a row
+def measure(create_row, repeats, codes, frequencies, vocabulary):
+    times = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        row = create_row(codes, frequencies, "PANTHER", vocabulary)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    row = create_row(codes, frequencies, "PANTHER", vocabulary)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return np.median(times), peak, row
+
+
+def main(argv):
+    num_kmrs, kmrs_per_genome, repeats = parseParams(argv)
+    rng = np.random.default_rng(42)
+    vocabulary = np.unique(rng.integers(0, 1 << 62, size=num_kmrs, dtype=np.uint64))
+    # 90% of the k-mers of the genome are in the vocabulary, the others are unseen
+    codes = np.concatenate([rng.choice(vocabulary, size=kmrs_per_genome * 9 // 10, replace=False),
+                            rng.integers(0, 1 << 62, size=kmrs_per_genome - kmrs_per_genome * 9 // 10, dtype=np.uint64)])
+    codes.sort()
+    frequencies = rng.integers(1, 100, size=len(codes)).astype(np.uint32)
+    print("k-mers in the vocabulary: ", len(vocabulary), "  k-mers in the genome: ", len(codes))
+
+    list_time, list_peak, list_row = measure(createRowList, repeats, codes, frequencies, vocabulary)
+    sparse_time, sparse_peak, sparse_row = measure(createRowSparse, repeats, codes, frequencies, vocabulary)
+    print("list row:    %10.2f ms  peak memory: %10.2f MB" % (list_time * 1000, list_peak / 1e6))
+    print("sparse row:  %10.2f ms  peak memory: %10.2f MB" % (sparse_time * 1000, sparse_peak / 1e6))
+    print("speedup: %.1fx   memory: %.1fx less" % (list_time / sparse_time, list_peak / sparse_peak))
+
+    # the same features, apart from the instrument columns which are now last (as in the matrix the model is trained on)
+    num_instruments = list_row.shape[1] - len(vocabulary)
+    reordered = np.concatenate([list_row[0, num_instruments:], list_row[0, :num_instruments]])
+    identical = np.array_equal(reordered, sparse_row.toarray()[0])
+    print("identical features:", identical)
+    if (not identical):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
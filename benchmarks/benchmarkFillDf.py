@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import createDataFrame
+
+# compares the bulk loader used by createDataFrame.fillDf with the original loop, which split every line of every
+#  KMC output file in Python and wrote every frequency into a dense DataFrame with one kmr_df.at[] call
+# both are run on the same synthetic KMC output files
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_genomes, vocabulary_size, kmrs_per_genome, kmr_size
+def parseParams(args):
+    num_genomes = 50 # (-n) the number of synthetic genomes (KMC output files)
+    vocabulary_size = 200000 # (-v) the number of unique k-mers across all genomes
+    kmrs_per_genome = 30000 # (-l) the number of unique k-mers in every genome
+    kmr_size = 10 # (-s) the size of the k-mers
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-n --num_genomes:\tthe number of synthetic genomes. The default is 50")
+            print("-v --vocabulary_size:\tthe number of unique k-mers across all genomes. The default is 200000")
+            print("-l --kmrs_per_genome:\tthe number of unique k-mers in every genome. The default is 30000")
+            print("-s --kmr_size:\tthe size of the k-mers. The default is 10")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-v" or args[i] == "--vocabulary_size"):
+            vocabulary_size = int(args[i + 1])
+        elif (args[i] == "-l" or args[i] == "--kmrs_per_genome"):
+            kmrs_per_genome = int(args[i + 1])
+        elif (args[i] == "-s" or args[i] == "--kmr_size"):
+            kmr_size = int(args[i + 1])
+
+    return num_genomes, vocabulary_size, min(kmrs_per_genome, vocabulary_size), kmr_size
+
+
+# writes a synthetic vocabulary, one KMC output file per genome, and a metadata file to work_dir
+# returns: the dictionary of k-mer : column number (as used by the original loop), the vocabulary, and the path to the metadata file
+def createSyntheticData(work_dir, num_genomes, vocabulary_size, kmrs_per_genome, kmr_size):
+    rng = np.random.default_rng(42)
+    codes = rng.choice(4 ** kmr_size, size=vocabulary_size, replace=False)
+    codes.sort()
+    bases = np.array(list("ACGT"))
+    digits = (codes[:, None] >> (2 * np.arange(kmr_size - 1, -1, -1))) & 3
+    kmrs = ["".join(row) for row in bases[digits]]
+    kmr_dictionary = {kmr: col for col, kmr in enumerate(kmrs)}
+
+    rows = ["Genome ID,Instrument,Ct-Value"]
+    instruments = ["ALINITY", "PANTHER", "CEPHEID"]
+    for g in range(num_genomes):
+        genome_id = "SYN-" + str(g)
+        chosen = np.sort(rng.choice(vocabulary_size, size=kmrs_per_genome, replace=False))
+        freqs = rng.integers(1, 20, size=kmrs_per_genome)
+        with open(os.path.join(work_dir, genome_id + "_kmc." + str(kmr_size) + ".kmrs"), "w") as f:
+            f.writelines(kmrs[c] + "\t" + str(n) + "\n" for c, n in zip(chosen, freqs))
+        rows.append(genome_id + "," + instruments[g % 3] + "," + str(round(float(rng.uniform(15, 35)), 1)))
+
+    csv_path = os.path.join(work_dir, "metadata.csv")
+    with open(csv_path, "w") as f:
+        f.write("\n".join(rows) + "\n")
+    return kmr_dictionary, codes.astype(np.uint64), csv_path
+
+
+# the original fillDf loop: one Python split, dictionary lookup and kmr_df.at[] write per line of every file
+def legacyFill(kmr_dictionary, kmc_out_dir, kmr_size):
+    files = sorted(f for f in os.listdir(kmc_out_dir) if f.endswith(".kmrs"))
+    kmr_df = pd.DataFrame(np.zeros((len(files), len(kmr_dictionary) + 5), dtype=int))
+    kmr_df[0] = kmr_df[0].astype(str) # the genome_id column made the original (transposed) frame object-dtyped
+    kmr_df = kmr_df.transpose()
+    for index, name in enumerate(files):
+        kmc_file = open(os.path.join(kmc_out_dir, name))
+        for aline in kmc_file:
+            values = aline.split()
+            dict_encoding = kmr_dictionary[values[0]] + 1
+            kmr_df.at[dict_encoding, index] = values[1]
+        kmc_file.close()
+    return kmr_df
+
+
+# runs fn once and returns the wall time it took in seconds
+def timeIt(fn):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    return time.perf_counter() - start
+
+
+def main(argv):
+    num_genomes, vocabulary_size, kmrs_per_genome, kmr_size = parseParams(argv)
+    start_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="bench_fill_")
+    try:
+        kmr_dictionary, vocabulary, csv_path = createSyntheticData(work_dir, num_genomes, vocabulary_size, kmrs_per_genome, kmr_size)
+        kmc_out_dir = work_dir + "/"
+
+        bulk_time = timeIt(lambda: createDataFrame.fillDf(vocabulary, csv_path, kmc_out_dir, kmr_size))
+        legacy_time = timeIt(lambda: legacyFill(kmr_dictionary, kmc_out_dir, kmr_size))
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(work_dir)
+
+    print("genomes: ", num_genomes, "  k-mers per genome: ", kmrs_per_genome, "  vocabulary: ", vocabulary_size)
+    print("per-cell .at[] loop:  %.3f s" % legacy_time)
+    print("bulk loader (fillDf): %.3f s" % bulk_time)
+    print("speedup:              %.1fx" % (legacy_time / bulk_time))
+
+
+if __name__ == '__main__':
+	main(sys.argv)
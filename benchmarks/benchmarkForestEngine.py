@@ -0,0 +1,98 @@
+import sys
+import os
+import time
+import numpy as np
+from scipy import sparse
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forestEngine
+import modelStore
+import trainModel
+
+# compares predicting with the scikit-learn model and with the flat forest engine (forestEngine.py): the time to predict one
+#  genome at a time and a whole batch, and whether the predictions are identical
+# the model is trained on a synthetic sparse k-mer matrix as wide as a real vocabulary, and the genomes to predict are sparse rows
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_genomes, num_kmrs, kmrs_per_genome, num_trees, num_predictions
+def parseParams(args):
+    num_genomes = 1000 # (-n) the number of rows of the synthetic matrix
+    num_kmrs = 500000 # (-v) the number of k-mer columns
+    kmrs_per_genome = 20000 # (-l) the number of non-zero k-mers in every row
+    num_trees = 100 # (-nt) the number of trees
+    num_predictions = 200 # (-p) the number of genomes to predict
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-n --num_genomes:\tthe number of rows of the synthetic matrix. The default is 1000")
+            print("-v --num_kmrs:\tthe number of k-mer columns. The default is 500000")
+            print("-l --kmrs_per_genome:\tthe number of non-zero k-mers in every row. The default is 20000")
+            print("-nt --num_trees:\tthe number of trees. The default is 100")
+            print("-p --num_predictions:\tthe number of genomes to predict. The default is 200")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-v" or args[i] == "--num_kmrs"):
+            num_kmrs = int(args[i + 1])
+        elif (args[i] == "-l" or args[i] == "--kmrs_per_genome"):
+            kmrs_per_genome = int(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+        elif (args[i] == "-p" or args[i] == "--num_predictions"):
+            num_predictions = int(args[i + 1])
+
+    return num_genomes, num_kmrs, min(kmrs_per_genome, num_kmrs), num_trees, num_predictions
+
+
+# creates a synthetic sparse k-mer matrix (uint32 counts, as in the feature store)
+def createSyntheticMatrix(rng, num_genomes, num_kmrs, kmrs_per_genome):
+    indices = np.concatenate([np.sort(rng.choice(num_kmrs, size=kmrs_per_genome, replace=False)) for g in range(num_genomes)])
+    indptr = np.arange(num_genomes + 1) * kmrs_per_genome
+    data = rng.integers(1, 20, size=len(indices)).astype(np.uint32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(num_genomes, num_kmrs))
+
+
+def main(argv):
+    num_genomes, num_kmrs, kmrs_per_genome, num_trees, num_predictions = parseParams(argv)
+    rng = np.random.default_rng(42)
+    kmr_matrix = createSyntheticMatrix(rng, num_genomes, num_kmrs, kmrs_per_genome)
+    labels = 25 + kmr_matrix[:, :1000].sum(axis=1).A1 / 100 + rng.normal(0, 3, num_genomes)
+    model = trainModel.fitModel(kmr_matrix, labels, num_trees, None, 0.25, "sqrt", -1, "threading")
+    model.set_params(n_jobs=1)
+    forest = modelStore.compileModel(model)
+    genomes = createSyntheticMatrix(rng, num_predictions, num_kmrs, kmrs_per_genome)
+    print("trees: ", num_trees, "  nodes: ", forest.header["n_nodes"], "  k-mers: ", num_kmrs, "  k-mers per genome: ", kmrs_per_genome)
+
+    # one genome at a time (as predictCt.py -n), from the k-mer columns and counts of the genome
+    rows = [(genomes.indices[genomes.indptr[i]:genomes.indptr[i + 1]], genomes.data[genomes.indptr[i]:genomes.indptr[i + 1]]) for i in range(num_predictions)]
+    start = time.perf_counter()
+    sklearn_single = [model.predict(genomes[i])[0] for i in range(num_predictions)]
+    sklearn_time = (time.perf_counter() - start) / num_predictions
+    start = time.perf_counter()
+    engine_single = [forestEngine.predictFeatures(forest, columns, counts) for columns, counts in rows]
+    engine_time = (time.perf_counter() - start) / num_predictions
+    print("one genome:  scikit-learn %8.3f ms   engine %8.3f ms   speedup %.1fx" % (sklearn_time * 1000, engine_time * 1000, sklearn_time / engine_time))
+
+    # the whole batch at once (as predictCt.py -b)
+    start = time.perf_counter()
+    sklearn_batch = model.predict(genomes)
+    sklearn_time = time.perf_counter() - start
+    start = time.perf_counter()
+    engine_batch = forest.predict(genomes)
+    engine_time = time.perf_counter() - start
+    print("batch:       scikit-learn %8.3f s    engine %8.3f s    speedup %.1fx" % (sklearn_time, engine_time, sklearn_time / engine_time))
+
+    identical = np.array_equal(sklearn_single, engine_single) and np.array_equal(sklearn_batch, engine_batch)
+    print("identical predictions:", identical)
+    if (not identical):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
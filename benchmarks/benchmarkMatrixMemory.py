@@ -0,0 +1,147 @@
+import sys
+import os
+import time
+import ctypes
+import shutil
+import tempfile
+import numpy as np
+from scipy import sparse
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import createDataFrame
+import kmerCounter
+import kmerCounts
+import metadataIndex
+import profiling
+
+# compares the previous createDataFrame.fillDf, which kept every row as its own arrays and concatenated them at the end, with
+#  the current fillDf, which writes the rows into one pair of buffers allocated for an upper bound of the non-zero values:
+#  the time and the peak memory (the rise of the resident set size of the process, Linux only) of building the k-mer matrix
+# the KMC outputs are synthetic, every genome has kmrs_per_genome k-mers drawn from a pool of 4 * kmrs_per_genome k-mers
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_genomes, kmrs_per_genome
+def parseParams(args):
+    num_genomes = 300 # (-n) the number of genomes
+    kmrs_per_genome = 30000 # (-l) the number of k-mers counted in every genome
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-n --num_genomes:\tthe number of genomes. The default is 300")
+            print("-l --kmrs_per_genome:\tthe number of k-mers counted in every genome. The default is 30000")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-l" or args[i] == "--kmrs_per_genome"):
+            kmrs_per_genome = int(args[i + 1])
+
+    return num_genomes, kmrs_per_genome
+
+
+# the previous fillDf: the column indices and values of every row in their own arrays, concatenated into the matrix at the end
+def fillDfRows(vocabulary, csv_path, kmc_out_dir, kmr_size):
+    num_kmrs = len(vocabulary)
+    lookup = kmerCounts.vocabularyLookup(vocabulary)
+    kmrs_files = createDataFrame.listKmrsFiles(kmc_out_dir, kmr_size)
+    instruments, cts, in_metadata = metadataIndex.lookupGenomes(metadataIndex.loadMetadata(csv_path), [genome_id for genome_id, path in kmrs_files])
+    kmrs_files = [kmrs_file for kmrs_file, found in zip(kmrs_files, in_metadata) if found]
+
+    genome_ids, ct_values, row_indices, row_data = [], [], [], []
+    for (genome_id, kmrs_path), ins, ct in zip(kmrs_files, instruments[in_metadata], cts[in_metadata]):
+        codes, freqs = kmerCounts.readKmrsCodes(kmrs_path, kmr_size)
+        cols = kmerCounts.columnIds(lookup, codes)
+        found = cols >= 0
+        cols = cols[found]
+        freqs = freqs[found]
+        if (ins in metadataIndex.INSTRUMENTS):
+            cols = np.append(cols, np.int32(num_kmrs + metadataIndex.INSTRUMENTS.index(ins)))
+            freqs = np.append(freqs, np.uint32(1))
+        order = np.argsort(cols, kind="stable")
+        row_indices.append(cols[order])
+        row_data.append(freqs[order])
+        genome_ids.append(genome_id)
+        ct_values.append(ct)
+
+    indptr = np.zeros(len(row_indices) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(cols) for cols in row_indices])
+    kmr_matrix = sparse.csr_matrix((np.concatenate(row_data), np.concatenate(row_indices), indptr), shape=(len(row_indices), num_kmrs + len(metadataIndex.INSTRUMENTS)))
+    return kmr_matrix, np.array(genome_ids, dtype=str), np.array(ct_values, dtype=np.float64)
+
+
+# returns the memory freed by earlier steps (e.g. parsing the KMC outputs) to the operating system, so a version does not
+#  reuse it without raising the resident set size (glibc only)
+def releaseFreeMemory():
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# builds the matrix with fill_df and returns the time in seconds, the peak memory in bytes (None if it cannot be measured)
+#  and the matrix
+def measure(fill_df, vocabulary, csv_path, kmc_out_dir, kmr_size):
+    releaseFreeMemory()
+    measured = profiling.resetPeakRss()
+    start_rss = profiling.memoryUsage()[0]
+    start = time.perf_counter()
+    kmr_matrix, genome_ids, ct_values = fill_df(vocabulary, csv_path, kmc_out_dir, kmr_size)
+    seconds = time.perf_counter() - start
+    peak = profiling.memoryUsage()[1] - start_rss if measured else None
+    return seconds, peak, kmr_matrix
+
+
+def main(argv):
+    num_genomes, kmrs_per_genome = parseParams(argv)
+    kmr_size = 10
+    rng = np.random.default_rng(42)
+    pool = np.unique(rng.integers(0, 1 << (2 * kmr_size), size=4 * kmrs_per_genome, dtype=np.uint64))
+    work_dir = tempfile.mkdtemp(prefix="benchmark_filldf_")
+    try:
+        kmc_out_dir = os.path.join(work_dir, "kmc_output")
+        os.makedirs(kmc_out_dir)
+        rows = [metadataIndex.ID_COLUMN + "," + metadataIndex.INSTRUMENT_COLUMN + "," + metadataIndex.CT_COLUMN]
+        for g in range(num_genomes):
+            codes = np.sort(rng.choice(pool, size=min(kmrs_per_genome, len(pool)), replace=False))
+            frequencies = rng.integers(1, 20, size=len(codes)).astype(np.uint32)
+            kmerCounter.writeKmrsFile(os.path.join(kmc_out_dir, "G-" + str(g) + "_kmc." + str(kmr_size) + ".kmrs"), codes, frequencies, kmr_size)
+            rows.append("G-" + str(g) + "," + metadataIndex.INSTRUMENTS[g % 3] + "," + str(20 + g % 10))
+        csv_path = os.path.join(work_dir, "metadata.csv")
+        with open(csv_path, "w") as f:
+            f.write("\n".join(rows) + "\n")
+        vocabulary = createDataFrame.createDictionary(kmr_size, kmc_out_dir)
+        print("genomes: ", num_genomes, "  k-mers per genome: ", kmrs_per_genome, "  k-mers in the vocabulary: ", len(vocabulary))
+
+        # the output of fillDf (one line per genome) is discarded
+        with open(os.devnull, "w") as devnull:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                rows_time, rows_peak, rows_matrix = measure(fillDfRows, vocabulary, csv_path, kmc_out_dir, kmr_size)
+                del rows_matrix
+                buffer_time, buffer_peak, buffer_matrix = measure(createDataFrame.fillDf, vocabulary, csv_path, kmc_out_dir, kmr_size)
+                rows_matrix = fillDfRows(vocabulary, csv_path, kmc_out_dir, kmr_size)[0]
+            finally:
+                sys.stdout = stdout
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    matrix_size = buffer_matrix.data.nbytes + buffer_matrix.indices.nbytes + buffer_matrix.indptr.nbytes
+    print("matrix: %d non-zero values, %.2f MB" % (buffer_matrix.nnz, matrix_size / 1e6))
+    for name, seconds, peak in [("rows + concatenate", rows_time, rows_peak), ("one buffer", buffer_time, buffer_peak)]:
+        memory = "n/a" if peak is None else "%.2f MB (%.2fx the matrix)" % (peak / 1e6, peak / matrix_size)
+        print("%-20s %8.3f s  peak memory: %s" % (name, seconds, memory))
+
+    identical = (rows_matrix != buffer_matrix).nnz == 0 and rows_matrix.dtype == buffer_matrix.dtype
+    print("identical matrices:", identical)
+    if (not identical):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import shutil
+import pickle
+import tempfile
+import subprocess
+import numpy as np
+from scipy import sparse
+
+# the scripts of the pipeline are in the parent directory
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+import modelStore
+import trainModel
+
+# compares the pickled model written by trainModel.py with the flat forest of modelStore.py: the size on disk, and the time a
+#  new process takes to load the model and predict one genome from a cold page cache
+# the files of the model are evicted from the page cache (posix_fadvise) before every load, so the load reads them from disk
+# the model is either a pickled model given with -m, or a model trained on a synthetic sparse k-mer matrix
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: model_name, num_genomes, num_kmrs, num_trees, repeats
+def parseParams(args):
+    model_name = "" # (-m) a pickled model to benchmark instead of a synthetic one
+    num_genomes = 2000 # (-n) the number of rows of the synthetic matrix
+    num_kmrs = 20000 # (-v) the number of k-mer columns of the synthetic matrix
+    num_trees = 100 # (-nt) the number of trees of the synthetic model
+    repeats = 5 # (-r) the number of cold loads to time
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-m --model_name:\ta pickled model (.sav) to benchmark. The default is a model trained on synthetic data")
+            print("-n --num_genomes:\tthe number of rows of the synthetic matrix. The default is 2000")
+            print("-v --num_kmrs:\tthe number of k-mer columns of the synthetic matrix. The default is 20000")
+            print("-nt --num_trees:\tthe number of trees of the synthetic model. The default is 100")
+            print("-r --repeats:\tthe number of cold loads to time. The default is 5")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-m" or args[i] == "--model_name"):
+            model_name = os.path.abspath(args[i + 1])
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-v" or args[i] == "--num_kmrs"):
+            num_kmrs = int(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+        elif (args[i] == "-r" or args[i] == "--repeats"):
+            repeats = int(args[i + 1])
+
+    return model_name, num_genomes, num_kmrs, num_trees, repeats
+
+
+# trains a fully grown forest (max_depth None, as trainModel.py) on a synthetic sparse k-mer matrix
+def trainSyntheticModel(num_genomes, num_kmrs, num_trees):
+    rng = np.random.default_rng(42)
+    kmr_matrix = sparse.random(num_genomes, num_kmrs, density=0.05, format="csr", random_state=42, data_rvs=lambda n: rng.integers(1, 20, n))
+    labels = 25 + kmr_matrix[:, :10].sum(axis=1).A1 / 10 + rng.normal(0, 3, num_genomes)
+    return trainModel.fitModel(kmr_matrix, labels, num_trees, None, 0.25, 1.0, -1, "threading")
+
+
+# returns the size in bytes of a file or of all files in a directory
+def diskSize(path):
+    if (os.path.isdir(path)):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+    return os.path.getsize(path)
+
+
+# evicts a file (or all files in a directory) from the page cache
+def evictFromCache(path):
+    paths = [entry.path for entry in os.scandir(path)] if os.path.isdir(path) else [path]
+    for p in paths:
+        fd = os.open(p, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+# loads a model in a new process and predicts one row, returning the time the load and the prediction took in seconds
+def coldLoad(model_path, num_features):
+    evictFromCache(model_path)
+    code = ("import sys, time, numpy as np; sys.path.insert(0, " + repr(PACKAGE_DIR) + "); import modelStore\n"
+            "start = time.perf_counter(); model = modelStore.loadModel(" + repr(model_path) + "); loaded = time.perf_counter()\n"
+            "model.predict(np.ones((1, " + str(num_features) + "), dtype=np.float32)); done = time.perf_counter()\n"
+            "print(loaded - start, done - loaded)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), float(output[1])
+
+
+def main(argv):
+    model_name, num_genomes, num_kmrs, num_trees, repeats = parseParams(argv)
+    work_dir = tempfile.mkdtemp(prefix="bench_model_")
+    try:
+        if (model_name != ""):
+            with open(model_name, "rb") as f:
+                model = pickle.load(f)
+        else:
+            model = trainSyntheticModel(num_genomes, num_kmrs, num_trees)
+        num_nodes = sum(estimator.tree_.node_count for estimator in model.estimators_)
+        print("trees: ", len(model.estimators_), "  nodes: ", num_nodes, "  features: ", model.n_features_in_)
+
+        paths = {"pickle": os.path.join(work_dir, "model.sav"), "flat forest": os.path.join(work_dir, "model.forest")}
+        for path in paths.values():
+            modelStore.storeModel(model, path)
+
+        for name, path in paths.items():
+            times = [coldLoad(path, model.n_features_in_) for r in range(repeats)]
+            load_time = np.median([t[0] for t in times])
+            predict_time = np.median([t[1] for t in times])
+            print("%-12s size: %8.2f MB  cold load: %8.2f ms  first prediction: %8.2f ms"
+                  % (name, diskSize(path) / 1e6, load_time * 1000, predict_time * 1000))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
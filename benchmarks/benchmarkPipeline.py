@@ -0,0 +1,215 @@
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+import scipy
+import sklearn
+
+# the scripts of the pipeline are in the parent directory
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import createDataFrame
+import kmerCounts
+import metadataIndex
+import modelStore
+import predictCt
+import profiling
+import runKMC
+import trainModel
+import syntheticGenomes
+
+# runs every stage of the pipeline on synthetic genomes (see syntheticGenomes.py) in one process and measures each stage on
+#  its own: the wall time, the peak memory of the stage, and the maximal resident set size of the child processes (KMC) so far
+# the peak memory of a stage is how far the resident set size of the process rose above its size at the start of the stage:
+#  on Linux the high-water mark of the process is reset before every stage (/proc/self/clear_refs), elsewhere the peak of
+#  the memory allocated by Python and NumPy is traced instead (tracemalloc, which slows down stages that create many objects)
+# the stages are the steps of ct_value_prediction.sh:
+#    count: counting the k-mers of every genome (runKMC.runKMC)
+#    createDictionary: the vocabulary of all k-mers (createDataFrame.createDictionary)
+#    fillDf: the sparse k-mer matrix (createDataFrame.fillDf)
+#    store: writing the feature store and the vocabulary (createDataFrame.storeResults)
+#    load: opening the feature store and splitting it into a train and test set (trainModel.openDataFrame and splitDf)
+#    fit: fitting the Random Forest (trainModel.fitModel)
+#    predict: predicting the Ct values of all genomes from their KMC outputs (predictCt.predictBatch with the flat forest)
+# the results are written as JSON, so runs on different versions of the code can be compared (option -b)
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_genomes, genome_length, mutation_rate, kmr_size, counter, num_trees, jobs, output_file_name, baseline_file_name
+def parseParams(args):
+    num_genomes = 200 # (-n) the number of synthetic genomes
+    genome_length = syntheticGenomes.GENOME_LENGTH # (-L) the length of the genomes
+    mutation_rate = 0.001 # (-mr) the substitutions per base of every lineage and genome
+    kmr_size = 10 # (-s) the size of the k-mers
+    counter = "kmc" if shutil.which("kmc") is not None else "python" # (-cn) the k-mer counter of the count stage
+    num_trees = 100 # (-nt) the number of trees of the model
+    jobs = 1 # (-j) the number of genomes counted and trees fit in parallel
+    output_file_name = "benchmark_pipeline.json" # (-o) the JSON file to write the results to
+    baseline_file_name = "" # (-b) the results of an earlier run to compare with
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-n --num_genomes:\tthe number of synthetic genomes. The default is 200")
+            print("-L --genome_length:\tthe length of the genomes. The default is " + str(syntheticGenomes.GENOME_LENGTH))
+            print("-mr --mutation_rate:\tthe substitutions per base of every lineage and genome. The default is 0.001")
+            print("-s --kmr_size:\tthe size of the k-mers. The default is 10")
+            print("-cn --counter:\tthe k-mer counter: 'kmc' or 'python'. The default is 'kmc' if KMC is installed and 'python' otherwise")
+            print("-nt --num_trees:\tthe number of trees of the model. The default is 100")
+            print("-j --jobs:\tthe number of genomes counted and trees fit in parallel. The default is 1")
+            print("-o --output_file_name:\tthe JSON file to write the results to. The default is 'benchmark_pipeline.json'")
+            print("-b --baseline:\tthe JSON file of an earlier run to compare the times with. There is no default for this option.")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-L" or args[i] == "--genome_length"):
+            genome_length = int(args[i + 1])
+        elif (args[i] == "-mr" or args[i] == "--mutation_rate"):
+            mutation_rate = float(args[i + 1])
+        elif (args[i] == "-s" or args[i] == "--kmr_size"):
+            kmr_size = int(args[i + 1])
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            jobs = max(1, int(args[i + 1]))
+        elif (args[i] == "-o" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-b" or args[i] == "--baseline"):
+            baseline_file_name = args[i + 1]
+
+    return num_genomes, genome_length, mutation_rate, kmr_size, counter, num_trees, jobs, output_file_name, baseline_file_name
+
+
+# returns the method used to measure the peak memory of a stage: "rss" or "tracemalloc" (see above)
+def memoryMethod():
+    return "rss" if profiling.resetPeakRss() else "tracemalloc"
+
+
+# runs one stage and measures it, the output the stage prints is discarded
+# parameters:
+#    stages: the list of measurements the measurement of the stage is appended to
+#    name: the name of the stage
+#    run_stage: a function without arguments running the stage
+#    memory_method: "rss" or "tracemalloc" (see memoryMethod)
+# returns: what run_stage returns
+def measureStage(stages, name, run_stage, memory_method):
+    if (memory_method == "rss"):
+        profiling.resetPeakRss()
+        start_rss = profiling.readRss()[0]
+    else:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_stage()
+    seconds = time.perf_counter() - start
+    if (memory_method == "rss"):
+        rss, peak_rss = profiling.readRss()
+        peak = peak_rss - start_rss
+    else:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rss = None
+    stages.append({"stage": name, "seconds": round(seconds, 4), "peak_memory_mb": round(peak / 1e6, 2),
+                   "rss_mb": None if rss is None else round(rss / 1e6, 1), "max_rss_children_mb": round(profiling.childrenMaxRss(), 1)})
+    print("%-17s %9.3f s  peak memory: %9.2f MB" % (name, seconds, peak / 1e6))
+    return result
+
+
+# returns the commit of the code being benchmarked, or None if it is not a git checkout
+def gitCommit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PACKAGE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+# runs every stage of the pipeline in work_dir
+# returns: the list of measurements of the stages
+def runPipeline(work_dir, genomes_dir, csv_path, kmr_size, counter, num_trees, jobs, memory_method):
+    kmc_out_dir = os.path.join(work_dir, "kmc_output") + "/"
+    stages = []
+
+    measureStage(stages, "count", lambda: runKMC.runKMC(genomes_dir, kmc_out_dir, kmr_size, jobs, os.cpu_count() or 1, counter=counter), memory_method)
+    # the following stages read the KMC output files, as in the pipeline
+    vocabulary = measureStage(stages, "createDictionary", lambda: createDataFrame.createDictionary(kmr_size, kmc_out_dir), memory_method)
+    kmr_matrix, genome_ids, ct_values = measureStage(stages, "fillDf", lambda: createDataFrame.fillDf(vocabulary, csv_path, kmc_out_dir, kmr_size), memory_method)
+    genome_files = createDataFrame.listGenomes(genomes_dir)
+    measureStage(stages, "store", lambda: createDataFrame.storeResults(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, work_dir, "kmr_df", "kmr_vocabulary.npy", genome_files), memory_method)
+    del kmr_matrix
+
+    def load():
+        kmr_matrix, ct_values = trainModel.openDataFrame(work_dir, "kmr_df")
+        return trainModel.splitDf(kmr_matrix, ct_values, 0.2)
+    train_set, train_labels, test_set, test_labels = measureStage(stages, "load", load, memory_method)
+    model = measureStage(stages, "fit", lambda: trainModel.fitModel(train_set, train_labels, num_trees, None, 0.25, 1.0, jobs, "threading"), memory_method)
+
+    def predict():
+        vocabulary = kmerCounts.loadVocabulary(os.path.join(work_dir, "kmr_vocabulary.npy"), kmr_size)
+        metadata = metadataIndex.loadMetadataCached(csv_path)
+        forest = modelStore.compileModel(model)
+        return predictCt.predictBatch(predictCt.listBatchGenomes(genomes_dir), kmc_out_dir, kmr_size, vocabulary, metadata, forest, jobs, counter)
+    measureStage(stages, "predict", predict, memory_method)
+    return stages
+
+
+# prints the time of every stage relative to the same stage in an earlier run
+def compareWithBaseline(stages, baseline_file_name):
+    with open(baseline_file_name) as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+    print("\ncompared with", baseline_file_name + ":")
+    for stage in stages:
+        if (stage["stage"] in baseline and baseline[stage["stage"]]["seconds"] > 0):
+            ratio = stage["seconds"] / baseline[stage["stage"]]["seconds"]
+            print("%-17s %6.2fx the time of the baseline" % (stage["stage"], ratio))
+
+
+def main(argv):
+    num_genomes, genome_length, mutation_rate, kmr_size, counter, num_trees, jobs, output_file_name, baseline_file_name = parseParams(argv)
+    start_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    memory_method = memoryMethod()
+    try:
+        genomes_dir, csv_path = syntheticGenomes.createSyntheticGenomes(work_dir, num_genomes, genome_length, mutation_rate)
+        genomes_dir = os.path.abspath(genomes_dir) + "/"
+        print("genomes: ", num_genomes, "  length: ", genome_length, "  mutation rate: ", mutation_rate, "  k: ", kmr_size, "  counter: ", counter)
+        stages = runPipeline(work_dir, genomes_dir, csv_path, kmr_size, counter, num_trees, jobs, memory_method)
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(work_dir)
+
+    results = {
+        "benchmark": "pipeline",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": gitCommit(),
+        "parameters": {"num_genomes": num_genomes, "genome_length": genome_length, "mutation_rate": mutation_rate,
+                       "kmr_size": kmr_size, "counter": counter, "num_trees": num_trees, "jobs": jobs},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+                        "sklearn": sklearn.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                        "memory_method": memory_method},
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 4),
+    }
+    with open(output_file_name, "w") as f:
+        json.dump(results, f, indent=2)
+    print("total: %.3f s, results written to %s" % (results["total_seconds"], output_file_name))
+    if (baseline_file_name != ""):
+        compareWithBaseline(stages, baseline_file_name)
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,81 @@
+import sys
+import os
+import time
+import numpy as np
+from scipy import sparse
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trainModel
+
+# measures how the time to fit the Random Forest of trainModel.py scales with the number of jobs (-j) for both backends (-bk)
+# the model is fit on a synthetic sparse k-mer matrix, doubling the number of jobs up to the number of CPU cores
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: num_genomes, num_kmrs, kmrs_per_genome, num_trees, max_jobs
+def parseParams(args):
+    num_genomes = 2000 # (-n) the number of rows of the synthetic matrix
+    num_kmrs = 50000 # (-v) the number of k-mer columns
+    kmrs_per_genome = 5000 # (-l) the number of non-zero k-mers in every row
+    num_trees = 64 # (-nt) the number of trees to fit
+    max_jobs = os.cpu_count() # (-j) the largest number of jobs to time
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print("-n --num_genomes:\tthe number of rows of the synthetic matrix. The default is 2000")
+            print("-v --num_kmrs:\tthe number of k-mer columns. The default is 50000")
+            print("-l --kmrs_per_genome:\tthe number of non-zero k-mers in every row. The default is 5000")
+            print("-nt --num_trees:\tthe number of trees to fit. The default is 64")
+            print("-j --jobs:\tthe largest number of jobs to time. The default is the number of CPU cores")
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-v" or args[i] == "--num_kmrs"):
+            num_kmrs = int(args[i + 1])
+        elif (args[i] == "-l" or args[i] == "--kmrs_per_genome"):
+            kmrs_per_genome = int(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            max_jobs = int(args[i + 1])
+
+    return num_genomes, num_kmrs, min(kmrs_per_genome, num_kmrs), num_trees, max_jobs
+
+
+# creates a synthetic sparse k-mer matrix whose labels depend on a few of its columns
+# returns: the matrix (CSR, uint32 frequencies as in the feature store) and the labels
+def createSyntheticData(num_genomes, num_kmrs, kmrs_per_genome):
+    rng = np.random.default_rng(42)
+    indices = np.concatenate([np.sort(rng.choice(num_kmrs, size=kmrs_per_genome, replace=False)) for g in range(num_genomes)])
+    indptr = np.arange(num_genomes + 1) * kmrs_per_genome
+    data = rng.integers(1, 20, size=len(indices)).astype(np.uint32)
+    kmr_matrix = sparse.csr_matrix((data, indices, indptr), shape=(num_genomes, num_kmrs))
+    labels = 25 + kmr_matrix[:, :10].sum(axis=1).A1 / 10 + rng.normal(0, 1, num_genomes)
+    return kmr_matrix, labels
+
+
+def main(argv):
+    num_genomes, num_kmrs, kmrs_per_genome, num_trees, max_jobs = parseParams(argv)
+    kmr_matrix, labels = createSyntheticData(num_genomes, num_kmrs, kmrs_per_genome)
+    print("genomes: ", num_genomes, "  k-mers: ", num_kmrs, "  k-mers per genome: ", kmrs_per_genome, "  trees: ", num_trees)
+
+    jobs = 1
+    serial_time = None
+    while (jobs <= max_jobs):
+        for backend in ["threading", "loky"]:
+            start = time.perf_counter()
+            trainModel.fitModel(kmr_matrix, labels, num_trees, None, 0.25, 1.0, jobs, backend)
+            fit_time = time.perf_counter() - start
+            if (serial_time is None):
+                serial_time = fit_time
+            print("jobs: %3d  backend: %-9s  %.3f s  speedup: %.2fx" % (jobs, backend, fit_time, serial_time / fit_time))
+        jobs *= 2
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,136 @@
+import sys
+import os
+import numpy as np
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fastaReader
+import metadataIndex
+
+# generates synthetic SARS-CoV-2-like genomes and a matching metadata file, to run the pipeline on data that can be shared
+# a random reference genome is drawn with the base composition of SARS-CoV-2, the genomes belong to a few lineages that each
+#  carry their own substitutions, and every genome adds its own substitutions at the mutation rate; some genomes have a run of
+#  N's (a sequencing gap)
+# the Ct value of a genome depends on its lineage and instrument plus noise, so a model trained on the k-mers has a signal to learn
+# the genomes are written as <genomes_dir>/SYN-<n>.fasta and the metadata as a .csv file with the columns of the real metadata file
+
+# the base composition of SARS-CoV-2 (A, C, G, T)
+BASE_FREQUENCIES = [0.299, 0.184, 0.196, 0.321]
+# the length of the SARS-CoV-2 reference genome
+GENOME_LENGTH = 29903
+# the number of lineages the genomes belong to
+NUM_LINEAGES = 8
+# the fraction of genomes with a sequencing gap (a run of N's) and the range of its length
+GAP_FRACTION = 0.1
+GAP_LENGTH = (50, 300)
+# the mean Ct value, the standard deviation of the effect of a lineage and of the noise, and the offset of every instrument
+CT_MEAN = 25.0
+LINEAGE_CT_SD = 3.0
+NOISE_CT_SD = 2.0
+INSTRUMENT_CT_OFFSET = {"ALINITY": -1.0, "PANTHER": 0.0, "CEPHEID": 2.0}
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: out_dir, num_genomes, genome_length, mutation_rate, seed
+def parseParams(args):
+    out_dir = "synthetic_genomes" # (-o) the directory to write the genomes and the metadata file to
+    num_genomes = 200 # (-n) the number of genomes
+    genome_length = GENOME_LENGTH # (-L) the length of the genomes
+    mutation_rate = 0.001 # (-mr) the substitutions per base of every genome and every lineage
+    seed = 42 # (-sd) the seed of the random number generator
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-o" or args[i] == "--out_dir"):
+            out_dir = args[i + 1]
+        elif (args[i] == "-n" or args[i] == "--num_genomes"):
+            num_genomes = int(args[i + 1])
+        elif (args[i] == "-L" or args[i] == "--genome_length"):
+            genome_length = int(args[i + 1])
+        elif (args[i] == "-mr" or args[i] == "--mutation_rate"):
+            mutation_rate = float(args[i + 1])
+        elif (args[i] == "-sd" or args[i] == "--seed"):
+            seed = int(args[i + 1])
+
+    return out_dir, num_genomes, genome_length, mutation_rate, seed
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-o --out_dir:\tthe directory to write the genomes (to out_dir/genomes) and the metadata file (out_dir/metadata.csv) to. The default is 'synthetic_genomes'"
+    s+= "\n-n --num_genomes:\tthe number of genomes. The default is 200"
+    s+= "\n-L --genome_length:\tthe length of the genomes. The default is " + str(GENOME_LENGTH) + " (SARS-CoV-2)"
+    s+= "\n-mr --mutation_rate:\tthe substitutions per base that every lineage adds to the reference and every genome adds to its lineage. The default is 0.001"
+    s+= "\n-sd --seed:\tthe seed of the random number generator. The default is 42"
+    return s
+
+
+# substitutes bases of a sequence at random positions, every substituted base changes to one of the 3 other bases
+# parameters:
+#    rng: the random number generator
+#    sequence: the sequence as an array of 2-bit base codes (changed in place)
+#    mutation_rate: the probability of every base to be substituted
+def substitute(rng, sequence, mutation_rate):
+    positions = np.flatnonzero(rng.random(len(sequence)) < mutation_rate)
+    sequence[positions] = (sequence[positions] + rng.integers(1, 4, size=len(positions))) % 4
+
+
+# writes synthetic genomes as .fasta files and their metadata file
+# parameters:
+#    out_dir: the directory to write to, the genomes are written to out_dir/genomes and the metadata to out_dir/metadata.csv
+#    num_genomes: the number of genomes
+#    genome_length: the length of the genomes
+#    mutation_rate: the substitutions per base of every lineage (from the reference) and of every genome (from its lineage)
+#    seed: the seed of the random number generator
+# returns: the directory of the genomes and the path to the metadata file
+def createSyntheticGenomes(out_dir, num_genomes, genome_length=GENOME_LENGTH, mutation_rate=0.001, seed=42):
+    rng = np.random.default_rng(seed)
+    genomes_dir = os.path.join(out_dir, "genomes")
+    os.makedirs(genomes_dir, exist_ok=True)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+    reference = rng.choice(4, size=genome_length, p=BASE_FREQUENCIES).astype(np.uint8)
+    lineages = []
+    for l in range(NUM_LINEAGES):
+        lineage = reference.copy()
+        substitute(rng, lineage, mutation_rate)
+        lineages.append(lineage)
+    lineage_effects = rng.normal(0, LINEAGE_CT_SD, NUM_LINEAGES)
+
+    rows = [metadataIndex.ID_COLUMN + "," + metadataIndex.INSTRUMENT_COLUMN + "," + metadataIndex.CT_COLUMN]
+    for g in range(num_genomes):
+        genome_id = "SYN-" + str(g)
+        lineage = rng.integers(NUM_LINEAGES)
+        sequence = lineages[lineage].copy()
+        substitute(rng, sequence, mutation_rate)
+        sequence = bases[sequence]
+        if (rng.random() < GAP_FRACTION):
+            gap_length = rng.integers(GAP_LENGTH[0], GAP_LENGTH[1] + 1)
+            gap_start = rng.integers(0, max(1, genome_length - gap_length))
+            sequence[gap_start:gap_start + gap_length] = ord("N")
+        fastaReader.writeFastaRecord(os.path.join(genomes_dir, genome_id + ".fasta"), genome_id, sequence.tobytes())
+
+        instrument = metadataIndex.INSTRUMENTS[rng.integers(len(metadataIndex.INSTRUMENTS))]
+        ct_value = CT_MEAN + lineage_effects[lineage] + INSTRUMENT_CT_OFFSET[instrument] + rng.normal(0, NOISE_CT_SD)
+        rows.append(genome_id + "," + instrument + "," + str(round(float(np.clip(ct_value, 10, 40)), 1)))
+
+    csv_path = os.path.join(out_dir, "metadata.csv")
+    with open(csv_path, "w") as f:
+        f.write("\n".join(rows) + "\n")
+    return genomes_dir, csv_path
+
+
+def main(argv):
+    out_dir, num_genomes, genome_length, mutation_rate, seed = parseParams(argv)
+    genomes_dir, csv_path = createSyntheticGenomes(out_dir, num_genomes, genome_length, mutation_rate, seed)
+    print("--syntheticGenomes.py-- wrote", num_genomes, "genomes to '", genomes_dir, "' and their metadata to '", csv_path, "'")
+
+
+if __name__ == '__main__':
+	main(sys.argv)
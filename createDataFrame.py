@@ -2,19 +2,36 @@ import sys
 import os
 import numpy as np
 import pandas as pd
-import pickle
+from scipy import sparse
+
+import fastaReader
+import featureStore
+import kmerCache
+import kmerCounter
+import kmerCounts
+import metadataIndex
+import profiling
+
+# fillDf prints its progress once every PROGRESS_EVERY genomes (and after the last one) instead of once per genome
+PROGRESS_EVERY = 1000
+
 
 # this function parses any parameters passed in through the command line or sets them to a default value
 # parameters:
 #    args: the list of arguments passed in through the command line
-# returns: genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name
+# returns: genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, incremental, counter, multi_fasta, cache_dir, cache_max_size
 def parseParams(args, start_dir):
     # setting default values for parameters:
     genomes_dir = start_dir + "/" # (-g) the directory with genomes as .fasta files and KMC executibles
     kmc_out_dir = genomes_dir + "kmc_output/" # (-k) the directory to which to store the output files of KMC with k-mer counts
     kmr_size = 10 # (-s) the size k-mer to run KMC with
-    df_name = "kmr_df.csv" # (-d) the name to store the k-mer DataFrame created by this script as
-    dictionary_name = "kmr_dictionary.pkl" # (-i) the name to store the dictionary (k-mer : column number) created by the script as
+    df_name = "kmr_df" # (-d) the name of the feature store (directory) to store the sparse k-mer matrix created by this script as
+    dictionary_name = "kmr_vocabulary.npy" # (-i) the name to store the vocabulary (array of encoded k-mers, k-mer : column number) created by the script as
+    incremental = False # (-inc) only add the genomes that are not in the existing k-mer matrix yet
+    multi_fasta = None # (-mf) a multi-FASTA file whose records are the genomes, instead of the .fasta files in genomes_dir
+    counter = "kmc" # (-cn) where the k-mer counts come from: "kmc" (the KMC outputs in kmc_out_dir) or "python" (counted in-process from the .fasta files)
+    cache_dir = None # (-cd) the directory of the k-mer count cache (see kmerCache.py), used with counter "python"
+    cache_max_size = kmerCache.DEFAULT_MAX_SIZE # (-cm) the maximal size of the k-mer count cache in MB
 
     # required parameter:
     csv_path = "" # (-c) required, the path to the .csv file containg the genome_id and instrument for all files in genomes_dir
@@ -24,6 +41,8 @@ def parseParams(args, start_dir):
         if(args[i] == "-h" or args[i] == "--help"):
             print(helpOption())
             sys.exit()
+        if (args[i] == "-inc" or args[i] == "--incremental"):
+            incremental = True
         if (i == len(args) - 1):
             break
         elif (args[i] == "-g" or args[i] == "--genomes_dir"):
@@ -42,290 +61,399 @@ def parseParams(args, start_dir):
             df_name = args[i + 1]
         elif (args[i] == "-i" or args[i] == "--dictionary_name"):
             dictionary_name = args[i + 1]
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+        elif (args[i] == "-mf" or args[i] == "--multi_fasta"):
+            multi_fasta = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cd" or args[i] == "--cache_dir"):
+            cache_dir = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cm" or args[i] == "--cache_max_size"):
+            cache_max_size = float(args[i + 1])
 
 
     # exitting the script if the required parameter (csv_path) was not passed in
     if (csv_path == ""):
         print("Error: csv_path (-c) (required parameter) not entered")
         sys.exit()
+    if (counter not in ["kmc", "python"]):
+        print("Error: unknown counter (-cn)", counter, "(must be kmc or python)")
+        sys.exit()
 
-    return genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name
+    return genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, incremental, counter, multi_fasta, cache_dir, cache_max_size
 
 
 
 # returns a string of all the options for the script if the script was called with -h or --help
 def helpOption():
-    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, the KMC executable package, and the kmc.sh script. The default is './'"
+    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, and the KMC executable package. The default is './'"
     s+= "\n-k --kmc_out_dir:\tthe directory for storing the output files created by KMC. The default is ~/genomes_dir/kmc_out_dir"
     s+= "\n-s --kmr_size:\tthe size of the k-mer to run KMC with. The default is 10"
     s+= "\n-c --csv_path:\tthe path to the metadata .csv file with the genome_id, testing instrument, and Ct value of all genomes. There is no default for this option."
-    s+= "\n-d --df_name:\tthe name that the k-mer DataFrame created by the script will be stored as (must be a .csv file). The default is  'kmr_df.csv'"
-    s+= "\n-i --dictionary_name:\tthe name that the dictionary { k-mer : column number } used to create the DataFrame will be stored as (must be a .pkl file). The default is 'kmr_dictionary.pkl'"
+    s+= "\n-d --df_name:\tthe name of the feature store directory that the sparse k-mer matrix created by the script will be stored as. The default is  'kmr_df'"
+    s+= "\n-i --dictionary_name:\tthe name that the vocabulary (sorted array of 2-bit encoded k-mers, k-mer : column number) used to create the k-mer matrix will be stored as (must be a .npy file). The default is 'kmr_vocabulary.npy'"
+    s+= "\n-inc --incremental:\tonly add the genomes that were added or changed since the k-mer matrix was last built, extending the existing matrix and vocabulary. The default is to rebuild both"
+    s+= "\n-cn --counter:\twhere the k-mer counts come from: 'kmc' (the KMC outputs in kmc_out_dir, see runKMC.py) or 'python' (counted in-process from the .fasta files in genomes_dir by kmerCounter.py, without running KMC). The default is 'kmc'"
+    s+= "\n-mf --multi_fasta:\ta multi-FASTA file (optionally gzip or bgzip compressed) whose records are the genomes, instead of the .fasta files in genomes_dir. Every record is one genome named by the first word of its header. There is no default for this option."
+    s+= "\n-cd --cache_dir:\twith counter 'python', the directory of the k-mer count cache shared with runKMC.py and predictCt.py (see kmerCache.py). A genome whose counts for the k-mer size are in the cache is not counted again. The default is no cache"
+    s+= "\n-cm --cache_max_size:\tthe maximal size of the k-mer count cache in MB, the least recently used genomes are removed after the run. The default is " + str(kmerCache.DEFAULT_MAX_SIZE)
+    s+= "\n" + profiling.helpOption()
     return s
 
 
-# concatenates all .fasta files in a directory into one file (to be used in runKMCConcat)
+# lists the KMC output (.kmrs) files of the genomes in kmc_out_dir
 # parameters:
-#    dir: the directory in which to concatenate all .fasta all_files
-# returns: 'concat_file', the name of the concattenated file
-def concatFiles(dir, start_dir):
-    os.chdir(dir)
-    os.system("touch concat_file")
-
-    # iterates through all .fasta files in the directory to add them all to the concat_file
-    for filename in os.scandir(dir):
-        if (filename.path.endswith(".fasta")):
-            with open(filename) as f:
-                file_contents = (f.read() + '\n')
-            f.close()
-            # writing the contents of the current .fasta file to the concat_file
-            with open ('concat_file', 'a') as f:
-                f.write(file_contents)
-            f.close()
-    os.chdir(start_dir)
-    return 'concat_file'
-
-
-
-# runs KMC on the concattenated file with all the genomes
-# this generates a list of all unique k-mers across all genomes
-# parameters:
-#    kmr_size: the size of the k-mer with which to run KMC
-#    genomes_dir: the directory containing concat_file
-#    concat_file_name: the name of the concattenated file with which to run KMC
-# returns: the name of the file outputted by KMC containing all unique k-mers and their frequencies
-def runKMCConcat(kmr_size, genomes_dir, concat_file_name, start_dir):
-    os.chdir(genomes_dir)
-    cmd = 'kmc.sh' + ' ' + str(kmr_size) + ' ' +  concat_file_name + ' concat_KMC ' + genomes_dir
-    os.system(cmd)
-
-    # Deleting the extra files produced by KMC
-    os.system("rm concat_KMC.kmc_pre")
-    os.system("rm concat_KMC.kmc_suf")
-    os.chdir(start_dir)
-
-    #returning the name of the file containing all unique k-mers across all genomes in geomes_dir
-    return "concat_KMC." + str(kmr_size) + ".kmrs"
-
+#    kmc_out_dir: the directory containing the outputs of KMC
+#    kmr_size: the size of k-mers used
+#    only_genomes: optional, the set of genome_ids whose files to list
+# returns: a list of (genome_id, path) for every KMC output file
+def listKmrsFiles(kmc_out_dir, kmr_size, only_genomes=None):
+    kmrs_files = []
+    for filename in os.scandir(kmc_out_dir):
+        genome_id = kmerCounts.kmrsGenomeId(filename.name, kmr_size)
+        if (genome_id is not None and (only_genomes is None or genome_id in only_genomes)):
+            kmrs_files.append((genome_id, filename.path))
+    return kmrs_files
 
 
-# creates a dictionary of k-mer : column number to be used when filling in the DataFrame
+# lists the files the k-mer counts of the genomes are read from
 # parameters:
-#    kmr_size: the size of the k-mers used when running KMC
-#    genomes_dir: the directory in which all_kmrs_file is
-#    all_kmrs_file: the output of kmc on the concattenated file, contains all k-mers across all genomes
-# returns: the dictionary of k-mer : column number for all k-mers
-def createDictionary(kmr_size, genomes_dir, all_kmrs_file, start_dir):
-    kmr_dictionary = {}
-
-    # iterrates through all lines all_kmrs_file (each line is a unique k-mer) and adds that k-mer to the dictionary
-    # incriments col_num which keeps track of the column number to which the k-mer will correspond
-    os.chdir(genomes_dir)
-    file = open(all_kmrs_file)
-    col_num = 0
-    for aline in file:
-        values = aline.split() # values: [k-mer, frequency]
-        kmr_dictionary.update({values[0]: col_num}) #dictionary is k_mer : column number
-        col_num+= 1
-    file.close()
-    os.chdir(start_dir)
-
-    return kmr_dictionary
-
-
-# initializes a dataFrame with the correct number of columns and rows and initializes the values to 0
-# creates a column for every k-mer and the instrument, genome_id, and ct value and a row for every genome in the directory
+#    counts_dir: the directory containing the outputs of KMC (counter "kmc") or the .fasta files (counter "python")
+#    kmr_size: the size of k-mers used
+#    counter: "kmc" or "python"
+#    only_genomes: optional, the set of genome_ids whose files to list
+#    multi_fasta: optional, the multi-FASTA file the genomes are read from with counter "python" (instead of counts_dir)
+# returns: a list of (genome_id, path) for every genome (in file order for a multi-FASTA file)
+def listCountFiles(counts_dir, kmr_size, counter, only_genomes=None, multi_fasta=None):
+    if (counter == "kmc"):
+        return listKmrsFiles(counts_dir, kmr_size, only_genomes)
+    genome_files = listGenomes(counts_dir, multi_fasta)
+    return [(genome_id, path) for genome_id, path in zip(genome_files["genome_id"], genome_files["path"])
+            if only_genomes is None or genome_id in only_genomes]
+
+
+# reads the k-mer counts of one genome, from its KMC output or by counting its .fasta file in-process (see kmerCounter.py)
 # parameters:
-#    genomes_dir: the directory containing the genomes that will be added to the df
-#    kmr_dictionary: the dictionary of k-mer : column index used to find the right columns to change the frequency of
-# returns: the DataFrame initialized to 0s and transposed for more efficient access in memory
-def initializeDf(genomes_dir, kmr_dictionary):
-    # number of columns:
-    N = len(kmr_dictionary) + 5 # creating 5 extra columns: 3 for instruments, 1 for genome_id and 1 for ct value
-    # number of rows (number of genomes in the directory):
-    M = 0
-    for filename in os.scandir(genomes_dir):
-        if (filename.path.endswith(".fasta")):
-            M = M + 1
-
-    df = pd.DataFrame(np.zeros((M, N), dtype=int)) # creating the DataFrame and initializing it to 0s
-    # update first row (genome_id) to be strings:
-    df[0] = df[0].astype(str)
-    # transposing the DataFrame for more efficient memory access
-    df = df.transpose()
-
-    return df
-
-
+#    path: the path to the KMC output (counter "kmc") or to the .fasta file (counter "python")
+#    kmr_size: the size of k-mers used
+#    counter: "kmc" or "python"
+#    cache_dir: optional, the directory of the k-mer count cache the counts of the python counter are read from or added to
+# returns: the sorted encoded k-mers and their frequencies
+def readGenomeCodes(path, kmr_size, counter, cache_dir=None):
+    if (counter == "python"):
+        return kmerCache.cachedCounts(cache_dir, path, kmr_size, counter, lambda: kmerCounter.countFastaFile(path, kmr_size))
+    return kmerCounts.readKmrsCodes(path, kmr_size)
 
 
-# reads in the k-mers from the output files of KMC
-# fills in the DataFrame with the frequencies of each k-mer and the Ct value and instrument of each genome
+# reads the k-mer counts of a list of genomes one genome at a time
+# the records of a multi-FASTA file are streamed in file order, so the file is read once and only one record is in memory
 # parameters:
-#    kmr_df: the DataFrame to add the k-mer frequencies to
-#    kmr_dictionary: the dictionary of k-mer : column index used to find the right columns to change the frequency of
-#    csv_path: the path to the file containing information on the genome_id, instrument, and Ct value of every genome
-#    kmc_out_dir: the directory containing the outputs of KMC (the files with k-mer frequency)
+#    count_files: the list of (genome_id, path) of the genomes to read (see listCountFiles)
 #    kmr_size: the size of k-mers used
-# returns: the updated DataFrame with k-mer frequencies, instrument, and Ct value filled in
-def fillDf(kmr_df, kmr_dictionary, csv_path, kmc_out_dir, kmr_size, start_dir):
-    num_rows = len(kmr_df.index) # the number of rows (k-mers + instrument, Ct value, and genome_id)
-    
-    # metadata file:
-    csv_file = pd.read_csv(csv_path)
-
-    index = 0 # index counts the genomes that are being read in
-
-    # iterates through all files in the kmc_out_dir and reads in the k-mers to the initialized DataFrmae
-    os.chdir(kmc_out_dir)
-    for filename in os.scandir(kmc_out_dir):
-        if ((filename.path.endswith(".kmrs")) and (str(filename).startswith("<DirEntry 'concat") == False)): # checking if the file is in the correct format
-            print("  Processing file:   ", filename, " (", index, ")")
-
-            kmc_file = open(filename)
-
-            # Getting the genome_id from the file name:
-            genome_id = str(filename).replace("<DirEntry '", "")
-            genome_id = genome_id.replace(("_kmc." + str(kmr_size) + ".kmrs'>"), "")
-
-            # getting the Instrument and Ct value of the genome:
-            genome_info = getInfo(csv_file, genome_id)
-
-            if (genome_info == None): # the genome_id was not found in the metadata file
-                # deleting the column of the DataFrame corresponding to the genome that was not found
-                kmr_df = kmr_df.drop(kmr_df.columns[[0]], axis=1)
+#    counter: "kmc" or "python"
+#    multi_fasta: optional, the multi-FASTA file the genomes are records of (with counter "python")
+#    cache_dir: optional, the directory of the k-mer count cache (with counter "python")
+# returns: a generator of the sorted encoded k-mers and their frequencies for every genome, in the order of count_files
+def iterGenomeCodes(count_files, kmr_size, counter, multi_fasta=None, cache_dir=None):
+    if (counter == "python" and multi_fasta is not None):
+        records = fastaReader.readFastaRecords(multi_fasta)
+        for genome_id, path in count_files:
+            for record_id, sequence in records:
+                if (record_id == genome_id):
+                    break
             else:
-                kmr_df.at[0, index] = genome_id # adding the genome id to the first row of the current column
-
-                # parsing the k-mer output file to get the frequency of every k-mer in the current genome and updating the DataFrmae:
-                for aline in kmc_file:
-                    values = aline.split() #values[0] = k-mer, values[1] = frequency
-
-                    # dict_encoding is the row that corresponds to the current k-mer from the dictionary
-                    dict_encoding = kmr_dictionary[values[0]] + 1 # adding 1 due to the genome_id in the first row
-                    kmr_df.at[dict_encoding, index] = values[1] # updating the DataFrame with the frequency of the current k-mer
-
-                ins = genome_info[0]
-                ct = genome_info[1]
-                # adding the Ct value of the current genome
-                kmr_df.at[(num_rows - 1), index]  = ct # adding Ct value to the last row
-
-                # adding instrument of the current genome:
-                # getting the correct row of the genome:
-                if (ins == "ALINITY"):
-                    row = num_rows - 4
-                elif (ins == "PANTHER"):
-                    row = num_rows - 3
-                elif (ins == "CEPHEID"):
-                    row = num_rows - 2
-                kmr_df.at[row, index] = 1 # updating the correct instrument row to be 1
-
-            kmc_file.close()
-            index = index + 1
-    os.chdir(start_dir)
+                raise ValueError("record " + genome_id + " not found in " + multi_fasta)
+            yield kmerCache.cachedCounts(cache_dir, sequence, kmr_size, counter, lambda: kmerCounter.countSequences([sequence], kmr_size))
+    else:
+        for genome_id, path in count_files:
+            yield readGenomeCodes(path, kmr_size, counter, cache_dir)
 
-    return kmr_df
 
-
-
-# gets the instrument and ct value of the given genome_id from the csv file
-# gets the Ct value and instrument of the a specific genome
+# creates the vocabulary of all k-mers (the columns of the k-mer matrix) to be used when filling in the k-mer matrix
+# the vocabulary is the union of the k-mers in the KMC output of every genome (see kmerCounts.unionCodes), so the
+#  genomes do not have to be concatenated and counted by KMC a second time
+# the k-mers are encoded as 2-bit integers (see kmerCounts.py), the column number of a k-mer is its position in the vocabulary
 # parameters:
-#    csv_path: the path to the metadata csv file containing the information about the genome
-#    genome_id: the genome id of the genome for which to find the Instrument and Ct value
-# returns: a list of the instrument and Ct value or None if the genome_id was not in the csv file
-def getInfo(csv_file, genome_id):
-    for index, row in csv_file.iterrows():
-        if (row["Genome ID"] == genome_id):
-            instrument =  row["Instrument"]
-            ct = row["Ct-Value"]
-            return [instrument, ct]
-    return None # the genome_id was not found in the metadata file
-
-
-# Transposes the DataFrame and renames the columns
-# parameters: df: the DataFrame to transpose
-# returns: the transposed DataFrame with column titles
-def transposeDf(df):
-    df = df.transpose()
-    num_cols = len(df.columns)
-
-    col_names = ["genome_id"] # creating a list of the column names
-    kmr_index = 0
-    for i in range(1, (num_cols) - 4): # leaving 4 columns at the end: 3 for the instruments and 1 for the Ct value
-        col_names.append(kmr_index)
-        kmr_index = kmr_index + 1
+#    kmr_size: the size of the k-mers used when running KMC
+#    kmc_out_dir: the directory containing the outputs of KMC (or the .fasta files with counter "python")
+#    counter: "kmc" or "python" (see listCountFiles)
+#    multi_fasta: optional, the multi-FASTA file the genomes are read from with counter "python"
+#    cache_dir: optional, the directory of the k-mer count cache (with counter "python")
+# returns: the sorted array of all encoded k-mers
+def createDictionary(kmr_size, kmc_out_dir, counter="kmc", multi_fasta=None, cache_dir=None):
+    count_files = listCountFiles(kmc_out_dir, kmr_size, counter, multi_fasta=multi_fasta)
+    return kmerCounts.unionCodes(codes for codes, freqs in iterGenomeCodes(count_files, kmr_size, counter, multi_fasta, cache_dir))
+
+
+# computes an upper bound of the number of non-zero values of the k-mer matrix, to allocate its buffers once
+# a line of a KMC output has at least kmr_size + 3 characters (the k-mer, a separator, a digit and the end of the line), and
+#  a genome has at most as many distinct k-mers as bases, which a .fasta file has at most as many as bytes; every row also
+#  has at most one value per k-mer of the vocabulary and one instrument column
+# the bound does not hold for compressed .fasta files, which fillDf handles by growing its buffers
+# parameters:
+#    kmrs_files: the list of (genome_id, path) of the genomes (see listCountFiles)
+#    kmr_size: the size of k-mers used
+#    counter: "kmc" (the paths are KMC outputs) or "python" (the paths are .fasta files, or one multi-FASTA file)
+#    num_kmrs: the number of k-mers in the vocabulary
+# returns: the upper bound
+def estimateNnz(kmrs_files, kmr_size, counter, num_kmrs):
+    if (counter == "kmc"):
+        bound = sum(os.path.getsize(path) // (kmr_size + 3) for genome_id, path in kmrs_files)
+    else:
+        # the records of a multi-FASTA file all have its path, together they have at most as many bases as it has bytes
+        bound = sum(os.path.getsize(path) for path in set(path for genome_id, path in kmrs_files))
+    return min(bound, len(kmrs_files) * num_kmrs) + len(kmrs_files)
+
+
+# reads in the k-mers from the output files of KMC and builds a sparse matrix of k-mer frequencies
+# every file is parsed in bulk into NumPy arrays (see kmerCounts.py) instead of line by line
+# every genome found in the metadata file becomes one row of the matrix, every k-mer one column, followed by
+#  3 one-hot encoded instrument columns (alinity, panther, cepheid)
+# the matrix is stored in CSR form (uint32 counts, int32 column indices) so only the non-zero frequencies are kept in memory,
+#  and the genome_ids and Ct values are kept in separate arrays
+# parameters:
+#    vocabulary: the array of encoded k-mers used to find the right columns to change the frequency of
+#    csv_path: the path to the file containing information on the genome_id, instrument, and Ct value of every genome
+#    kmc_out_dir: the directory containing the outputs of KMC (the files with k-mer frequency), or the .fasta files with counter "python"
+#    kmr_size: the size of k-mers used
+#    only_genomes: optional, the set of genome_ids to read in (all genomes in kmc_out_dir are read in by default)
+#    counter: "kmc" or "python" (see listCountFiles)
+#    multi_fasta: optional, the multi-FASTA file the genomes are read from with counter "python"
+#    cache_dir: optional, the directory of the k-mer count cache (with counter "python")
+# returns: the sparse k-mer matrix, an array of the genome_ids (one per row), and an array of the Ct values (one per row)
+def fillDf(vocabulary, csv_path, kmc_out_dir, kmr_size, only_genomes=None, counter="kmc", multi_fasta=None, cache_dir=None):
+    num_kmrs = len(vocabulary)
+    lookup = kmerCounts.vocabularyLookup(vocabulary)
+    num_cols = num_kmrs + len(metadataIndex.INSTRUMENTS) # one column for every k-mer and 3 columns for the instruments
+
+    # joining the genomes with the metadata file (indexed by Genome ID) to get the Instrument and Ct value of every genome at once:
+    kmrs_files = listCountFiles(kmc_out_dir, kmr_size, counter, only_genomes, multi_fasta)
+    metadata = metadataIndex.loadMetadata(csv_path)
+    instruments, cts, in_metadata = metadataIndex.lookupGenomes(metadata, [genome_id for genome_id, path in kmrs_files])
+
+    # the genomes whose genome_id was not found in the metadata file get no row and are not read:
+    kmrs_files = [kmrs_file for kmrs_file, found in zip(kmrs_files, in_metadata) if found]
+    genome_ids = np.array([genome_id for genome_id, path in kmrs_files], dtype=str) # the genome_id of every row
+    ct_values = np.asarray(cts[in_metadata], dtype=np.float64) # the Ct value of every row
+    instruments = instruments[in_metadata]
+
+    # the matrix is assembled in its final CSR layout: the column indices and the values of all rows go into one pair of
+    #  typed buffers, allocated once for an upper bound of the number of non-zero values (see estimateNnz); the pages of
+    #  the buffers beyond the values written are never touched, and the buffers are shrunk in place at the end, so the
+    #  peak memory is about one copy of the matrix
+    capacity = estimateNnz(kmrs_files, kmr_size, counter, num_kmrs)
+    indices = np.empty(capacity, dtype=np.int32)
+    data = np.empty(capacity, dtype=np.uint32)
+    indptr = np.zeros(len(kmrs_files) + 1, dtype=np.int64)
+    nnz = 0
+
+    # iterates through all KMC output files in the kmc_out_dir (or records of the multi-FASTA file) and reads in the k-mers
+    #  of every genome as one sparse row
+    genome_codes = iterGenomeCodes(kmrs_files, kmr_size, counter, multi_fasta, cache_dir)
+    for index, ((genome_id, kmrs_path), ins, (codes, freqs)) in enumerate(zip(kmrs_files, instruments, genome_codes)):
+        # looking up the columns of all k-mers of the genome at once:
+        cols = kmerCounts.columnIds(lookup, codes)
+        found = cols >= 0 # every k-mer is in the vocabulary when it was built from the same KMC outputs
+        cols = cols[found]
+        freqs = freqs[found]
+        # the KMC output is sorted by k-mer, so the columns of a sorted vocabulary are already sorted; the columns of an
+        #  extended vocabulary (see updateDf) are sorted to keep the row in canonical CSR form
+        if (len(cols) > 1 and not (cols[1:] > cols[:-1]).all()):
+            order = np.argsort(cols, kind="stable")
+            cols = cols[order]
+            freqs = freqs[order]
+
+        has_instrument = ins in metadataIndex.INSTRUMENTS
+        row_nnz = len(cols) + has_instrument
+        if (nnz + row_nnz > capacity):
+            # the bound was too low (e.g. for compressed .fasta files), the buffers grow in place
+            capacity = max(2 * capacity, nnz + row_nnz)
+            indices.resize(capacity, refcheck=False)
+            data.resize(capacity, refcheck=False)
+        indices[nnz:nnz + len(cols)] = cols
+        data[nnz:nnz + len(cols)] = freqs
+        nnz += len(cols)
+
+        # adding the instrument of the current genome as a 1 in the matching instrument column (the last columns):
+        if (has_instrument):
+            indices[nnz] = num_kmrs + metadataIndex.INSTRUMENTS.index(ins)
+            data[nnz] = 1
+            nnz += 1
+        indptr[index + 1] = nnz
+        profiling.count("genomes_read")
+        if ((index + 1) % PROGRESS_EVERY == 0 or index + 1 == len(kmrs_files)):
+            print("  Processed", index + 1, "of", len(kmrs_files), "genomes")
+
+    indices.resize(nnz, refcheck=False)
+    data.resize(nnz, refcheck=False)
+    kmr_matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(kmrs_files), num_cols))
+
+    return kmr_matrix, genome_ids, ct_values
+
+
+
+# stores the sparse k-mer matrix along with the genome_ids and Ct values of its rows as a binary feature store (see featureStore.py)
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix to be stored
+#    genome_ids: the genome_id of every row of kmr_matrix
+#    ct_values: the Ct value of every row of kmr_matrix
+#    vocabulary: the array of encoded k-mers used to build kmr_matrix
+#    kmr_size: the size of k-mers used
+#    df_dir: the directory in which to store the feature store
+#    df_name: the name of the feature store directory
+#    genome_files: the manifest of the genome files (see listGenomes), the entries of the genomes in the matrix are stored with it
+def storeDataFrame(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, df_dir, df_name, genome_files):
+    store_dir = os.path.join(df_dir, df_name)
+    manifest = genome_files[genome_files["genome_id"].isin(genome_ids)]
+    featureStore.writeFeatureStore(store_dir, kmr_matrix, genome_ids, ct_values, kmr_size, featureStore.vocabularyHash(vocabulary), manifest)
+
+
+# lists the .fasta files in the genome directory with the size and modification time used to detect new and changed genomes
+# for a multi-FASTA file, every record is listed with the path of the file, the length of its sequence as its size, and
+#  the hash of its sequence (see kmerCache.sequencesHash) instead of a modification time, so records appended to the file (or
+#  changed in it) are new or changed, but the records that are still the same are not
+# parameters:
+#    genomes_dir: the directory containing the genomes as .fasta files
+#    multi_fasta: optional, a multi-FASTA file whose records are listed instead of the files in genomes_dir
+# returns: a DataFrame (the manifest) with the genome_id, path, size, mtime_ns and sequence_hash of every genome file
+#  (mtime_ns is 0 for the records of a multi-FASTA file, and sequence_hash is empty for .fasta files)
+def listGenomes(genomes_dir, multi_fasta=None):
+    rows = []
+    if (multi_fasta is not None):
+        for record_id, sequence in fastaReader.readFastaRecords(multi_fasta):
+            rows.append([record_id, multi_fasta, len(sequence), 0, kmerCache.sequencesHash([sequence])])
+    else:
+        for filename in os.scandir(genomes_dir):
+            genome_id = fastaReader.fastaGenomeId(filename.name)
+            if (genome_id is not None):
+                stat = filename.stat()
+                rows.append([genome_id, os.path.abspath(filename.path), stat.st_size, stat.st_mtime_ns, ""])
+    return pd.DataFrame(rows, columns=["genome_id", "path", "size", "mtime_ns", "sequence_hash"])
+
+
+# compares the genome files with the manifest of an existing k-mer matrix
+# a genome is known if its size, modification time and sequence hash are the same as in the manifest (a manifest written
+#  before sequence hashes were listed has none, so the records of a multi-FASTA file are read in again once)
+# parameters:
+#    genome_files: the manifest of the current genome files (see listGenomes)
+#    manifest: the manifest stored with the existing k-mer matrix
+# returns: the set of genome_ids that are new or changed (to be read in) and the set of changed genome_ids (whose old rows are dropped)
+def findNewGenomes(genome_files, manifest):
+    if ("sequence_hash" not in manifest.columns):
+        manifest = manifest.assign(sequence_hash="")
+    manifest = manifest.fillna({"sequence_hash": ""})
+    known = manifest.merge(genome_files, on=["genome_id", "size", "mtime_ns", "sequence_hash"], how="inner")["genome_id"]
+    new_genomes = set(genome_files["genome_id"]) - set(known)
+    changed_genomes = new_genomes & set(manifest["genome_id"])
+    return new_genomes, changed_genomes
+
+
+# widens an existing k-mer matrix after num_added k-mers were appended to the vocabulary
+# the k-mer columns keep their numbers, only the instrument columns (the last 3) move to the end again
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix built with the old vocabulary
+#    num_added: the number of k-mers appended to the vocabulary
+# returns: the widened k-mer matrix (CSR)
+def widenMatrix(kmr_matrix, num_added):
+    num_kmrs = kmr_matrix.shape[1] - len(metadataIndex.INSTRUMENTS)
+    indices = np.array(kmr_matrix.indices, dtype=np.int32)
+    indices[indices >= num_kmrs] += num_added
+    return sparse.csr_matrix((np.asarray(kmr_matrix.data), indices, np.asarray(kmr_matrix.indptr)),
+                             shape=(kmr_matrix.shape[0], kmr_matrix.shape[1] + num_added))
+
+
+# adds the new and changed genomes to an existing k-mer matrix (incremental build)
+# only the KMC outputs of the new genomes are read, new k-mers are appended to the vocabulary
+# parameters:
+#    vocabulary: the array of encoded k-mers the existing matrix was built with
+#    store_dir: the directory of the existing feature store
+#    genome_files: the manifest of the current genome files (see listGenomes)
+#    csv_path: the path to the metadata file
+#    kmc_out_dir: the directory containing the outputs of KMC (or the .fasta files with counter "python")
+#    kmr_size: the size of k-mers used
+#    counter: "kmc" or "python" (see listCountFiles)
+#    multi_fasta: optional, the multi-FASTA file the genomes are read from with counter "python"
+#    cache_dir: optional, the directory of the k-mer count cache (with counter "python")
+# returns: the updated k-mer matrix, genome_ids, Ct values and vocabulary
+def updateDf(vocabulary, store_dir, genome_files, csv_path, kmc_out_dir, kmr_size, counter="kmc", multi_fasta=None, cache_dir=None):
+    old_matrix, old_ids, old_cts, header = featureStore.loadFeatureStore(store_dir)
+    if (header["kmr_size"] != kmr_size or header["vocabulary_hash"] != featureStore.vocabularyHash(vocabulary)):
+        print("Error: the k-mer size or vocabulary does not match the existing k-mer matrix, rebuild it without -inc")
+        sys.exit()
+    manifest = featureStore.readManifest(store_dir)
+    if (manifest is None):
+        manifest = genome_files.iloc[0:0]
+    new_genomes, changed_genomes = findNewGenomes(genome_files, manifest)
+    print("--createDataFrame.py--", len(new_genomes), "new or changed genomes")
 
-    # Appending the instruments and the Ct value
-    col_names.append("alinity")
-    col_names.append("panther")
-    col_names.append("cepheid")
-    col_names.append("ct_value")
+    # appending the k-mers of the new genomes that are not in the vocabulary yet:
+    new_files = listCountFiles(kmc_out_dir, kmr_size, counter, new_genomes, multi_fasta)
+    new_codes = kmerCounts.unionCodes(codes for codes, freqs in iterGenomeCodes(new_files, kmr_size, counter, multi_fasta, cache_dir))
+    vocabulary, num_added = kmerCounts.extendVocabulary(vocabulary, new_codes)
+    print("--createDataFrame.py-- added", num_added, "k-mers to the vocabulary")
 
-    # updating the columns of the DataFrame:
-    df.columns = col_names
+    # reading in the new genomes and stacking them under the (widened) old rows, without the rows of changed genomes:
+    new_matrix, new_ids, new_cts = fillDf(vocabulary, csv_path, kmc_out_dir, kmr_size, only_genomes=new_genomes, counter=counter, multi_fasta=multi_fasta, cache_dir=cache_dir)
+    keep = ~np.isin(old_ids, list(changed_genomes))
+    kmr_matrix = sparse.vstack([widenMatrix(old_matrix[keep], num_added), new_matrix], format="csr")
+    genome_ids = np.concatenate([np.asarray(old_ids)[keep], new_ids])
+    ct_values = np.concatenate([np.asarray(old_cts)[keep], new_cts])
 
-    return df
+    return kmr_matrix, genome_ids, ct_values, vocabulary
 
 
 
-# stores the DataFrame as a csv file
-# parameters:
-#    df: the DataFrame to be stpred
-#    df_dir: the directory in which to store the DataFrame
-#    df_name: the name to store the DataFrame as
-def storeDataFrame(df, df_dir, df_name, start_dir):
-    os.chdir(df_dir)
-    df.to_csv(df_name)
-    os.chdir(start_dir)
 
+# stores the sparse matrix as a binary feature store and the vocabulary as a .npy file in start_dir
+def storeResults(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, start_dir, df_name, dictionary_name, genome_files):
+    storeDataFrame(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, start_dir, df_name, genome_files)
+    kmerCounts.storeVocabulary(vocabulary, os.path.join(start_dir, dictionary_name))
+    print("--createDataFrame.py-- stored k-mer matrix as '", df_name, "' and vocabulary as '", dictionary_name, "'  in  ", start_dir)
 
 
 
 # main function
-# creates and stores a DataFrame with columns of every k-mer across all genomes, the instrument (one-hot encoded),
-#  the Ct value (label), and the genome_id
-# every genome is one row in the DataFrame
+# creates and stores a sparse matrix with columns of every k-mer across all genomes and the instrument (one-hot encoded),
+#  along with the Ct value (label) and the genome_id of every row
+# every genome is one row in the matrix
 def main(argv):
     # current working directory:
     start_dir = os.getcwd()
 
     args = sys.argv
+    profiling.enableFromArgs(args, "createDataFrame.py")
     # reads in parameters passed in by user through the command line or setting paramters to default values
-    genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name = parseParams(args, start_dir)
-
-    # concatenates all genomes in the directory into one file
-    concat_file_name = concatFiles(genomes_dir, start_dir)
-    print("--createDataFrame.py-- concattenated genome files")
-
-    # runs KMC on the concattenated file to generate a list of all k-mers across all genomes
-    all_kmrs_file = runKMCConcat(kmr_size, genomes_dir, concat_file_name, start_dir)
-    print("--createDataFrame.py-- ran KMC on the concattenated file")
-
-    # creates a dictionary of k-mer : column number to be used when creating the DataFrame
-    kmr_dict = createDictionary(kmr_size, genomes_dir, all_kmrs_file, start_dir)
-    print("--createDataFrame.py-- created dictionary of k-mer : column number")
-
-    # initializes the columns of the DataFrame to include every k-mer (using kmr_dict)
-    init_df = initializeDf(genomes_dir, kmr_dict)
-    print("--createDataFrame.py-- initialized DataFrame")
-
-    # reads in the output files of KMC and adds a row to the DataFrame for every genome with the frequency of every k-mer (column)
-    kmr_df = fillDf(init_df, kmr_dict, csv_path, kmc_out_dir, kmr_size, start_dir)
-    print("--createDataFrame.py-- filled in DataFrame with the frequency of every k-mer and the instrument and Ct value")
-
-    # transposes the DataFrame and adds column titles
-    kmr_df = transposeDf(kmr_df)
-    print("--createDataFrame.py-- transposed the DataFrame and added column titles")
-
-    # stores the DataFrame as a .csv file
-    storeDataFrame(kmr_df, start_dir, df_name, start_dir)
-
-    # stores the dictionary as a .pkl file
-    os.chdir(start_dir)
-    pickle.dump(kmr_dict, open(dictionary_name, "wb"))
-    print("--createDataFrame.py-- stored DataFrame as '", df_name, "' and dictionary as '", dictionary_name, "'  in  ", start_dir)
-
+    genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, incremental, counter, multi_fasta, cache_dir, cache_max_size = parseParams(args, start_dir)
+    genome_files = listGenomes(genomes_dir, multi_fasta)
+    # with the python counter, the k-mers are counted from the .fasta files instead of being read from the KMC outputs
+    counts_dir = genomes_dir if counter == "python" else kmc_out_dir
+
+    store_dir = os.path.join(start_dir, df_name)
+    if (incremental and os.path.exists(store_dir)):
+        # adds only the new genomes to the existing k-mer matrix and vocabulary
+        vocabulary = kmerCounts.loadVocabulary(os.path.join(start_dir, dictionary_name), kmr_size)
+        with profiling.stage("updateDf"):
+            kmr_matrix, genome_ids, ct_values, vocabulary = updateDf(vocabulary, store_dir, genome_files, csv_path, counts_dir, kmr_size, counter, multi_fasta, cache_dir)
+        print("--createDataFrame.py-- added the new genomes to the sparse matrix")
+        with profiling.stage("store"):
+            storeResults(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, start_dir, df_name, dictionary_name, genome_files)
+        if (cache_dir is not None):
+            kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
+        return
+
+    # creates the vocabulary of encoded k-mers (k-mer : column number) from the union of the k-mers of all genomes
+    with profiling.stage("createDictionary"):
+        vocabulary = createDictionary(kmr_size, counts_dir, counter, multi_fasta, cache_dir)
+    print("--createDataFrame.py-- created vocabulary of k-mer : column number from the KMC outputs of all genomes")
+
+    # reads in the output files of KMC and builds a sparse matrix with a row for every genome with the frequency of every k-mer (column)
+    with profiling.stage("fillDf"):
+        kmr_matrix, genome_ids, ct_values = fillDf(vocabulary, csv_path, counts_dir, kmr_size, counter=counter, multi_fasta=multi_fasta, cache_dir=cache_dir)
+    print("--createDataFrame.py-- filled in sparse matrix with the frequency of every k-mer and the instrument and Ct value")
+
+    with profiling.stage("store"):
+        storeResults(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, start_dir, df_name, dictionary_name, genome_files)
+    if (cache_dir is not None):
+        kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
 
 
 # if this is the script called by python, run main function
@@ -2,7 +2,7 @@
 # runs the Ct value prediction script pipeline
 
 # sets the arguments to the appropriate variables
-while getopts g:k:s:c:d:i:m:f:e:r:p:u:n: flag
+while getopts g:k:s:c:d:i:m:f:e:r:p:u:n:j:x:a:l:y: flag
 do
     case "${flag}" in
         g) genomes_dir=${OPTARG};;
@@ -18,6 +18,11 @@ do
         p) tree_depth=${OPTARG};;
         u) row_sub=${OPTARG};;
         n) genome_name=${OPTARG};;
+        j) jobs=${OPTARG};;
+        x) counter=${OPTARG};;
+        a) rank=${OPTARG};;
+        l) num_features=${OPTARG};;
+        y) cache_dir=${OPTARG};;
     esac
 done
 
@@ -30,7 +35,9 @@ then
     echo "$space[-c csv_path - required] [-d df_name] [-i dictionary_name]"
     echo "$space[-m model_name] [-f output_file_name] [-e test_size]"
     echo "$space[-r num_trees] [-p tree_depth] [-u row_subsampling]"
-    echo "$space[-n genome_name - required]"
+    echo "$space[-n genome_name - required] [-j jobs]"
+    echo "$space[-x counter (kmc or python)] [-y cache_dir]"
+    echo "$space[-a rank (none, correlation or importance)] [-l num_features]"
     echo " "
     echo "one or more required arguments missing: "
     echo "    -c: csv_path"
@@ -54,14 +61,19 @@ c3="$base"
 c3+="trainModel.py"
 c4="$base"
 c4+="predictCt.py"
+c5="$base"
+c5+="selectFeatures.py"
 
 
 if ! [ -z "$genomes_dir" ]; then c1+=" -g $genomes_dir"; c2+=" -g $genomes_dir"; c4+=" -g $genomes_dir"; fi
 if ! [ -z "$kmc_out_dir" ]; then c1+=" -k $kmc_out_dir"; c2+=" -k $kmc_out_dir"; c4+=" -k $kmc_out_dir"; fi
 if ! [ -z "$kmr_size" ]; then c1+=" -s $kmr_size"; c4+=" -s $kmr_size"; fi
+if ! [ -z "$jobs" ]; then c1+=" -j $jobs"; c3+=" -j $jobs"; fi
+if ! [ -z "$counter" ]; then c1+=" -cn $counter"; c2+=" -cn $counter"; c4+=" -cn $counter"; fi
+if ! [ -z "$cache_dir" ]; then c1+=" -cd $cache_dir"; c2+=" -cd $cache_dir"; c4+=" -cd $cache_dir"; fi
 c2+=" -c $csv_path"; c4+=" -c $csv_path"
-if ! [ -z "$df_name" ]; then c2+=" -d $df_name"; c3+=" -d $df_name"; fi
-if ! [ -z "$dictionary_name" ]; then c2+=" -i $dictionary_name"; c3+=" -i $dictionary_name"; c4+=" -i $dictionary_name"; fi
+if ! [ -z "$df_name" ]; then c2+=" -d $df_name"; c3+=" -d $df_name"; c5+=" -d $df_name"; fi
+if ! [ -z "$dictionary_name" ]; then c2+=" -i $dictionary_name"; c3+=" -i $dictionary_name"; c4+=" -i $dictionary_name"; c5+=" -i $dictionary_name"; fi
 if ! [ -z "$model_name" ]; then c3+=" -m $model_name"; c4+=" -m $model_name"; fi
 if ! [ -z "$output_file_name" ]; then c3+=" -f $output_file_name"; fi
 if ! [ -z "$test_size" ]; then c3+=" -ts $test_size"; fi
@@ -70,12 +82,24 @@ if ! [ -z "$tree_depth" ]; then c3+=" -td $tree_depth"; fi
 if ! [ -z "$row_sub" ]; then c3+=" -rs $row_sub"; fi
 c4+=" -n $genome_name"
 
+# with -a or -l the k-mers are selected by selectFeatures.py before training, and the model is trained and used on the selected k-mers
+select=""
+if ! [ -z "$rank" ] || ! [ -z "$num_features" ]
+then
+    select="yes"
+    if ! [ -z "$rank" ]; then c5+=" -r $rank"; fi
+    if ! [ -z "$num_features" ]; then c5+=" -n $num_features"; fi
+    if ! [ -z "$test_size" ]; then c5+=" -ts $test_size"; fi
+    c3+=" -d kmr_df_selected"; c4+=" -i kmr_vocabulary_selected.npy"
+fi
+
 
 # running the scripts:
 echo "$c1"
 $c1
 echo "$c2"
 $c2
+if ! [ -z "$select" ]; then echo "$c5"; $c5; fi
 echo "$c3"
 $c3
 echo "$c4"
@@ -83,7 +107,7 @@ $c4
 
 if [ -z "$output_file_name" ]
 then
-    echo "stored all output as output_file_trainModel"
+    echo "stored all output as output_file_trainModel.json"
 else
     echo "stored all output as $output_file_name"
 fi
@@ -0,0 +1,235 @@
+import sys
+import os
+import json
+import numpy as np
+import pandas as pd
+
+import metadataIndex
+import profiling
+
+# evaluating Ct value predictions: RMSE, R2 and the accuracy within intervals (the fraction of predictions within an interval of
+#  the true Ct value), overall and for every testing instrument, with bootstrapped confidence intervals
+# every metric is computed with NumPy over whole arrays, so evaluating hundreds of thousands of predictions (e.g. out-of-fold
+#  predictions) takes about as long as reading them
+# the results are one JSON report, used by trainModel.py for its test set and by the main function of this script for a file of
+#  predictions written by predictCt.py
+
+# the default intervals (in Ct) to compute the accuracy within
+INTERVALS = [6, 5, 4, 3, 2, 1]
+
+# the maximal number of values (resamples x predictions) drawn at a time while bootstrapping
+BOOTSTRAP_BLOCK = 10000000
+
+
+# computes the accuracy within intervals for one or more sets of predictions at once
+# parameters:
+#    errors: the absolute errors of the predictions, an array of shape (..., number of predictions)
+#    intervals: the intervals
+# returns: the fraction of predictions within every interval, an array of shape (..., number of intervals)
+def accuracyWithinIntervals(errors, intervals):
+    intervals = np.asarray(intervals, dtype=np.float64)
+    return (errors[..., None, :] <= intervals[:, None]).mean(axis=-1)
+
+
+# computes the RMSE, R2 and accuracy within intervals for one or more sets of predictions at once
+# parameters:
+#    predictions: the predictions, an array of shape (..., number of predictions)
+#    true_values: the true values, with the same shape as predictions
+#    intervals: the intervals
+# returns: the RMSE and R2 (arrays of shape (...)) and the accuracy within every interval (shape (..., number of intervals))
+def computeMetrics(predictions, true_values, intervals):
+    residuals = true_values - predictions
+    rmse = np.sqrt((residuals ** 2).mean(axis=-1))
+    total = ((true_values - true_values.mean(axis=-1, keepdims=True)) ** 2).sum(axis=-1)
+    # R2 is not defined if all true values are the same
+    r2 = np.divide(total - (residuals ** 2).sum(axis=-1), total, out=np.full(np.shape(total), np.nan), where=total > 0)
+    return rmse, r2, accuracyWithinIntervals(np.abs(residuals), intervals)
+
+
+# computes bootstrapped confidence intervals of the metrics by resampling the predictions with replacement
+# the resamples are drawn and evaluated in blocks of up to BOOTSTRAP_BLOCK values
+# parameters:
+#    predictions, true_values: 1D arrays of the predictions and true values
+#    intervals: the intervals
+#    num_resamples: the number of bootstrap resamples
+#    confidence: the confidence level of the intervals (e.g. 0.95)
+#    seed: the seed of the random resampling
+# returns: a dictionary of metric : [lower bound, upper bound]
+def bootstrapMetrics(predictions, true_values, intervals, num_resamples, confidence, seed=42):
+    rng = np.random.default_rng(seed)
+    num_predictions = len(predictions)
+    block = max(1, BOOTSTRAP_BLOCK // max(1, num_predictions))
+    rmses, r2s, accuracies = [], [], []
+    for start in range(0, num_resamples, block):
+        samples = rng.integers(0, num_predictions, size=(min(block, num_resamples - start), num_predictions))
+        rmse, r2, accuracy = computeMetrics(predictions[samples], true_values[samples], intervals)
+        rmses.append(rmse)
+        r2s.append(r2)
+        accuracies.append(accuracy)
+
+    quantiles = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+    bounds = {"rmse": np.quantile(np.concatenate(rmses), quantiles).tolist()}
+    r2s = np.concatenate(r2s)
+    r2s = r2s[~np.isnan(r2s)]
+    bounds["r2"] = np.quantile(r2s, quantiles).tolist() if len(r2s) > 0 else None
+    accuracies = np.concatenate(accuracies)
+    for i, interval in enumerate(intervals):
+        bounds["within_" + str(interval)] = np.quantile(accuracies[:, i], quantiles).tolist()
+    return bounds
+
+
+# evaluates one set of predictions
+# parameters:
+#    predictions, true_values: 1D arrays of the predictions and true values
+#    intervals: the intervals
+#    num_resamples: the number of bootstrap resamples (0 for no confidence intervals)
+#    confidence: the confidence level of the intervals
+# returns: a dictionary with the number of predictions, the RMSE, the R2, the accuracy within every interval and (with
+#          num_resamples > 0) their confidence intervals
+def evaluateGroup(predictions, true_values, intervals, num_resamples, confidence):
+    result = {"num_predictions": int(len(predictions))}
+    if (len(predictions) == 0):
+        return result
+    rmse, r2, accuracy = computeMetrics(predictions, true_values, intervals)
+    result["rmse"] = float(rmse)
+    result["r2"] = None if np.isnan(r2) else float(r2)
+    result["accuracy_within"] = {str(interval): float(a) for interval, a in zip(intervals, accuracy)}
+    if (num_resamples > 0):
+        result["confidence_intervals"] = bootstrapMetrics(predictions, true_values, intervals, num_resamples, confidence)
+    return result
+
+
+# evaluates predictions overall and for every testing instrument
+# parameters:
+#    predictions, true_values: the predictions and true values
+#    instruments: the testing instrument of every prediction (None for unknown instruments)
+#    intervals: the intervals (INTERVALS by default)
+#    num_resamples: the number of bootstrap resamples (0 for no confidence intervals)
+#    confidence: the confidence level of the intervals
+# returns: the report as a dictionary: {"intervals", "confidence", "num_resamples", "overall", "instruments": {instrument: ...}}
+def evaluationReport(predictions, true_values, instruments, intervals=INTERVALS, num_resamples=1000, confidence=0.95):
+    predictions = np.asarray(predictions, dtype=np.float64)
+    true_values = np.asarray(true_values, dtype=np.float64)
+    instruments = np.asarray([instrument if isinstance(instrument, str) else "UNKNOWN" for instrument in instruments], dtype=object)
+    report = {
+        "intervals": list(intervals),
+        "confidence": confidence,
+        "num_resamples": num_resamples,
+        "overall": evaluateGroup(predictions, true_values, intervals, num_resamples, confidence),
+        "instruments": {},
+    }
+    for instrument in metadataIndex.INSTRUMENTS + sorted(set(instruments) - set(metadataIndex.INSTRUMENTS)):
+        in_group = instruments == instrument
+        if (in_group.any()):
+            report["instruments"][instrument] = evaluateGroup(predictions[in_group], true_values[in_group], intervals, num_resamples, confidence)
+    return report
+
+
+# reads the testing instrument of every row of a k-mer matrix from its one-hot encoded instrument columns (the last columns)
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix
+# returns: an array of the instrument of every row (None for rows without an instrument)
+def rowInstruments(kmr_matrix):
+    num_instruments = len(metadataIndex.INSTRUMENTS)
+    one_hot = kmr_matrix[:, kmr_matrix.shape[1] - num_instruments:].toarray()
+    names = np.asarray(metadataIndex.INSTRUMENTS + [None], dtype=object)
+    return names[np.where(one_hot.any(axis=1), one_hot.argmax(axis=1), num_instruments)]
+
+
+# writes a report as a JSON file
+# parameters:
+#    report: the report returned by evaluationReport
+#    output_file_path: the path of the file to write
+def writeReport(report, output_file_path):
+    with open(output_file_path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: predictions_path, csv_path, output_file_name, intervals, num_resamples, confidence
+def parseParams(args):
+    # setting default values for parameters:
+    output_file_name = "evaluation_report.json" # (-o) the name of the JSON report
+    intervals = INTERVALS # (-iv) the intervals to compute the accuracy within
+    num_resamples = 1000 # (-bs) the number of bootstrap resamples
+    confidence = 0.95 # (-ci) the confidence level of the bootstrapped confidence intervals
+
+    # required parameters:
+    predictions_path = "" # (-p) the predictions (.csv or .jsonl) written by predictCt.py
+    csv_path = "" # (-c) the metadata .csv file with the true Ct values
+
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-p" or args[i] == "--predictions"):
+            predictions_path = args[i + 1]
+        elif (args[i] == "-c" or args[i] == "--csv_path"):
+            csv_path = args[i + 1]
+        elif (args[i] == "-o" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-iv" or args[i] == "--intervals"):
+            intervals = parseIntervals(args[i + 1])
+        elif (args[i] == "-bs" or args[i] == "--bootstrap"):
+            num_resamples = int(args[i + 1])
+        elif (args[i] == "-ci" or args[i] == "--confidence"):
+            confidence = float(args[i + 1])
+
+    if (predictions_path == "" or csv_path == ""):
+        print("Error: predictions (-p) and csv_path (-c) (required parameters) not entered")
+        sys.exit()
+
+    return predictions_path, csv_path, output_file_name, intervals, num_resamples, confidence
+
+
+# parses a comma-separated list of intervals (e.g. "6,5,4,3,2,1" or "2.5,1")
+def parseIntervals(value):
+    return [float(interval) if "." in interval else int(interval) for interval in value.split(",")]
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-p --predictions:\tthe predictions (.csv or .jsonl) written by predictCt.py in batch mode. There is no default for this option."
+    s+= "\n-c --csv_path:\tthe path to the metadata .csv file with the true Ct values of the genomes. There is no default for this option."
+    s+= "\n-o --output_file_name:\tthe name of the JSON report. The default is 'evaluation_report.json'"
+    s+= "\n-iv --intervals:\tthe comma-separated intervals to compute the accuracy within. The default is '6,5,4,3,2,1'"
+    s+= "\n-bs --bootstrap:\tthe number of bootstrap resamples for the confidence intervals, 0 for none. The default is 1000"
+    s+= "\n-ci --confidence:\tthe confidence level of the confidence intervals. The default is 0.95"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# main function
+# evaluates a file of predictions written by predictCt.py against the Ct values in the metadata file
+def main(argv):
+    profiling.enableFromArgs(sys.argv, "evaluation.py")
+    predictions_path, csv_path, output_file_name, intervals, num_resamples, confidence = parseParams(sys.argv)
+
+    with profiling.stage("load"):
+        if (predictions_path.endswith(".jsonl")):
+            predictions = pd.read_json(predictions_path, lines=True, dtype={"genome_id": str})
+        else:
+            predictions = pd.read_csv(predictions_path, dtype={"genome_id": str, "instrument": str})
+        instruments, ct_values, found = metadataIndex.lookupGenomes(metadataIndex.loadMetadataCached(os.path.abspath(csv_path)), predictions["genome_id"])
+
+    # only the genomes that were predicted and have a true Ct value are evaluated
+    predicted = predictions["ct_prediction"].to_numpy(dtype=np.float64)
+    evaluated = found & ~np.isnan(ct_values) & ~np.isnan(predicted)
+    print("--evaluation.py-- evaluating", int(evaluated.sum()), "of", len(predictions), "predictions")
+
+    with profiling.stage("evaluate"):
+        report = evaluationReport(predicted[evaluated], ct_values[evaluated], instruments[evaluated], intervals, num_resamples, confidence)
+    with profiling.stage("store"):
+        writeReport(report, output_file_name)
+    print("--evaluation.py-- RMSE:", report["overall"].get("rmse"), " R2:", report["overall"].get("r2"))
+    print("--evaluation.py-- stored the report as '", output_file_name, "'")
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,91 @@
+import os
+import gzip
+
+# reading genomes from .fasta files one record at a time
+# a .fasta file can hold one genome (named <genome_id>.fasta) or many genomes as records (a multi-FASTA bundle), in which
+#  case every record is one genome keyed by its header: the genome_id is the first word after the ">"
+# files may be plain text or compressed with gzip or bgzip (bgzip files are gzip files made of many members), the
+#  compression is detected from the first bytes of the file
+# only the current record is held in memory, so bundles of any size are read with bounded memory
+
+# the file name endings of genome files, the genome_id of a genome file is its name without the ending
+FASTA_SUFFIXES = [".fasta.gz", ".fasta"]
+
+# the first two bytes of every gzip (and bgzip) file
+GZIP_MAGIC = b"\x1f\x8b"
+
+# the size of the blocks read from a (compressed) file
+READ_SIZE = 1 << 20
+
+
+# returns the genome_id of a genome file from its name
+# parameters:
+#    name: the name (or path) of the file
+# returns: the name without its .fasta or .fasta.gz ending, or None if the file is not a genome file
+def fastaGenomeId(name):
+    name = os.path.basename(name)
+    for suffix in FASTA_SUFFIXES:
+        if (name.endswith(suffix)):
+            return name[:-len(suffix)]
+    return None
+
+
+# opens a .fasta file for reading in binary mode, decompressing it if it is gzip or bgzip compressed
+# parameters:
+#    fasta_path: the path to the .fasta file
+# returns: the opened (buffered) file
+def openFasta(fasta_path):
+    with open(fasta_path, "rb") as f:
+        magic = f.read(2)
+    if (magic == GZIP_MAGIC):
+        return gzip.open(fasta_path, "rb")
+    return open(fasta_path, "rb", buffering=READ_SIZE)
+
+
+# returns the genome_id of a record from its header line (the first word after the ">")
+def recordId(header):
+    words = header[1:].split()
+    return words[0].decode() if len(words) > 0 else ""
+
+
+# splits lines of .fasta text into records
+# parameters:
+#    lines: an iterable of the lines (bytes) of the .fasta text
+# returns: a generator of (record_id, sequence) for every record, the sequence as bytes without line breaks
+def parseFastaRecords(lines):
+    record_id = None
+    sequence = []
+    for line in lines:
+        if (line.startswith(b">")):
+            if (record_id is not None):
+                yield record_id, b"".join(sequence)
+            record_id = recordId(line)
+            sequence = []
+        elif (record_id is not None):
+            sequence.append(line.strip())
+        elif (line.strip() != b""): # sequence lines before the first header belong to a record without a name
+            record_id = ""
+            sequence.append(line.strip())
+    if (record_id is not None):
+        yield record_id, b"".join(sequence)
+
+
+# reads the records of a .fasta file one at a time
+# parameters:
+#    fasta_path: the path to the (optionally gzip or bgzip compressed) .fasta file
+# returns: a generator of (record_id, sequence) for every record
+def readFastaRecords(fasta_path):
+    with openFasta(fasta_path) as f:
+        yield from parseFastaRecords(f)
+
+
+# writes one record as a .fasta file (e.g. to run KMC on one genome of a multi-FASTA bundle)
+# parameters:
+#    fasta_path: the path of the file to write
+#    record_id: the genome_id written to the header
+#    sequence: the sequence (bytes)
+def writeFastaRecord(fasta_path, record_id, sequence):
+    with open(fasta_path, "wb") as f:
+        f.write(b">" + record_id.encode() + b"\n")
+        for i in range(0, len(sequence), 80):
+            f.write(sequence[i:i + 80] + b"\n")
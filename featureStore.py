@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# the on-disk feature store written by createDataFrame.py and read by trainModel.py
+# a feature store is a directory holding:
+#    header.json: the k-mer size, the vocabulary hash, the shape, and the names of the label and instrument columns
+#    csr_data.npy, csr_indices.npy, csr_indptr.npy: the k-mer matrix in CSR form (one row per genome) for reading genomes
+#    csc_data.npy, csc_indices.npy, csc_indptr.npy: the same matrix in CSC form (one column per feature) for reading k-mer columns
+#    genome_ids.npy, ct_values.npy: the genome_id and Ct value of every row
+#    manifest.csv (optional): the genome files that were processed to build the store (used by incremental builds)
+# all arrays are plain .npy files, so they are memory-mapped when the store is opened and only the parts that are used are read
+
+STORE_FORMAT = "ct-kmer-feature-store"
+STORE_VERSION = 1
+HEADER_NAME = "header.json"
+MANIFEST_NAME = "manifest.csv"
+
+# the names of the instrument columns, one-hot encoded in the last columns of the matrix (in this order)
+INSTRUMENT_COLUMNS = ["alinity", "panther", "cepheid"]
+
+
+# computes a hash identifying the k-mer vocabulary (the columns of the matrix, see kmerCounts.py) used to build a matrix
+# a matrix can only be used with a model or vocabulary that has the same vocabulary hash
+# parameters:
+#    vocabulary: the sorted array of encoded k-mers
+# returns: the hex digest of the vocabulary
+def vocabularyHash(vocabulary):
+    return hashlib.sha1(np.ascontiguousarray(vocabulary, dtype="<u8").tobytes()).hexdigest()
+
+
+# picks the smallest index dtype that can address every non-zero value of the matrix
+# int32 is used whenever possible so that SciPy can wrap the memory-mapped arrays without casting (copying) them
+def indexDtype(nnz, shape):
+    if (max(nnz, shape[0], shape[1]) < np.iinfo(np.int32).max):
+        return np.int32
+    return np.int64
+
+
+# writes the k-mer matrix and the genome_ids and Ct values of its rows as a feature store
+# the store is written to a temporary directory first and then swapped in, so an existing store (which may still be
+#  memory-mapped, e.g. during an incremental build) is replaced in one step
+# parameters:
+#    store_dir: the directory to write the feature store to (created if needed)
+#    kmr_matrix: the sparse k-mer matrix (any SciPy sparse format)
+#    genome_ids: the genome_id of every row of kmr_matrix
+#    ct_values: the Ct value of every row of kmr_matrix
+#    kmr_size: the size of the k-mers used to build the matrix
+#    vocabulary_hash: the hash of the vocabulary the matrix was built with (see vocabularyHash)
+#    manifest: optional, a DataFrame describing the genome files the store was built from
+def writeFeatureStore(store_dir, kmr_matrix, genome_ids, ct_values, kmr_size, vocabulary_hash, manifest=None):
+    final_dir = os.path.abspath(store_dir)
+    store_dir = final_dir + ".tmp-" + str(os.getpid())
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.makedirs(store_dir)
+    idx_dtype = indexDtype(kmr_matrix.nnz, kmr_matrix.shape)
+
+    csr = sparse.csr_matrix(kmr_matrix)
+    csr.sort_indices()
+    np.save(os.path.join(store_dir, "csr_data.npy"), csr.data.astype(np.uint32, copy=False))
+    np.save(os.path.join(store_dir, "csr_indices.npy"), csr.indices.astype(idx_dtype, copy=False))
+    np.save(os.path.join(store_dir, "csr_indptr.npy"), csr.indptr.astype(idx_dtype, copy=False))
+
+    csc = csr.tocsc()
+    csc.sort_indices()
+    np.save(os.path.join(store_dir, "csc_data.npy"), csc.data.astype(np.uint32, copy=False))
+    np.save(os.path.join(store_dir, "csc_indices.npy"), csc.indices.astype(idx_dtype, copy=False))
+    np.save(os.path.join(store_dir, "csc_indptr.npy"), csc.indptr.astype(idx_dtype, copy=False))
+    del csc
+
+    np.save(os.path.join(store_dir, "genome_ids.npy"), np.asarray(genome_ids, dtype=str))
+    np.save(os.path.join(store_dir, "ct_values.npy"), np.asarray(ct_values, dtype=np.float64))
+
+    num_rows, num_cols = csr.shape
+    header = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "kmr_size": int(kmr_size),
+        "vocabulary_hash": vocabulary_hash,
+        "num_rows": int(num_rows),
+        "num_cols": int(num_cols),
+        "num_kmrs": int(num_cols - len(INSTRUMENT_COLUMNS)),
+        "nnz": int(csr.nnz),
+        "instrument_columns": INSTRUMENT_COLUMNS,
+        "id_column": "genome_id",
+        "label_columns": ["ct_value"],
+    }
+    with open(os.path.join(store_dir, HEADER_NAME), "w") as f:
+        json.dump(header, f, indent=2)
+    if (manifest is not None):
+        manifest.to_csv(os.path.join(store_dir, MANIFEST_NAME), index=False)
+
+    # swapping the new store in for the old one
+    if (os.path.exists(final_dir)):
+        old_dir = final_dir + ".old-" + str(os.getpid())
+        os.rename(final_dir, old_dir)
+        os.rename(store_dir, final_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.rename(store_dir, final_dir)
+
+
+# reads the manifest of the genome files a feature store was built from
+# parameters:
+#    store_dir: the directory of the feature store
+# returns: the manifest as a DataFrame, or None if the store has no manifest
+def readManifest(store_dir):
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if (not os.path.exists(manifest_path)):
+        return None
+    return pd.read_csv(manifest_path, dtype={"genome_id": str, "path": str, "sequence_hash": str})
+
+
+# reads the header of a feature store
+# parameters:
+#    store_dir: the directory of the feature store
+# returns: the header as a dictionary
+def readHeader(store_dir):
+    with open(os.path.join(store_dir, HEADER_NAME)) as f:
+        header = json.load(f)
+    if (header.get("format") != STORE_FORMAT):
+        raise ValueError(store_dir + " is not a k-mer feature store")
+    if (header.get("version") != STORE_VERSION):
+        raise ValueError("unsupported feature store version " + str(header.get("version")) + " in " + store_dir)
+    return header
+
+
+# wraps the memory-mapped arrays of one layout ("csr" or "csc") of the store as a SciPy matrix without copying them
+def openMatrix(store_dir, header, layout):
+    data = np.load(os.path.join(store_dir, layout + "_data.npy"), mmap_mode="r")
+    indices = np.load(os.path.join(store_dir, layout + "_indices.npy"), mmap_mode="r")
+    indptr = np.load(os.path.join(store_dir, layout + "_indptr.npy"), mmap_mode="r")
+    shape = (header["num_rows"], header["num_cols"])
+    if (layout == "csr"):
+        return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    return sparse.csc_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+# loads a feature store, optionally only a subset of its genomes (rows) and/or features (columns)
+# without a subset, the returned matrix is backed by the memory-mapped files (near zero-copy)
+# with a subset, only the selected rows (read from the CSR layout) or columns (read from the CSC layout) are read from disk
+# parameters:
+#    store_dir: the directory of the feature store
+#    rows: optional, the row indices (or boolean mask) of the genomes to load
+#    columns: optional, the column indices (or boolean mask) of the features to load
+# returns: the sparse k-mer matrix (CSR), the genome_ids and Ct values of its rows, and the header of the store
+def loadFeatureStore(store_dir, rows=None, columns=None):
+    header = readHeader(store_dir)
+    genome_ids = np.load(os.path.join(store_dir, "genome_ids.npy"), mmap_mode="r")
+    ct_values = np.load(os.path.join(store_dir, "ct_values.npy"), mmap_mode="r")
+
+    if (columns is not None and rows is None):
+        # reading whole feature columns from the CSC layout
+        kmr_matrix = openMatrix(store_dir, header, "csc")[:, columns].tocsr()
+    else:
+        kmr_matrix = openMatrix(store_dir, header, "csr")
+        if (rows is not None):
+            kmr_matrix = kmr_matrix[rows]
+            genome_ids = genome_ids[rows]
+            ct_values = ct_values[rows]
+        if (columns is not None):
+            kmr_matrix = kmr_matrix[:, columns]
+
+    return kmr_matrix, genome_ids, ct_values, header
@@ -0,0 +1,107 @@
+import numpy as np
+from scipy import sparse
+
+# evaluating a Random Forest stored as flat node arrays (see modelStore.py) with NumPy, without scikit-learn
+# all trees are evaluated at once for a batch of rows: every (row, tree) pair starts at the root of its tree and all pairs that
+#  are not at a leaf yet move down one level per step, so the number of steps is the depth of the deepest path
+# sparse rows are never made dense: the value of a feature is looked up among the non-zero values of its row with a binary search,
+#  so a prediction only touches the features the trees split on
+# the predictions are the same as scikit-learn's: the features are compared as float32 (scikit-learn converts them to float32
+#  and the thresholds of a flat forest are rounded down to float32, see modelStore.roundThresholds), and the tree predictions
+#  are added up in tree order and divided by the number of trees
+
+# the maximal number of (row, tree) pairs evaluated at a time
+PAIRS_PER_BLOCK = 1 << 22
+
+
+# moves (row, tree) pairs down the trees until every pair is at a leaf
+# parameters:
+#    forest: the flat forest (an object with the node arrays left, right, feature, threshold and roots, see modelStore.FlatForest)
+#    num_rows: the number of rows
+#    lookup: a function returning the (float32) values of the rows at the features, given arrays of row numbers and features
+# returns: the leaf every row reaches in every tree, an array of shape (num_rows, number of trees)
+def findLeaves(forest, num_rows, lookup):
+    roots = np.asarray(forest.roots)
+    num_trees = len(roots)
+    nodes = np.tile(roots, num_rows)
+    rows = np.repeat(np.arange(num_rows), num_trees)
+    active = np.arange(len(nodes))
+    while (len(active) > 0):
+        current = nodes[active]
+        features = np.asarray(forest.feature[current])
+        internal = features >= 0
+        active = active[internal]
+        current = current[internal]
+        features = features[internal]
+        if (len(active) == 0):
+            break
+        go_left = lookup(rows[active], features) <= forest.threshold[current]
+        nodes[active] = np.where(go_left, forest.left[current], forest.right[current])
+    return nodes.reshape(num_rows, num_trees)
+
+
+# averages the predictions of the trees at the leaves the rows reached, adding them up in tree order as scikit-learn does
+def averageLeaves(forest, leaves):
+    values = np.asarray(forest.value[leaves], dtype=np.float64)
+    total = np.zeros(leaves.shape[0])
+    for tree in range(leaves.shape[1]):
+        total += values[:, tree]
+    return total / leaves.shape[1]
+
+
+# predicts the rows of a sparse matrix (CSR, float32 values with sorted column indices)
+def predictSparseBlock(forest, X):
+    num_features = X.shape[1]
+    # the (row, column) of every non-zero value as one sorted key
+    keys = np.repeat(np.arange(X.shape[0], dtype=np.int64), np.diff(X.indptr)) * num_features + X.indices
+    data = X.data
+
+    def lookup(rows, features):
+        queries = rows.astype(np.int64) * num_features + features
+        positions = np.searchsorted(keys, queries)
+        positions[positions == len(keys)] = 0
+        found = (keys[positions] == queries) if len(keys) > 0 else np.zeros(len(queries), dtype=bool)
+        return np.where(found, data[positions] if len(keys) > 0 else 0, np.float32(0))
+
+    return averageLeaves(forest, findLeaves(forest, X.shape[0], lookup))
+
+
+# predicts the rows of a dense float32 matrix
+def predictDenseBlock(forest, X):
+    return averageLeaves(forest, findLeaves(forest, X.shape[0], lambda rows, features: X[rows, features]))
+
+
+# predicts the Ct values of the rows of a matrix
+# parameters:
+#    forest: the flat forest
+#    X: a sparse (any SciPy format) or dense matrix with one row per genome and one column per feature of the forest
+# returns: the prediction of the forest for every row (float64)
+def predict(forest, X):
+    if (X.shape[1] != forest.n_features_in_):
+        raise ValueError("X has " + str(X.shape[1]) + " features, but the model was trained with " + str(forest.n_features_in_))
+    if (sparse.issparse(X)):
+        X = sparse.csr_matrix(X, dtype=np.float32)
+        X.sum_duplicates() # also sorts the column indices
+    else:
+        X = np.asarray(X, dtype=np.float32)
+
+    predictions = np.zeros(X.shape[0])
+    block = max(1, PAIRS_PER_BLOCK // max(1, forest.n_estimators))
+    for start in range(0, X.shape[0], block):
+        if (sparse.issparse(X)):
+            predictions[start:start + block] = predictSparseBlock(forest, X[start:start + block])
+        else:
+            predictions[start:start + block] = predictDenseBlock(forest, X[start:start + block])
+    return predictions
+
+
+# predicts the Ct value of one genome from its non-zero features
+# parameters:
+#    forest: the flat forest
+#    columns: the column numbers of the non-zero features (e.g. the columns of the k-mers of the genome)
+#    values: the value of every feature (e.g. the k-mer counts)
+# returns: the prediction of the forest
+def predictFeatures(forest, columns, values):
+    columns = np.asarray(columns, dtype=np.int64)
+    row = sparse.csr_matrix((np.asarray(values, dtype=np.float32), columns, [0, len(columns)]), shape=(1, forest.n_features_in_))
+    return predict(forest, row)[0]
@@ -0,0 +1,224 @@
+import sys
+import os
+import re
+import zipfile
+import hashlib
+import threading
+import subprocess
+import numpy as np
+
+import fastaReader
+import profiling
+
+# a persistent cache of the k-mer counts of genomes, shared by runKMC.py, createDataFrame.py and predictCt.py (option -cd)
+# the cache is content-addressed: the key of a genome is the hash of its sequences, the k-mer size and the version of the
+#  counter, so a genome is counted once for every k-mer size no matter its file name, directory or multi-FASTA bundle, and a
+#  changed .fasta file or a new version of KMC gets a new key
+# every entry is one .npz file holding the sorted encoded k-mers (see kmerCounts.py) and their frequencies, each stored in the
+#  smallest unsigned integer type that holds them (e.g. 4 + 1 bytes per k-mer for 10-mers, instead of ~14 in a KMC dump file)
+# entries are stored in <cache_dir>/<first 2 characters of the key>/<key>.npz, a hit updates the modification time of its
+#  entry, and evictCache removes the least recently used entries until the cache fits its maximal size
+
+# bumped whenever the counts of the same genome would change (e.g. new options for KMC), so old entries are no longer used
+CACHE_VERSION = 1
+ENTRY_SUFFIX = ".npz"
+# the default maximal size of the cache in MB
+DEFAULT_MAX_SIZE = 4096
+
+# the version of every counter, looked up once per process
+counter_versions = {}
+
+
+# returns the version of a k-mer counter, which is part of the key of every entry
+# parameters:
+#    counter: "kmc" (the version printed by the kmc executable) or "python" (see kmerCounter.py)
+# returns: the version as a string
+def counterVersion(counter):
+    if (counter not in counter_versions):
+        version = "unknown"
+        if (counter == "kmc"):
+            try:
+                result = subprocess.run(["kmc"], capture_output=True, text=True, timeout=60)
+                match = re.search(r"ver\.\s*(\S+)", result.stdout + result.stderr)
+                if (match is not None):
+                    version = match.group(1)
+            except (OSError, subprocess.TimeoutExpired): # KMC is not installed, the genome will fail to be counted anyway
+                pass
+        counter_versions[counter] = counter + " " + version + " " + str(CACHE_VERSION)
+    return counter_versions[counter]
+
+
+# computes the hash of the sequences of a genome
+# the headers of the records are not part of the hash, they do not change the k-mer counts
+# parameters:
+#    sequences: the sequences (bytes) of the records of the genome
+# returns: the hex digest of the sequences
+def sequencesHash(sequences):
+    digest = hashlib.sha256()
+    for sequence in sequences:
+        digest.update(len(sequence).to_bytes(8, "little"))
+        digest.update(sequence)
+    return digest.hexdigest()
+
+
+# computes the key of the k-mer counts of a genome
+# parameters:
+#    genome: the path to the .fasta file of the genome (optionally compressed), or its sequence (bytes) for a record of a
+#            multi-FASTA bundle
+#    kmr_size: the size of the k-mers
+#    counter: "kmc" or "python"
+# returns: the key (a hex digest)
+def genomeKey(genome, kmr_size, counter):
+    if (isinstance(genome, bytes)):
+        sequence_hash = sequencesHash([genome])
+    else:
+        sequence_hash = sequencesHash(sequence for record_id, sequence in fastaReader.readFastaRecords(genome))
+    key = sequence_hash + " " + str(kmr_size) + " " + counterVersion(counter)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# returns the path of the entry of a key
+def entryPath(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+
+# picks the smallest unsigned integer type that holds every value of an array
+def smallestUint(values):
+    max_value = int(values.max()) if len(values) > 0 else 0
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if (max_value <= np.iinfo(dtype).max):
+            return dtype
+    return np.uint64
+
+
+# reads the k-mer counts of a genome from the cache
+# parameters:
+#    cache_dir: the directory of the cache
+#    key: the key of the genome (see genomeKey)
+# returns: the sorted encoded k-mers (uint64) and their frequencies (uint32), or None if the genome is not in the cache
+def loadCounts(cache_dir, key):
+    path = entryPath(cache_dir, key)
+    try:
+        with np.load(path) as entry:
+            codes = entry["codes"].astype(np.uint64)
+            frequencies = entry["frequencies"].astype(np.uint32)
+        os.utime(path) # the entry was just used
+    except FileNotFoundError:
+        profiling.count("cache_misses")
+        return None
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile): # a damaged entry is counted again and replaced
+        profiling.count("cache_misses")
+        return None
+    profiling.count("cache_hits")
+    return codes, frequencies
+
+
+# adds the k-mer counts of a genome to the cache
+# the entry is written under a temporary name first, so a partly written entry is never read
+# parameters:
+#    cache_dir: the directory of the cache
+#    key: the key of the genome (see genomeKey)
+#    codes: the sorted encoded k-mers
+#    frequencies: the frequency of every k-mer
+def storeCounts(cache_dir, key, codes, frequencies):
+    path = entryPath(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp-" + str(os.getpid()) + "-" + str(threading.get_ident()) + ENTRY_SUFFIX
+    np.savez(tmp_path, codes=codes.astype(smallestUint(codes)), frequencies=frequencies.astype(smallestUint(frequencies)))
+    os.replace(tmp_path, path)
+
+
+# returns the k-mer counts of a genome from the cache, or counts it and adds the counts to the cache
+# parameters:
+#    cache_dir: the directory of the cache, or None to count the genome without a cache
+#    genome: the path to the .fasta file of the genome or its sequence (see genomeKey)
+#    kmr_size: the size of the k-mers
+#    counter: "kmc" or "python"
+#    count: a function without arguments returning the sorted encoded k-mers and their frequencies of the genome
+# returns: the sorted encoded k-mers and their frequencies
+def cachedCounts(cache_dir, genome, kmr_size, counter, count):
+    if (cache_dir is None):
+        return count()
+    key = genomeKey(genome, kmr_size, counter)
+    counts = loadCounts(cache_dir, key)
+    if (counts is None):
+        counts = count()
+        storeCounts(cache_dir, key, counts[0], counts[1])
+    return counts
+
+
+# lists the entries of the cache
+# returns: a list of (last use, size in bytes, path) for every entry
+def listEntries(cache_dir):
+    entries = []
+    if (not os.path.isdir(cache_dir)):
+        return entries
+    for sub_dir in os.scandir(cache_dir):
+        if (not sub_dir.is_dir()):
+            continue
+        for entry in os.scandir(sub_dir.path):
+            if (entry.name.endswith(ENTRY_SUFFIX) and ".tmp-" not in entry.name):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+# removes the least recently used entries of the cache until it is no larger than max_size
+# parameters:
+#    cache_dir: the directory of the cache
+#    max_size: the maximal size of the cache in bytes
+# returns: the number of entries and the size in bytes of the cache after the eviction, and the number of entries removed
+def evictCache(cache_dir, max_size):
+    entries = sorted(listEntries(cache_dir))
+    total_size = sum(size for last_use, size, path in entries)
+    num_removed = 0
+    for last_use, size, path in entries:
+        if (total_size <= max_size):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError: # removed by another process
+            pass
+        total_size -= size
+        num_removed += 1
+    return len(entries) - num_removed, total_size, num_removed
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-cd --cache_dir:\tthe directory of the k-mer count cache. There is no default for this option."
+    s+= "\n-cm --cache_max_size:\tthe maximal size of the cache in MB, the least recently used genomes are removed from the cache until it fits. The default is " + str(DEFAULT_MAX_SIZE)
+    return s
+
+
+# main function
+# prints the number of genomes and the size of a k-mer count cache, after removing the least recently used genomes until the
+#  cache fits its maximal size
+def main(argv):
+    # setting default values for parameters:
+    cache_dir = "" # (-cd) the directory of the cache
+    cache_max_size = DEFAULT_MAX_SIZE # (-cm) the maximal size of the cache in MB
+
+    args = sys.argv
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-cd" or args[i] == "--cache_dir"):
+            cache_dir = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cm" or args[i] == "--cache_max_size"):
+            cache_max_size = float(args[i + 1])
+
+    if (cache_dir == ""):
+        print("Error: cache_dir (-cd) (required parameter) not entered")
+        sys.exit()
+
+    num_entries, total_size, num_removed = evictCache(cache_dir, cache_max_size * 1e6)
+    print("--kmerCache.py-- removed", num_removed, "genomes,", num_entries, "genomes (", round(total_size / 1e6, 2), "MB ) in the cache")
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,190 @@
+import sys
+import os
+import time
+import numpy as np
+
+import fastaReader
+import kmerCounts
+import profiling
+
+# an in-process k-mer counter that can be used instead of running KMC as a subprocess (--counter python)
+# a SARS-CoV-2 genome is only ~30 kb, so starting KMC and going through its files on disk costs more than the counting itself
+# the counts match the KMC output used by the pipeline (kmc -ci1 -fm, then kmc_dump):
+#    k-mers are canonical, the smaller of the k-mer and its reverse complement (in 2-bit code, i.e. lexicographic, order)
+#    k-mers containing anything other than A, C, G or T (e.g. N) are skipped, lower-case bases are counted
+#    k-mers do not span two records of a .fasta file
+# k-mers are rolled as 2-bit codes (see kmerCounts.py) with NumPy and counted with np.bincount or np.unique
+
+
+# reads the sequences of a .fasta file (optionally gzip or bgzip compressed, see fastaReader.py)
+# parameters:
+#    fasta_path: the path to the .fasta file
+# returns: a list of the sequences (bytes), one per record
+def readFastaSequences(fasta_path):
+    return [sequence for record_id, sequence in fastaReader.readFastaRecords(fasta_path)]
+
+
+# computes the canonical 2-bit codes of all k-mers of one sequence
+# parameters:
+#    sequence: the sequence (bytes)
+#    kmr_size: the size of the k-mers
+# returns: the canonical codes (uint64) of every k-mer of the sequence that only contains A, C, G and T
+def canonicalCodes(sequence, kmr_size):
+    num_kmrs = len(sequence) - kmr_size + 1
+    if (num_kmrs <= 0):
+        return np.zeros(0, dtype=np.uint64)
+    bases = kmerCounts.BASE_CODES[np.frombuffer(sequence, dtype=np.uint8)]
+    invalid = bases == 255
+    bases = np.where(invalid, 0, bases).astype(np.uint64)
+
+    # rolling the codes of the k-mers (forward strand) and of their reverse complements (complement = 3 - base):
+    forward = np.zeros(num_kmrs, dtype=np.uint64)
+    reverse = np.zeros(num_kmrs, dtype=np.uint64)
+    for i in range(kmr_size):
+        window = bases[i:i + num_kmrs]
+        forward = (forward << np.uint64(2)) | window
+        reverse = reverse | ((np.uint64(3) - window) << np.uint64(2 * i))
+
+    # a k-mer is skipped if any of its bases is invalid:
+    num_invalid = np.concatenate([[0], np.cumsum(invalid)])
+    valid = num_invalid[kmr_size:] == num_invalid[:num_kmrs]
+    return np.minimum(forward, reverse)[valid]
+
+
+# counts the canonical k-mers of a list of sequences
+# parameters:
+#    sequences: the sequences (bytes), k-mers do not span two sequences
+#    kmr_size: the size of the k-mers
+# returns: the sorted encoded k-mers (uint64) and their frequencies (uint32), in the same order as a KMC dump
+def countSequences(sequences, kmr_size):
+    kmr_size = int(kmr_size)
+    if (kmr_size < 1 or kmr_size > kmerCounts.MAX_KMR_SIZE):
+        raise ValueError("k-mer size must be between 1 and " + str(kmerCounts.MAX_KMR_SIZE) + ", got " + str(kmr_size))
+    codes = [canonicalCodes(sequence, kmr_size) for sequence in sequences]
+    codes = np.concatenate(codes) if len(codes) > 0 else np.zeros(0, dtype=np.uint64)
+
+    # with more k-mers than possible codes a direct count per code is cheaper than sorting
+    if (4 ** kmr_size <= len(codes)):
+        counts = np.bincount(codes.astype(np.intp), minlength=4 ** kmr_size)
+        present = np.flatnonzero(counts)
+        return present.astype(np.uint64), counts[present].astype(np.uint32)
+    unique_codes, counts = np.unique(codes, return_counts=True)
+    return unique_codes, counts.astype(np.uint32)
+
+
+# counts the canonical k-mers of a .fasta file
+# parameters:
+#    fasta_path: the path to the .fasta file
+#    kmr_size: the size of the k-mers
+# returns: the sorted encoded k-mers (uint64) and their frequencies (uint32)
+def countFastaFile(fasta_path, kmr_size):
+    codes, frequencies = countSequences(readFastaSequences(fasta_path), kmr_size)
+    profiling.count("genomes_counted")
+    profiling.count("fasta_bytes_read", os.path.getsize(fasta_path))
+    profiling.count("kmrs_counted", len(codes))
+    return codes, frequencies
+
+
+# writes k-mer counts in the format of a KMC dump (.kmrs) file, one "<k-mer>\t<frequency>" line per k-mer
+# the file is written under a temporary name first, so a partly written file is never taken for a finished one
+# parameters:
+#    kmrs_path: the path of the .kmrs file
+#    codes: the sorted encoded k-mers
+#    frequencies: the frequency of every k-mer
+#    kmr_size: the size of the k-mers
+def writeKmrsFile(kmrs_path, codes, frequencies, kmr_size):
+    tmp_path = kmrs_path + ".tmp-" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        f.writelines(kmr + "\t" + str(frequency) + "\n" for kmr, frequency in zip(kmerCounts.decodeKmers(codes, kmr_size), frequencies))
+    os.replace(tmp_path, kmrs_path)
+
+
+# counts the k-mers of one genome and writes them as a KMC dump file, with the same interface as runKMC.runKMCGenome
+# parameters:
+#    input_path: the path to the .fasta file of the genome
+#    genome_id: the genome_id of the genome (used to name the output file)
+#    kmc_out_dir: the directory to which the output file will be stored
+#    kmr_size: the size of the k-mers to count
+#    threads: unused, the counter runs in the calling thread
+# returns: the genome_id, an error message (None if the genome was counted), and the time taken in seconds
+def countGenome(input_path, genome_id, kmc_out_dir, kmr_size, threads=1):
+    start = time.perf_counter()
+    error = None
+    try:
+        codes, frequencies = countFastaFile(input_path, kmr_size)
+        writeKmrsFile(kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size), codes, frequencies, kmr_size)
+    except (OSError, ValueError) as e:
+        error = str(e)
+    return genome_id, error, time.perf_counter() - start
+
+
+# compares the counts of this counter with the KMC outputs of the same genomes
+# parameters:
+#    genomes_dir: the directory containing the genomes as .fasta files
+#    kmc_out_dir: the directory containing the outputs of KMC for the genomes
+#    kmr_size: the size of the k-mers
+# returns: the number of genomes compared and a list of the genome_ids whose counts differ
+def compareWithKMC(genomes_dir, kmc_out_dir, kmr_size):
+    num_compared = 0
+    mismatches = []
+    for filename in sorted(os.scandir(genomes_dir), key=lambda entry: entry.name):
+        genome_id = fastaReader.fastaGenomeId(filename.name)
+        if (genome_id is None):
+            continue
+        kmrs_path = kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size)
+        if (not os.path.exists(kmrs_path)):
+            continue
+        kmc_codes, kmc_frequencies = kmerCounts.readKmrsCodes(kmrs_path, kmr_size)
+        codes, frequencies = countFastaFile(filename.path, kmr_size)
+        num_compared += 1
+        if (not (np.array_equal(codes, kmc_codes) and np.array_equal(frequencies, kmc_frequencies))):
+            mismatches.append(genome_id)
+    return num_compared, mismatches
+
+
+# function to return a string specifying the format of parameters
+# returns: the string with information about the parameters
+def helpOption():
+    s = "-g --genomes_dir:\tthe directory containing the genomes as .fasta files. The default is './'"
+    s+= "\n-k --kmc_out_dir:\tthe directory containing the outputs of KMC for the genomes. The default is ~/genomes_dir/kmc_output"
+    s+= "\n-s --kmr_size:\tthe size of the k-mers. The default is 10"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# main function
+# checks that this counter gives the same counts as KMC: every genome in genomes_dir with a KMC output in kmc_out_dir
+#  is counted again in-process and its counts are compared with the KMC output
+def main(argv):
+    # setting default values for parameters:
+    genomes_dir = os.getcwd() + "/" # (-g) the directory with genomes as .fasta files
+    kmc_out_dir = genomes_dir + "kmc_output/" # (-k) the directory with the outputs of KMC
+    kmr_size = 10 # (-s) the size of the k-mers
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "kmerCounter.py")
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-g" or args[i] == "--genomes_dir"):
+            genomes_dir = os.path.abspath(args[i + 1]) + "/"
+            kmc_out_dir = genomes_dir + "kmc_output/"
+        elif (args[i] == "-k" or args[i] == "--kmc_out_dir"):
+            kmc_out_dir = os.path.abspath(args[i + 1]) + "/"
+        elif (args[i] == "-s" or args[i] == "--kmr_size"):
+            kmr_size = int(args[i + 1])
+
+    with profiling.stage("compare"):
+        num_compared, mismatches = compareWithKMC(genomes_dir, kmc_out_dir, kmr_size)
+    print("--kmerCounter.py-- compared the counts of", num_compared, "genomes with KMC:", len(mismatches), "differ")
+    if (len(mismatches) > 0):
+        print("--kmerCounter.py-- counts differ for:", ", ".join(mismatches))
+        sys.exit(1)
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
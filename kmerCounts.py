@@ -0,0 +1,200 @@
+import os
+import pickle
+import urllib.parse
+import numpy as np
+import pandas as pd
+
+import profiling
+
+# reading the k-mer counts produced by KMC and mapping k-mers to the columns of the k-mer matrix
+# the KMC dump (.kmrs) files contain one "<k-mer> <frequency>" line per unique k-mer
+# k-mers are packed into integers with 2 bits per base (A=0, C=1, G=2, T=3), so a uint64 holds any k-mer with k <= 32
+# the vocabulary (every k-mer that has a column in the k-mer matrix) is a uint64 array stored as a .npy file,
+#  the column number of a k-mer is its position in the vocabulary
+# a full build creates a sorted vocabulary (since the 2-bit codes sort in the same order as the k-mer strings, the columns
+#  are the same as in KMC's sorted output), an incremental build appends new k-mers to the end without renumbering the others
+
+MAX_KMR_SIZE = 32
+
+# maps the ASCII code of a base to its 2-bit code, 255 for anything that is not a base
+BASE_CODES = np.full(256, 255, dtype=np.uint8)
+for code, base in enumerate("ACGT"):
+    BASE_CODES[ord(base)] = code
+    BASE_CODES[ord(base.lower())] = code
+
+
+# reads a KMC dump (.kmrs) file into NumPy arrays in one pass with pandas' C parser
+# parameters:
+#    kmrs_path: the path to the .kmrs file
+# returns: an array of the k-mers (as strings) and an array of their frequencies (uint32)
+def readKmrsFile(kmrs_path):
+    try:
+        table = pd.read_csv(kmrs_path, sep=r"\s+", header=None, names=["kmr", "frequency"], usecols=[0, 1],
+                            dtype={"kmr": str, "frequency": np.uint32}, engine="c", na_filter=False)
+    except pd.errors.EmptyDataError: # the genome had no k-mers
+        return np.zeros(0, dtype=object), np.zeros(0, dtype=np.uint32)
+    return table["kmr"].to_numpy(dtype=object), table["frequency"].to_numpy(dtype=np.uint32)
+
+
+# reads a KMC dump (.kmrs) file and encodes its k-mers as 2-bit integers
+# parameters:
+#    kmrs_path: the path to the .kmrs file
+#    kmr_size: the size of the k-mers in the file
+# returns: an array of the encoded k-mers (uint64) and an array of their frequencies (uint32)
+def readKmrsCodes(kmrs_path, kmr_size):
+    kmrs, freqs = readKmrsFile(kmrs_path)
+    profiling.count("kmrs_files_read")
+    profiling.count("kmrs_bytes_read", os.path.getsize(kmrs_path))
+    profiling.count("kmrs_parsed", len(kmrs))
+    return encodeKmers(kmrs, kmr_size), freqs
+
+
+# returns the path of the KMC output (.kmrs) file of a genome, <genome_id>_kmc.<kmr_size>.kmrs in kmc_out_dir
+# the genome_id is percent-encoded (e.g. "/" as "%2F"), since the ids of multi-FASTA records come from their headers and can
+#  contain characters that are not allowed in a file name (e.g. hCoV-19/USA/CA-1/2020); ids made of letters, digits and
+#  "_.-~" are used as they are
+# parameters:
+#    kmc_out_dir: the directory of the KMC outputs
+#    genome_id: the genome_id of the genome
+#    kmr_size: the size of the k-mers
+def kmrsPath(kmc_out_dir, genome_id, kmr_size):
+    return os.path.join(kmc_out_dir, fileSafeId(genome_id) + "_kmc." + str(kmr_size) + ".kmrs")
+
+
+# returns the genome_id encoded in the name of a KMC output file (see kmrsPath), or None if it is not one
+def kmrsGenomeId(file_name, kmr_size):
+    suffix = "_kmc." + str(kmr_size) + ".kmrs"
+    if (not file_name.endswith(suffix)):
+        return None
+    return urllib.parse.unquote(file_name[:-len(suffix)])
+
+
+# percent-encodes a genome_id so it can be used in a file name
+def fileSafeId(genome_id):
+    return urllib.parse.quote(str(genome_id), safe="")
+
+
+# packs k-mer strings into integers with 2 bits per base
+# parameters:
+#    kmrs: the k-mers (strings of length kmr_size made of A, C, G and T)
+#    kmr_size: the size of the k-mers
+# returns: the encoded k-mers (uint64)
+def encodeKmers(kmrs, kmr_size):
+    kmr_size = int(kmr_size)
+    if (kmr_size < 1 or kmr_size > MAX_KMR_SIZE):
+        raise ValueError("k-mer size must be between 1 and " + str(MAX_KMR_SIZE) + ", got " + str(kmr_size))
+    if (len(kmrs) == 0):
+        return np.zeros(0, dtype=np.uint64)
+
+    # all k-mers are the same length, so the joined string is a (number of k-mers x kmr_size) matrix of bases
+    joined = "".join(kmrs).encode("ascii")
+    if (len(joined) != len(kmrs) * kmr_size):
+        raise ValueError("all k-mers must have size " + str(kmr_size))
+    bases = BASE_CODES[np.frombuffer(joined, dtype=np.uint8).reshape(len(kmrs), kmr_size)]
+    if ((bases == 255).any()):
+        raise ValueError("k-mers can only contain the bases A, C, G and T")
+
+    codes = np.zeros(len(kmrs), dtype=np.uint64)
+    for i in range(kmr_size):
+        codes = (codes << np.uint64(2)) | bases[:, i]
+    return codes
+
+
+# unpacks 2-bit encoded k-mers back into strings
+# parameters:
+#    codes: the encoded k-mers
+#    kmr_size: the size of the k-mers
+# returns: a list of the k-mers as strings
+def decodeKmers(codes, kmr_size):
+    codes = np.asarray(codes, dtype=np.uint64)
+    shifts = np.uint64(2) * np.arange(kmr_size - 1, -1, -1, dtype=np.uint64)
+    bases = np.array(list("ACGT"))[((codes[:, None] >> shifts) & np.uint64(3)).astype(np.intp)]
+    return ["".join(row) for row in bases]
+
+
+# stores the vocabulary as a .npy file
+# parameters:
+#    vocabulary: the array of encoded k-mers in column order
+#    vocabulary_path: the path to store the vocabulary as
+def storeVocabulary(vocabulary, vocabulary_path):
+    # written to a temporary file first, the vocabulary may be a memory map of the file it replaces
+    vocabulary_path = str(vocabulary_path)
+    tmp_path = vocabulary_path + ".tmp-" + str(os.getpid()) + ".npy"
+    np.save(tmp_path, np.asarray(vocabulary, dtype=np.uint64))
+    os.replace(tmp_path, vocabulary_path)
+
+
+# opens a vocabulary stored by storeVocabulary (memory-mapped)
+# a dictionary of k-mer : column number pickled by older versions of createDataFrame.py (.pkl) is converted on load
+# parameters:
+#    vocabulary_path: the path to the stored vocabulary
+#    kmr_size: the size of the k-mers (only used to convert a pickled dictionary)
+# returns: the array of encoded k-mers in column order
+def loadVocabulary(vocabulary_path, kmr_size):
+    if (str(vocabulary_path).endswith(".pkl")):
+        kmr_dictionary = pickle.load(open(vocabulary_path, "rb"))
+        kmrs = sorted(kmr_dictionary, key=kmr_dictionary.get) # the k-mers in column order
+        return encodeKmers(kmrs, kmr_size)
+    return np.load(vocabulary_path, mmap_mode="r")
+
+
+# builds the table used by columnIds to look up k-mers in a vocabulary
+# a sorted vocabulary is searched directly, an extended (unsorted) vocabulary is sorted once with its column numbers
+# parameters:
+#    vocabulary: the array of encoded k-mers in column order
+# returns: the sorted encoded k-mers and the column number of every sorted k-mer (None if the vocabulary is already sorted)
+def vocabularyLookup(vocabulary):
+    if (len(vocabulary) < 2 or (vocabulary[1:] > vocabulary[:-1]).all()):
+        return vocabulary, None
+    order = np.argsort(vocabulary, kind="stable")
+    return np.asarray(vocabulary)[order], order.astype(np.int32)
+
+
+# looks up the column numbers of an array of encoded k-mers with a binary search in the vocabulary
+# parameters:
+#    lookup: the table returned by vocabularyLookup
+#    codes: the encoded k-mers to look up
+# returns: the column number of every k-mer (int32), -1 for k-mers that are not in the vocabulary
+def columnIds(lookup, codes):
+    sorted_codes, columns = lookup
+    codes = np.asarray(codes, dtype=np.uint64)
+    if (len(sorted_codes) == 0):
+        return np.full(len(codes), -1, dtype=np.int32)
+    positions = np.searchsorted(sorted_codes, codes)
+    positions[positions == len(sorted_codes)] = 0 # past the end of the vocabulary, never a match
+    found = sorted_codes[positions] == codes
+    if (columns is not None):
+        positions = columns[positions]
+    return np.where(found, positions, -1).astype(np.int32)
+
+
+# builds the sorted union of several arrays of encoded k-mers (e.g. one per genome), merging them in batches
+# parameters:
+#    code_arrays: an iterable of arrays of encoded k-mers, consumed one array at a time
+#    batch_size: the number of k-mers collected before they are merged into the union
+# returns: the sorted array of all unique encoded k-mers
+def unionCodes(code_arrays, batch_size=10000000):
+    vocabulary = np.zeros(0, dtype=np.uint64)
+    batch = []
+    num_batched = 0
+    for codes in code_arrays:
+        batch.append(codes)
+        num_batched += len(codes)
+        if (num_batched >= batch_size):
+            vocabulary = np.union1d(vocabulary, np.concatenate(batch))
+            batch = []
+            num_batched = 0
+    if (len(batch) > 0):
+        vocabulary = np.union1d(vocabulary, np.concatenate(batch))
+    return vocabulary
+
+
+# appends the k-mers that are not yet in the vocabulary to its end, so the column numbers of the existing k-mers do not change
+# parameters:
+#    vocabulary: the array of encoded k-mers in column order
+#    codes: the encoded k-mers (of new genomes) to add
+# returns: the extended vocabulary and the number of k-mers that were added
+def extendVocabulary(vocabulary, codes):
+    new_codes = np.unique(np.asarray(codes, dtype=np.uint64))
+    new_codes = new_codes[columnIds(vocabularyLookup(vocabulary), new_codes) < 0]
+    return np.concatenate([np.asarray(vocabulary, dtype=np.uint64), new_codes]), len(new_codes)
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pandas as pd
+
+# looking up the testing instrument and Ct value of genomes in the metadata .csv file
+# the metadata file is read once and indexed by Genome ID, so every lookup is a hash lookup instead of a scan of the file
+# for prediction, the index is also cached next to the metadata file in a compact binary form (<csv_path>.idx.npz),
+#  which is reused as long as the size and modification time of the metadata file do not change
+
+ID_COLUMN = "Genome ID"
+INSTRUMENT_COLUMN = "Instrument"
+CT_COLUMN = "Ct-Value"
+CACHE_SUFFIX = ".idx.npz"
+
+# the testing instruments, one-hot encoded in the last columns of the k-mer matrix (in this order)
+INSTRUMENTS = ["ALINITY", "PANTHER", "CEPHEID"]
+
+
+# reads the metadata file and indexes it by Genome ID
+# if a Genome ID appears more than once, its first row is used
+# parameters:
+#    csv_path: the path to the metadata .csv file
+# returns: a DataFrame indexed by Genome ID with the Instrument and Ct-Value columns
+def loadMetadata(csv_path):
+    metadata = pd.read_csv(csv_path, usecols=[ID_COLUMN, INSTRUMENT_COLUMN, CT_COLUMN],
+                           dtype={ID_COLUMN: str, INSTRUMENT_COLUMN: str, CT_COLUMN: np.float64})
+    metadata = metadata.drop_duplicates(ID_COLUMN, keep="first").set_index(ID_COLUMN)
+    return metadata[[INSTRUMENT_COLUMN, CT_COLUMN]]
+
+
+# reads the metadata index from its cache, or reads the metadata file and writes the cache if it is missing or out of date
+# the cache is skipped (without an error) if it cannot be written
+# parameters:
+#    csv_path: the path to the metadata .csv file
+# returns: a DataFrame indexed by Genome ID with the Instrument and Ct-Value columns (as loadMetadata)
+def loadMetadataCached(csv_path):
+    cache_path = csv_path + CACHE_SUFFIX
+    stat = os.stat(csv_path)
+
+    if (os.path.exists(cache_path)):
+        with np.load(cache_path) as cache:
+            if (int(cache["csv_size"]) == stat.st_size and int(cache["csv_mtime_ns"]) == stat.st_mtime_ns):
+                instruments = pd.Categorical.from_codes(cache["instrument_codes"], categories=cache["instrument_categories"])
+                return pd.DataFrame({INSTRUMENT_COLUMN: np.asarray(instruments, dtype=object), CT_COLUMN: cache["ct_values"]},
+                                    index=pd.Index(cache["genome_ids"], name=ID_COLUMN))
+
+    metadata = loadMetadata(csv_path)
+    instrument_codes, instrument_categories = pd.factorize(metadata[INSTRUMENT_COLUMN])
+    try:
+        tmp_path = cache_path + ".tmp-" + str(os.getpid()) + ".npz"
+        np.savez(tmp_path, genome_ids=metadata.index.to_numpy(dtype=str), instrument_codes=instrument_codes.astype(np.int16),
+                 instrument_categories=np.asarray(instrument_categories, dtype=str), ct_values=metadata[CT_COLUMN].to_numpy(),
+                 csv_size=stat.st_size, csv_mtime_ns=stat.st_mtime_ns)
+        os.replace(tmp_path, cache_path)
+    except OSError: # the directory of the metadata file is not writable
+        pass
+    return metadata
+
+
+# looks up the instrument and Ct value of many genomes at once (a vectorized join of the genome_ids with the metadata)
+# parameters:
+#    metadata: the indexed metadata returned by loadMetadata or loadMetadataCached
+#    genome_ids: the genome_ids to look up
+# returns: an array of the instruments, an array of the Ct values, and a boolean array of which genome_ids were found
+def lookupGenomes(metadata, genome_ids):
+    rows = metadata.index.get_indexer(pd.Index(genome_ids, dtype=object))
+    found = rows >= 0
+    instruments = np.where(found, metadata[INSTRUMENT_COLUMN].to_numpy(dtype=object)[rows], None)
+    ct_values = np.where(found, metadata[CT_COLUMN].to_numpy(dtype=np.float64)[rows], np.nan)
+    return instruments, ct_values, found
+
+
+# looks up the instrument of one genome
+# parameters:
+#    metadata: the indexed metadata returned by loadMetadata or loadMetadataCached
+#    genome_id: the genome_id to look up
+# returns: the instrument, or None if the genome_id is not in the metadata
+def getInstrument(metadata, genome_id):
+    instruments, ct_values, found = lookupGenomes(metadata, [genome_id])
+    return instruments[0]
@@ -0,0 +1,228 @@
+import sys
+import os
+import json
+import shutil
+import pickle
+import numpy as np
+
+import forestEngine
+import profiling
+
+# a compact on-disk format for the Random Forest regression model trained by trainModel.py (a "flat forest")
+# the nodes of all trees are stored as flat arrays, one entry per node, in a directory (named <model>.forest) holding:
+#    header.json: the number of trees, nodes and features, the depth of the deepest tree and the dtype of the leaf values
+#    left.npy, right.npy (int32): the global node number of the left and right child of every node (-1 for leaves)
+#    feature.npy (int32): the column every node splits on (-1 for leaves)
+#    threshold.npy (float32): the threshold every node splits at, a row goes left if its value is <= threshold
+#    value.npy (float32, or float64 with -vp 64): the prediction of every node (only used at the leaves)
+#    roots.npy (int32): the node number of the root of every tree
+# this takes 20 bytes per node instead of about 70 in a pickled model
+# the arrays are plain .npy files, so they are memory-mapped when the model is loaded: loading is near instant, and only the
+#  nodes a prediction reaches are read from disk
+# a flat forest is evaluated by forestEngine.py, a fitted scikit-learn model can be converted in memory with compileModel
+# the thresholds are rounded down to float32, which gives the same splits as scikit-learn (which compares the float32 features
+#  with float64 thresholds); with float32 leaf values the predictions differ from the pickled model's by float32 rounding only
+
+FOREST_FORMAT = "ct-flat-forest"
+FOREST_VERSION = 1
+FOREST_SUFFIX = ".forest"
+HEADER_NAME = "header.json"
+NODE_ARRAYS = ["left", "right", "feature", "threshold", "value", "roots"]
+
+
+# a Random Forest regression model loaded from a flat forest, with the predict method of the scikit-learn model
+class FlatForest:
+
+    # parameters:
+    #    header: the header of the flat forest
+    #    arrays: a dictionary of the node arrays (see NODE_ARRAYS)
+    def __init__(self, header, arrays):
+        self.header = header
+        self.n_features_in_ = header["n_features"]
+        self.n_estimators = header["n_trees"]
+        self.max_depth = header["max_depth"]
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    # predicts the Ct values of the rows of a matrix (sparse or dense) with forestEngine.py
+    # parameters:
+    #    X: a sparse (any SciPy format) or dense matrix with one row per genome
+    # returns: the prediction of the forest for every row (float64)
+    def predict(self, X):
+        return forestEngine.predict(self, X)
+
+
+# rounds float64 thresholds down to float32, so that x <= threshold gives the same result for every float32 x
+def roundThresholds(thresholds):
+    rounded = thresholds.astype(np.float32)
+    too_large = rounded.astype(np.float64) > thresholds
+    rounded[too_large] = np.nextafter(rounded[too_large], np.float32(-np.inf))
+    return rounded
+
+
+# converts a fitted scikit-learn RandomForestRegressor (or any forest of single-output regression trees) to flat node arrays
+# parameters:
+#    model: the fitted model
+#    value_dtype: the dtype of the leaf values (np.float32 or np.float64)
+# returns: the header and a dictionary of the node arrays
+def exportForest(model, value_dtype=np.float32):
+    import sklearn # imported here, so that loading and predicting with a flat forest does not import scikit-learn
+    lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+    num_nodes = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left < 0
+        roots.append(num_nodes)
+        lefts.append(np.where(leaf, -1, tree.children_left + num_nodes))
+        rights.append(np.where(leaf, -1, tree.children_right + num_nodes))
+        features.append(np.where(leaf, -1, tree.feature))
+        thresholds.append(np.where(leaf, 0, tree.threshold))
+        values.append(tree.value[:, 0, 0])
+        num_nodes += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "left": np.concatenate(lefts).astype(np.int32),
+        "right": np.concatenate(rights).astype(np.int32),
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": roundThresholds(np.concatenate(thresholds)),
+        "value": np.concatenate(values).astype(value_dtype),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    header = {
+        "format": FOREST_FORMAT,
+        "version": FOREST_VERSION,
+        "n_trees": len(roots),
+        "n_nodes": int(num_nodes),
+        "n_features": int(model.n_features_in_),
+        "max_depth": int(max_depth),
+        "value_dtype": np.dtype(value_dtype).name,
+        "sklearn_version": sklearn.__version__,
+    }
+    return header, arrays
+
+
+# stores a fitted model as a flat forest
+# the forest is written to a temporary directory first and then swapped in, like the feature store (see featureStore.py)
+# parameters:
+#    model: the fitted model
+#    forest_dir: the directory to store the flat forest in
+#    value_dtype: the dtype of the leaf values (np.float32 or np.float64)
+def storeForest(model, forest_dir, value_dtype=np.float32):
+    header, arrays = exportForest(model, value_dtype)
+    final_dir = os.path.abspath(forest_dir)
+    forest_dir = final_dir + ".tmp-" + str(os.getpid())
+    shutil.rmtree(forest_dir, ignore_errors=True)
+    os.makedirs(forest_dir)
+    for name in NODE_ARRAYS:
+        np.save(os.path.join(forest_dir, name + ".npy"), arrays[name])
+    with open(os.path.join(forest_dir, HEADER_NAME), "w") as f:
+        json.dump(header, f, indent=2)
+
+    if (os.path.exists(final_dir)):
+        old_dir = final_dir + ".old-" + str(os.getpid())
+        os.rename(final_dir, old_dir)
+        os.rename(forest_dir, final_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.rename(forest_dir, final_dir)
+
+
+# loads a flat forest, memory-mapping its node arrays
+# parameters:
+#    forest_dir: the directory of the flat forest
+# returns: the model as a FlatForest
+def loadForest(forest_dir):
+    with open(os.path.join(forest_dir, HEADER_NAME)) as f:
+        header = json.load(f)
+    if (header.get("format") != FOREST_FORMAT):
+        raise ValueError(forest_dir + " is not a flat forest")
+    if (header.get("version") != FOREST_VERSION):
+        raise ValueError("unsupported flat forest version " + str(header.get("version")) + " in " + forest_dir)
+    arrays = {name: np.load(os.path.join(forest_dir, name + ".npy"), mmap_mode="r") for name in NODE_ARRAYS}
+    return FlatForest(header, arrays)
+
+
+# converts a fitted scikit-learn model to a flat forest in memory (with float64 leaf values, so the predictions are identical)
+# parameters:
+#    model: the fitted scikit-learn model, or a FlatForest (returned as it is)
+# returns: the model as a FlatForest
+def compileModel(model):
+    if (isinstance(model, FlatForest)):
+        return model
+    header, arrays = exportForest(model, np.float64)
+    return FlatForest(header, arrays)
+
+
+# loads a model stored by trainModel.py: a flat forest (a directory) or a pickled scikit-learn model (a .sav file)
+# parameters:
+#    model_name: the path to the model
+# returns: the model (with a predict method)
+def loadModel(model_name):
+    if (os.path.isdir(model_name)):
+        return loadForest(model_name)
+    with open(model_name, "rb") as f:
+        return pickle.load(f)
+
+
+# stores a model trained by trainModel.py, as a flat forest if the name ends in .forest and pickled otherwise
+# parameters:
+#    model: the fitted model
+#    model_name: the path to store the model as
+def storeModel(model, model_name):
+    if (model_name.endswith(FOREST_SUFFIX)):
+        storeForest(model, model_name)
+        return
+    with open(model_name, "wb") as f:
+        pickle.dump(model, f)
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-m --model_name:\tthe pickled model (.sav file) created by trainModel.py. The default is 'ct_model.sav'"
+    s+= "\n-o --forest_name:\tthe name of the flat forest to create. The default is the name of the model with .forest instead of .sav"
+    s+= "\n-vp --value_precision:\tthe precision of the leaf values: 32 (float32) or 64 (float64, predictions identical to the pickled model). The default is 32"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# main function
+# converts a pickled model created by trainModel.py to a flat forest
+def main(argv):
+    # setting default values for parameters:
+    model_name = "ct_model.sav" # (-m) the pickled model to convert
+    forest_name = "" # (-o) the name of the flat forest to create
+    value_precision = 32 # (-vp) the precision of the leaf values
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "modelStore.py")
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-m" or args[i] == "--model_name"):
+            model_name = args[i + 1]
+        elif (args[i] == "-o" or args[i] == "--forest_name"):
+            forest_name = args[i + 1]
+        elif (args[i] == "-vp" or args[i] == "--value_precision"):
+            value_precision = int(args[i + 1])
+
+    if (value_precision not in [32, 64]):
+        print("Error: the value precision (-vp) must be 32 or 64")
+        sys.exit()
+    if (forest_name == ""):
+        forest_name = (model_name[:-len(".sav")] if model_name.endswith(".sav") else model_name) + FOREST_SUFFIX
+
+    with profiling.stage("load"):
+        model = loadModel(model_name)
+    with profiling.stage("store"):
+        storeForest(model, forest_name, np.float32 if value_precision == 32 else np.float64)
+    print("--modelStore.py-- stored the model as the flat forest '", forest_name, "'")
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
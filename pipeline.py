@@ -0,0 +1,403 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+import createDataFrame
+import evaluation
+import fastaReader
+import featureStore
+import kmerCache
+import kmerCounts
+import metadataIndex
+import modelStore
+import predictCt
+import profiling
+import trainModel
+
+# runs the stages of ct_value_prediction.sh (runKMC.py, createDataFrame.py, trainModel.py and predictCt.py) in one process
+# the k-mer counts, the vocabulary, the k-mer matrix and the model are passed between the stages in memory, so pandas and
+#  scikit-learn are imported once and no stage reads back what the previous stage wrote
+# with a checkpoint directory (-ck) the vocabulary, the feature store and the model are also written there, in the same formats
+#  as the scripts write them, along with pipeline_state.json recording the fingerprint of the inputs of every stage and of the
+#  artifact it wrote; a stage whose inputs did not change since its artifact was written is skipped and its artifact is loaded
+#  instead (only if a later stage needs it), like make does for targets that are newer than their dependencies
+# the stages and their inputs:
+#    vocabulary: the genome files (their genome_id, path, size and modification time), the k-mer size and the counter
+#    matrix: the vocabulary, the genome files and the metadata file
+#    model: the k-mer matrix and the parameters of the model and of its evaluation
+# the genomes to predict (-n or -b) are predicted on every run, with the k-mer counts already in memory when there are any
+
+STATE_NAME = "pipeline_state.json"
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+#    start_dir: the directory from which the script was run
+# returns: genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, model_name, output_file_name, test_size,
+#          num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, genome_name, batch, predictions_file,
+#          jobs, counter, cache_dir, cache_max_size, checkpoint_dir, force
+def parseParams(args, start_dir):
+    # setting default values for parameters:
+    genomes_dir = start_dir + "/" # (-g) the directory with the genomes as .fasta files
+    kmc_out_dir = genomes_dir + "kmc_output/" # (-k) the directory for storing the output files of KMC
+    kmr_size = 10 # (-s) the size of the k-mers
+    df_name = "kmr_df" # (-d) the name of the feature store written to the checkpoint directory
+    dictionary_name = "kmr_vocabulary.npy" # (-i) the name of the vocabulary written to the checkpoint directory
+    model_name = "ct_model.sav" # (-m) the name of the model written to the checkpoint directory (a .forest name stores a flat forest)
+    output_file_name = "output_file_trainModel.json" # (-f) the name of the JSON file to which to write the evaluation of the model
+    test_size = 0.2 # (-ts) the test size for the train test split of the data
+    num_trees = 400 # (-nt) number of trees
+    tree_depth = None # (-td) tree depth
+    row_subsampling = 0.25 # (-rs) row subsampling
+    max_features = 1.0 # (-mx) the number (or fraction, "sqrt" or "log2") of features considered at every split
+    intervals = evaluation.INTERVALS # (-iv) the intervals to compute the accuracy of the model within
+    num_resamples = 1000 # (-bs) the number of bootstrap resamples for the confidence intervals of the evaluation
+    genome_name = "" # (-n) the name of the file in genomes_dir containing a genome to predict the Ct value of
+    batch = "" # (-b) instead of -n, a directory, glob pattern, or manifest file of genomes to predict
+    predictions_file = "ct_predictions.csv" # (-o) the file to write the predictions of a batch to (.csv or .jsonl)
+    jobs = 1 # (-j) the number of genomes to count and of trees to fit in parallel
+    counter = "kmc" # (-cn) the k-mer counter to use: "kmc" or "python" (counting in-process with kmerCounter.py)
+    cache_dir = None # (-cd) the directory of the k-mer count cache (see kmerCache.py)
+    cache_max_size = kmerCache.DEFAULT_MAX_SIZE # (-cm) the maximal size of the k-mer count cache in MB
+    checkpoint_dir = None # (-ck) the directory to write the artifacts of the stages to, stages with unchanged inputs are skipped
+    force = False # (-fo) run every stage even if its inputs did not change
+
+    # required parameter:
+    csv_path = "" # (-c) required, the path to the .csv file containg the genome_id, instrument and Ct value of the genomes
+
+    # parsing any parameters passed in through the command line
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (args[i] == "-fo" or args[i] == "--force"):
+            force = True
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-g" or args[i] == "--genomes_dir"):
+            genomes_dir = args[i + 1]
+            if (genomes_dir[-1] != "/"):
+                genomes_dir = genomes_dir + "/"
+            kmc_out_dir = genomes_dir + "kmc_output/"
+        elif (args[i] == "-k" or args[i] == "--kmc_out_dir"):
+            kmc_out_dir = args[i + 1]
+            if (kmc_out_dir[-1] != "/"):
+                kmc_out_dir = kmc_out_dir + "/"
+        elif (args[i] == "-s" or args[i] == "--kmr_size"):
+            kmr_size = int(args[i + 1])
+        elif (args[i] == "-c" or args[i] == "--csv_path"):
+            csv_path = args[i + 1]
+        elif (args[i] == "-d" or args[i] == "--df_name"):
+            df_name = args[i + 1]
+        elif (args[i] == "-i" or args[i] == "--dictionary_name"):
+            dictionary_name = args[i + 1]
+        elif (args[i] == "-m" or args[i] == "--model_name"):
+            model_name = args[i + 1]
+        elif (args[i] == "-f" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-ts" or args[i] == "--test_size"):
+            test_size = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+        elif (args[i] == "-td" or args[i] == "--tree_depth"):
+            tree_depth = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-rs" or args[i] == "--row_subsampling"):
+            row_subsampling = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-mx" or args[i] == "--max_features"):
+            max_features = trainModel.parseMaxFeatures(args[i + 1])
+        elif (args[i] == "-iv" or args[i] == "--intervals"):
+            intervals = evaluation.parseIntervals(args[i + 1])
+        elif (args[i] == "-bs" or args[i] == "--bootstrap"):
+            num_resamples = int(args[i + 1])
+        elif (args[i] == "-n" or args[i] == "--genome_name"):
+            genome_name = args[i + 1]
+        elif (args[i] == "-b" or args[i] == "--batch"):
+            batch = args[i + 1]
+        elif (args[i] == "-o" or args[i] == "--output"):
+            predictions_file = args[i + 1]
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            jobs = int(args[i + 1])
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+        elif (args[i] == "-cd" or args[i] == "--cache_dir"):
+            cache_dir = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cm" or args[i] == "--cache_max_size"):
+            cache_max_size = float(args[i + 1])
+        elif (args[i] == "-ck" or args[i] == "--checkpoint_dir"):
+            checkpoint_dir = os.path.abspath(args[i + 1])
+
+    if (csv_path == ""):
+        print("Error: csv_path (-c) (required parameter) not entered")
+        sys.exit()
+    if (counter not in ["kmc", "python"]):
+        print("Error: unknown counter (-cn)", counter, "(must be kmc or python)")
+        sys.exit()
+
+    return genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, genome_name, batch, predictions_file, jobs, counter, cache_dir, cache_max_size, checkpoint_dir, force
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-g --genomes_dir:\tthe directory with the genomes as .fasta files. The default is the directory from which the script is run"
+    s+= "\n-k --kmc_out_dir:\tthe directory for storing the output files of KMC. The default is '<genomes_dir>/kmc_output/'"
+    s+= "\n-s --kmr_size:\tthe size of the k-mers. The default is 10"
+    s+= "\n-c --csv_path:\tthe path to the .csv metadata file with the genome_id, instrument and Ct value of the genomes. There is no default for this option."
+    s+= "\n-d --df_name:\tthe name of the feature store written to the checkpoint directory. The default is 'kmr_df'"
+    s+= "\n-i --dictionary_name:\tthe name of the vocabulary written to the checkpoint directory. The default is 'kmr_vocabulary.npy'"
+    s+= "\n-m --model_name:\tthe name of the model written to the checkpoint directory, a name ending in .forest stores a flat forest. The default is 'ct_model.sav'"
+    s+= "\n-f --output_file_name:\tthe name of the JSON file to which to write the evaluation of the model. The default is 'output_file_trainModel.json'"
+    s+= "\n-ts --test_size:\tthe test size for the train test split of the data. The default is 0.2"
+    s+= "\n-nt --num_trees:\tthe number of trees of the model. The default is 400"
+    s+= "\n-td --tree_depth:\tthe maximal depth of the trees. The default is None"
+    s+= "\n-rs --row_subsampling:\tthe fraction of the rows every tree is fit on. The default is 0.25"
+    s+= "\n-mx --max_features:\tthe number (or fraction, sqrt or log2) of features considered at every split. The default is 1.0"
+    s+= "\n-iv --intervals:\tthe comma-separated intervals to compute the accuracy of the model within. The default is " + ",".join(str(interval) for interval in evaluation.INTERVALS)
+    s+= "\n-bs --bootstrap:\tthe number of bootstrap resamples for the confidence intervals of the evaluation. The default is 1000"
+    s+= "\n-n --genome_name:\tthe name of the file in genomes_dir containing a genome to predict the Ct value of. There is no default for this option."
+    s+= "\n-b --batch:\tinstead of -n, a directory, glob pattern, or manifest file of genomes to predict. There is no default for this option."
+    s+= "\n-o --output:\tthe file to write the predictions of a batch to (.csv or .jsonl). The default is 'ct_predictions.csv'"
+    s+= "\n-j --jobs:\tthe number of genomes to count and of trees to fit in parallel. The default is 1"
+    s+= "\n-cn --counter:\tthe k-mer counter to use: kmc or python. The default is kmc"
+    s+= "\n-cd --cache_dir:\tthe directory of the k-mer count cache (see kmerCache.py). The default is no cache"
+    s+= "\n-cm --cache_max_size:\tthe maximal size of the k-mer count cache in MB. The default is " + str(kmerCache.DEFAULT_MAX_SIZE)
+    s+= "\n-ck --checkpoint_dir:\tthe directory to write the vocabulary, the feature store and the model to. Stages whose inputs did not change since the last run are skipped. The default is no checkpoints"
+    s+= "\n-fo --force:\trun every stage even if its inputs did not change"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# computes the fingerprint of the inputs of a stage
+# parameters:
+#    parts: the values the stage depends on (anything that can be written as JSON)
+# returns: the hex digest of the values
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# computes the fingerprint of an artifact written by a stage from the size and modification time of its files
+# parameters:
+#    path: the path to the artifact (a file, or a directory like the feature store)
+# returns: the hex digest, or None if the artifact does not exist
+def artifactFingerprint(path):
+    if (os.path.isfile(path)):
+        stat = os.stat(path)
+        return fingerprint(stat.st_size, stat.st_mtime_ns)
+    if (not os.path.isdir(path)):
+        return None
+    files = []
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            stat = os.stat(os.path.join(dir_path, file_name))
+            files.append([os.path.relpath(os.path.join(dir_path, file_name), path), stat.st_size, stat.st_mtime_ns])
+    return fingerprint(sorted(files))
+
+
+# reads the state of the last run from the checkpoint directory
+# returns: a dictionary of stage : {"inputs": fingerprint, "artifact": fingerprint}, empty without checkpoints or a previous run
+def loadState(checkpoint_dir):
+    if (checkpoint_dir is None):
+        return {}
+    try:
+        with open(os.path.join(checkpoint_dir, STATE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# writes the state of the run to the checkpoint directory, under a temporary name first
+def storeState(checkpoint_dir, state):
+    path = os.path.join(checkpoint_dir, STATE_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# checks whether a stage has to run
+# a stage is up to date if the fingerprint of its inputs is the one recorded when its artifact was written, and the artifact
+#  was not changed or removed since
+# parameters:
+#    state: the state of the last run (see loadState)
+#    stage: the name of the stage
+#    inputs: the fingerprint of the inputs of the stage
+#    artifact_path: the path to the artifact of the stage, or None without checkpoints
+#    force: True to run every stage
+# returns: True if the stage has to run
+def isStale(state, stage, inputs, artifact_path, force):
+    if (force or artifact_path is None or stage not in state):
+        return True
+    return state[stage].get("inputs") != inputs or state[stage].get("artifact") != artifactFingerprint(artifact_path)
+
+
+# records that a stage wrote its artifact
+def recordStage(checkpoint_dir, state, stage, inputs, artifact_path):
+    state[stage] = {"inputs": inputs, "artifact": artifactFingerprint(artifact_path)}
+    storeState(checkpoint_dir, state)
+
+
+# counts the k-mers of the genomes (the same way as predictCt.py counts a batch, see predictCt.countBatch)
+# parameters:
+#    genome_files: the manifest of the genome files (see createDataFrame.listGenomes)
+#    kmc_out_dir, kmr_size, jobs, counter, cache_dir: see parseParams
+# returns: a dictionary of genome_id : (encoded k-mers, frequencies), and a dictionary of genome_id : error message for the
+#          genomes that could not be counted
+def countGenomes(genome_files, kmc_out_dir, kmr_size, jobs, counter, cache_dir):
+    genomes = list(zip(genome_files["genome_id"], genome_files["path"]))
+    counts, failures = predictCt.countBatch(genomes, kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+    for genome_id, error in failures.items():
+        print("  Warning: the k-mers of", genome_id, "could not be counted:", error)
+    return counts, failures
+
+
+# creates the sparse k-mer matrix from the k-mer counts in memory, with the same rows and columns as createDataFrame.py
+#  (the genomes found in the metadata file, one column for every k-mer of the vocabulary and the 3 instrument columns last)
+# parameters:
+#    counts: a dictionary of genome_id : (encoded k-mers, frequencies) (see countGenomes)
+#    vocabulary: the array of encoded k-mers (k-mer : column number)
+#    csv_path: the path to the metadata file
+# returns: the sparse k-mer matrix (CSR), the genome_id and the Ct value of every row
+def createMatrix(counts, vocabulary, csv_path):
+    metadata = metadataIndex.loadMetadata(csv_path)
+    genome_ids = sorted(counts)
+    instruments, cts, found = metadataIndex.lookupGenomes(metadata, genome_ids)
+    genome_ids = [genome_id for genome_id, in_metadata in zip(genome_ids, found) if in_metadata]
+    kmr_matrix, instruments = predictCt.createMatrix(counts, genome_ids, vocabulary, metadata)
+    return kmr_matrix, np.array(genome_ids, dtype=str), np.asarray(cts[found], dtype=np.float64)
+
+
+# trains the model on the k-mer matrix and evaluates it on the test set (like trainModel.py)
+# parameters:
+#    kmr_matrix, ct_values: the sparse k-mer matrix and the Ct value of every row
+#    output_file_path: the path to the JSON file to which to write the evaluation of the model
+#    test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, jobs: see parseParams
+# returns: the fitted model and the evaluation report
+def trainStage(kmr_matrix, ct_values, output_file_path, test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, jobs):
+    # dropping any rows without a Ct value
+    has_ct = ~np.isnan(ct_values)
+    train_set, train_labels, test_set, test_labels = trainModel.splitDf(kmr_matrix[has_ct], np.asarray(ct_values)[has_ct], test_size)
+    model = trainModel.fitModel(train_set, train_labels, num_trees, tree_depth, row_subsampling, max_features, jobs, "threading")
+    report = trainModel.evaluateModel(model, test_set, test_labels, output_file_path, intervals, num_resamples)
+    return model, report
+
+
+# main function
+# counts the k-mers of the genomes, creates the vocabulary and the sparse k-mer matrix, trains and evaluates the model and
+#  predicts the Ct values of the genomes passed with -n or -b, in one process
+def main(argv):
+    # current working directory:
+    start_dir = os.getcwd()
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "pipeline.py")
+    # reads in parameters passed in by user through the command line or setting paramters to default values
+    genomes_dir, kmc_out_dir, kmr_size, csv_path, df_name, dictionary_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, genome_name, batch, predictions_file, jobs, counter, cache_dir, cache_max_size, checkpoint_dir, force = parseParams(args, start_dir)
+
+    # the artifacts of the stages are only written (and stages only skipped) with a checkpoint directory
+    vocabulary_path = store_dir = model_path = None
+    if (checkpoint_dir is not None):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        vocabulary_path = os.path.join(checkpoint_dir, dictionary_name)
+        store_dir = os.path.join(checkpoint_dir, df_name)
+        model_path = os.path.join(checkpoint_dir, model_name)
+    state = loadState(checkpoint_dir)
+
+    # the fingerprints of the inputs of the stages; a stage depends on the artifact of the stage before it, so a stage that
+    #  runs again makes every later stage run again
+    genome_files = createDataFrame.listGenomes(genomes_dir).sort_values("genome_id", ignore_index=True)
+    genome_rows = genome_files.values.tolist()
+    csv_stat = os.stat(csv_path)
+    vocabulary_inputs = fingerprint("vocabulary", genome_rows, kmr_size, counter)
+    run_vocabulary = isStale(state, "vocabulary", vocabulary_inputs, vocabulary_path, force)
+    matrix_inputs = fingerprint("matrix", None if run_vocabulary else state["vocabulary"]["artifact"], genome_rows, kmr_size, counter, csv_stat.st_size, csv_stat.st_mtime_ns)
+    run_matrix = run_vocabulary or isStale(state, "matrix", matrix_inputs, store_dir, force)
+    model_inputs = fingerprint("model", None if run_matrix else state["matrix"]["artifact"], test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, output_file_name)
+    run_model = run_matrix or isStale(state, "model", model_inputs, model_path, force)
+
+    counts = {}
+    failures = {}
+    if (run_vocabulary or run_matrix):
+        start = time.perf_counter()
+        with profiling.stage("count"):
+            counts, failures = countGenomes(genome_files, kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+        print("--pipeline.py-- counted the k-mers of", len(genome_files), "genomes (", len(failures), "failed ) in", round(time.perf_counter() - start, 2), "s")
+
+    # the vocabulary of encoded k-mers (k-mer : column number), the union of the k-mers of all genomes:
+    if (run_vocabulary):
+        start = time.perf_counter()
+        with profiling.stage("vocabulary"):
+            vocabulary = kmerCounts.unionCodes(codes for codes, frequencies in counts.values())
+        print("--pipeline.py-- created vocabulary of", len(vocabulary), "k-mers in", round(time.perf_counter() - start, 2), "s")
+        if (checkpoint_dir is not None):
+            kmerCounts.storeVocabulary(vocabulary, vocabulary_path)
+            recordStage(checkpoint_dir, state, "vocabulary", vocabulary_inputs, vocabulary_path)
+            # the matrix depends on the vocabulary just written
+            matrix_inputs = fingerprint("matrix", state["vocabulary"]["artifact"], genome_rows, kmr_size, counter, csv_stat.st_size, csv_stat.st_mtime_ns)
+    else:
+        vocabulary = kmerCounts.loadVocabulary(vocabulary_path, kmr_size)
+        print("--pipeline.py-- skipped the vocabulary (inputs unchanged), loaded '", vocabulary_path, "'")
+
+    # the sparse k-mer matrix (only needed to train the model):
+    if (run_matrix):
+        start = time.perf_counter()
+        with profiling.stage("matrix"):
+            kmr_matrix, genome_ids, ct_values = createMatrix(counts, vocabulary, csv_path)
+        print("--pipeline.py-- created k-mer matrix of", kmr_matrix.shape[0], "genomes in", round(time.perf_counter() - start, 2), "s")
+        if (checkpoint_dir is not None):
+            createDataFrame.storeDataFrame(kmr_matrix, genome_ids, ct_values, vocabulary, kmr_size, checkpoint_dir, df_name, genome_files)
+            recordStage(checkpoint_dir, state, "matrix", matrix_inputs, store_dir)
+            model_inputs = fingerprint("model", state["matrix"]["artifact"], test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, output_file_name)
+    elif (run_model):
+        kmr_matrix, genome_ids, ct_values, header = featureStore.loadFeatureStore(store_dir)
+        print("--pipeline.py-- skipped the k-mer matrix (inputs unchanged), loaded '", store_dir, "'")
+    else:
+        print("--pipeline.py-- skipped the k-mer matrix (inputs unchanged)")
+
+    # the model and its evaluation:
+    if (run_model):
+        start = time.perf_counter()
+        with profiling.stage("train"):
+            model, report = trainStage(kmr_matrix, ct_values, os.path.join(start_dir, output_file_name), test_size, num_trees, tree_depth, row_subsampling, max_features, intervals, num_resamples, jobs)
+        print("--pipeline.py-- trained the model in", round(time.perf_counter() - start, 2), "s  RMSE:", report["overall"].get("rmse"), " R2:", report["overall"].get("r2"))
+        if (checkpoint_dir is not None):
+            modelStore.storeModel(model, model_path)
+            recordStage(checkpoint_dir, state, "model", model_inputs, model_path)
+    elif (genome_name != "" or batch != ""):
+        # the model is only loaded if genomes are predicted with it below
+        model = modelStore.loadModel(model_path)
+        print("--pipeline.py-- skipped the model (inputs unchanged), loaded '", model_path, "'")
+    else:
+        print("--pipeline.py-- skipped the model (inputs unchanged)")
+
+    # predicting the genomes passed with -n or -b, with their k-mer counts from above when they were counted
+    if (genome_name != "" or batch != ""):
+        if (batch != ""):
+            genomes = predictCt.listBatchGenomes(batch)
+        else:
+            genome_id = fastaReader.fastaGenomeId(genome_name) or genome_name
+            genomes = [(genome_id, os.path.join(genomes_dir, genome_name))]
+        with profiling.stage("predict"):
+            to_count = [(genome_id, path) for genome_id, path in genomes if genome_id not in counts and genome_id not in failures]
+            if (len(to_count) > 0):
+                new_counts, new_failures = predictCt.countBatch(to_count, kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+                counts.update(new_counts)
+                failures.update(new_failures)
+            results = predictCt.predictCounts([genome_id for genome_id, path in genomes], counts, failures, vocabulary,
+                                              metadataIndex.loadMetadataCached(csv_path), modelStore.compileModel(model))
+        if (batch != ""):
+            predictCt.writePredictions(predictions_file, results)
+            print("--pipeline.py-- stored the predictions of", len(results), "genomes as '", predictions_file, "'")
+        elif (results[0]["error"] is not None):
+            print("Error: the k-mers of", genome_name, "could not be counted:", results[0]["error"])
+        else:
+            print("\n\nGenome: ", results[0]["genome_id"], "  Ct value prediction:  ", str(results[0]["ct_prediction"]))
+
+    if (cache_dir is not None):
+        kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
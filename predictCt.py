@@ -2,22 +2,47 @@ import sys
 import os
 import numpy as np
 import pandas as pd
-import pickle
+import glob
+import itertools
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+
+import fastaReader
+import kmerCache
+import kmerCounter
+import kmerCounts
+import metadataIndex
+import modelStore
+import profiling
+from runKMC import runKMCGenome
+
+# the number of records of a multi-FASTA file that are counted and predicted together (bounds the memory used)
+RECORDS_PER_CHUNK = 1000
 
 # this function parses any parameters passed in through the command line or sets them to a default value
 # parameters:
 #    args: the list of arguments passed in through the command line
-# returns: genomes_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name
+# returns: genomes_dir, kmc_out_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name, batch, output_file_name, jobs, counter, multi_fasta, cache_dir, cache_max_size
 def parseParams(args, start_dir):
     # setting default values for parameters:
     genomes_dir = start_dir + "/" # (-g) the directory containing the genome to predict the Ct value for
     kmc_out_dir = genomes_dir + "kmc_output/" # (-k) the directory in which the output files of KMC are stored
     kmr_size = 10 # (-s) the size of the k-mer to run KMC with. Must be identical to the size used to construct the model
-    dictionary_name = start_dir + "/kmr_dictionary.pkl" # (-i) the name of the stored dictionary (k-mer : column number)
+    dictionary_name = start_dir + "/kmr_vocabulary.npy" # (-i) the name of the stored vocabulary (k-mer : column number)
     model_name = start_dir + "/ct_model.sav" # (-m) the name of the stored Ct value prediction model
+    output_file_name = "ct_predictions.csv" # (-o) the file to write the predictions of a batch to (.csv or .jsonl)
+    jobs = 1 # (-j) the number of genomes of a batch to run KMC on in parallel
+    counter = "kmc" # (-cn) the k-mer counter to use: "kmc" (running KMC) or "python" (counting in-process with kmerCounter.py)
+    cache_dir = None # (-cd) the directory of the k-mer count cache (see kmerCache.py), genomes in the cache are not counted again
+    cache_max_size = kmerCache.DEFAULT_MAX_SIZE # (-cm) the maximal size of the k-mer count cache in MB
 
     # required_parameter:
     genome_name = "" # (-n) required, the name of the file containing the genome (must be in .fasta format)
+    batch = "" # (-b) instead of -n, a directory, glob pattern, or manifest file (one .fasta path per line) of genomes to predict
+    multi_fasta = "" # (-mf) instead of -n, a multi-FASTA file (optionally gzip or bgzip compressed) whose records are the genomes to predict
     csv_path = "" # (-c) required, the path to the .csv file containg the MCoV-id and instrument for all files in genomes_dir
 
     # parsing any parameters passed in through the command line
@@ -35,7 +60,7 @@ def parseParams(args, start_dir):
             kmc_out_dir = args[i + 1]
             kmc_out_dir = os.path.abspath(kmc_out_dir) + "/"
         elif (args[i] == "-s" or args[i] == "--kmr_size"):
-            kmr_size = args[i + 1]
+            kmr_size = int(args[i + 1])
         elif(args[i] == "-c"or args[i] == "--csv_path"):
             csv_path = args[i + 1]
             csv_path = os.path.abspath(csv_path)
@@ -47,107 +72,364 @@ def parseParams(args, start_dir):
             model_name = os.path.abspath(model_name)
         elif (args[i] == "-n" or args[i] == "--genome_name"):
             genome_name = args[i + 1]
+        elif (args[i] == "-b" or args[i] == "--batch"):
+            batch = args[i + 1]
+        elif (args[i] == "-o" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            jobs = max(1, int(args[i + 1]))
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+        elif (args[i] == "-mf" or args[i] == "--multi_fasta"):
+            multi_fasta = args[i + 1]
+        elif (args[i] == "-cd" or args[i] == "--cache_dir"):
+            cache_dir = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cm" or args[i] == "--cache_max_size"):
+            cache_max_size = float(args[i + 1])
 
 
 
     # exitting the script if the required parameters were not passed in
-    if (genome_name == "" or csv_path == ""):
-        print("Error: required parameter not entered (csv_parh (-c) or genome_name (-n))")
+    if ((genome_name == "" and batch == "" and multi_fasta == "") or csv_path == ""):
+        print("Error: required parameter not entered (csv_parh (-c) or genome_name (-n) / batch (-b) / multi_fasta (-mf))")
+        sys.exit()
+    if (counter not in ["kmc", "python"]):
+        print("Error: unknown counter (-cn)", counter, "(must be kmc or python)")
         sys.exit()
 
 
-    return genomes_dir, kmc_out_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name
+    return genomes_dir, kmc_out_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name, batch, output_file_name, jobs, counter, multi_fasta, cache_dir, cache_max_size
 
 
 
 # returns a string of all the options for the script if the script was called with -h or --help
 def helpOption():
-    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, the KMC executable package, and the kmc.sh script. The default is './'"
+    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, and the KMC executable package. The default is './'"
     s+= "\n-k --kmc_out_dir:\tthe directory in which the output files of KMC are stored"
     s+= "\n-s --kmr_size:\tthe size of the k-mer to run KMC with. The default is 10"
     s+= "\n-m --model_name:\tthe name of the stored Ct value prediction model. The default is 'ct_model.sav'"
-    s+= "\n-i --dictionary_name:\tthe name of the dictionary { k-mer : column number } used to create the DataFrame that the model was trained on(must be a .pkl file). The default is 'kmr_dictionary.pkl'"
+    s+= "\n-i --dictionary_name:\tthe name of the vocabulary (k-mer : column number) used to create the k-mer matrix that the model was trained on (a .npy file, or a .pkl dictionary created by older versions). The default is 'kmr_vocabulary.npy'"
     s+= "\n-n --genome_name:\tthe genome fasta file to predict the Ct value of (must be named <genome_id>.fasta). There is no default for this option."
     s+= "\n-c --csv_path:\tthe path to the metadata .csv file with the genome_id and testing instrument of the genome There is no default for this option."
+    s+= "\n-b --batch:\tinstead of -n, predict the Ct values of many genomes at once: a directory of .fasta files, a glob pattern, or a manifest file listing one .fasta path per line. There is no default for this option."
+    s+= "\n-o --output_file_name:\tthe file to write the predictions of a batch to, as .csv or (if the name ends in .jsonl) as JSON lines. The default is 'ct_predictions.csv'"
+    s+= "\n-j --jobs:\tthe number of genomes of a batch to run KMC on in parallel. The default is 1"
+    s+= "\n-cn --counter:\tthe k-mer counter to use: 'kmc' (running KMC) or 'python' (counting the k-mers in-process with kmerCounter.py, without writing any files). The default is 'kmc'"
+    s+= "\n-mf --multi_fasta:\tinstead of -n, predict the Ct value of every record of a multi-FASTA file (optionally gzip or bgzip compressed), every record is one genome named by the first word of its header. The predictions are written to -o. There is no default for this option."
+    s+= "\n-cd --cache_dir:\tthe directory of the k-mer count cache shared with runKMC.py and createDataFrame.py (see kmerCache.py). A genome whose counts for the k-mer size are in the cache is not counted again. The default is no cache"
+    s+= "\n-cm --cache_max_size:\tthe maximal size of the k-mer count cache in MB, the least recently used genomes are removed after the run. The default is " + str(kmerCache.DEFAULT_MAX_SIZE)
+    s+= "\n" + profiling.helpOption()
     return s
 
 
-# runs KMC on the genome file to compute a list of the unique k-mers to be used by the model to predict the Ct value
+# creates the feature row of the input genome with the same features as the matrix the model was trained on
+# the row is sparse: only the k-mers of the genome that are in the vocabulary and the instrument are stored (see rowFeatures),
+#  k-mers that are not in the vocabulary (e.g. dropped by selectFeatures.py) are ignored
 # parameters:
-#    genomes_dir: the directory containing genome_name (the name of the genome file in .fasta format)
-#    kmr_size: the size of the k-mers to be used when running KMC (should be the same size as used to create the model)
-def runKMC(genomes_dir, genome_name, kmr_size, kmc_out_dir):
-    # run KMC on genome_name
-    out_file = genome_name.replace(".fasta", "_kmc")
-
-    # running KMC:
-    os.chdir(genomes_dir)
-    cmd = 'kmc.sh' + ' ' + str(kmr_size) + ' ' + genome_name + ' ' + out_file + ' ' + kmc_out_dir
-    os.system(cmd)
-
-    # deleting the temprorary files created by kmc:
-    os.system('rm ' + out_file + '.kmc_pre')
-    os.system('rm ' + out_file + '.kmc_suf')
-
-    # returning the name of the output file of KMC containing the frequency of unique 10-mers
-    return genome_name.strip(".fasta") + "_kmc." + str(kmr_size) + ".kmrs"
-
-
-# creates a 1D numpy array from the k-mer counts of the input genome with the same features as the matrix the model was trained on
+#    codes: the encoded k-mers of the genome (read from the output file of KMC, or counted by kmerCounter.py)
+#    frequencies: the frequency of every k-mer
+#    genome_id: the genome_id of the genome
+#    vocabulary: the array of encoded k-mers (k-mer : column number) used to construct the matrix the model was trained on
+#    kmr_size: the size of the k-mers
+#    metadata: the metadata (instruments and MCoV-ids) indexed by genome_id (see metadataIndex.py)
+# returns: the row as a sparse matrix (CSR) with one row, the k-mer columns followed by the instrument columns
+def createRow(codes, frequencies, genome_id, vocabulary, kmr_size, metadata):
+    # getting the instrument corresponding to the MCoV-id
+    instrument = metadataIndex.getInstrument(metadata, genome_id)
+    features = rowFeatures(kmerCounts.vocabularyLookup(vocabulary), len(vocabulary), codes, frequencies, instrument)
+    return stackRows([features], len(vocabulary))
+
+
+# lists the genomes of a batch
 # parameters:
-#    kmc_out_dir: the directory containing kmr_output_file (the output file of KMC with the list of unique k-mers)
-#    kmr_dictionary: the dictionary of k-mer : column number used to construct the matrix the model was trained on
-#    csv_path: the path to the file containing the instruments and MCoV-ids
-def createRow(kmc_out_dir, kmr_output_file, kmr_dictionary, kmr_size, csv_path):
-    # initalizing the row to have all 0s:
-    row = []
-    for i in range(len(kmr_dictionary)):
-        row.append(0)
-
-    # reads in the output file of kmc one k-mer at a time and updates the corresponding spot in row
-    file = open((kmc_out_dir + kmr_output_file), "r")
-    for aline in file:
-        # getting the k-mer and k-mer frequency for every line:
-        kmr = aline.split()[0]
-        frequency = aline.split()[1]
-        # getting the column number of the k-mer from the dictionary:
-        col_num = kmr_dictionary[kmr]
-        # updating the right index with the frequency of the k-mer:
-        row[col_num] = frequency
-
-    # adding the instrument:
-    genome_id = kmr_output_file.strip("_kmc." + str(kmr_size) + ".kmrs")
-    instrument = getInstrument(csv_path, genome_id) # getting the instrument corresponding to the MCoV-id
-
-    for i in range(3):
-        row.insert(0, 0) # adding 3 columns initialized to 0 for the instrument
-
-    if (instrument == "ALINITY"):
-        row[0] = 1
-    elif (instrument == "PANTHER"):
-        row[1] = 1
-    elif (instrument == "CEPHEID"):
-        row[2] = 1
-
-    # returning the row as a 1D numpy array
-    return np.array(row).reshape(1, -1)
-
-
-# returns the instrument corresponding to the passed in MCoV-id
+#    batch: a directory of .fasta files, a glob pattern matching .fasta files, or a manifest file with one .fasta path per line
+#           (relative paths in a manifest are relative to the manifest's directory)
+# returns: a list of (genome_id, path) for every genome, the genome_id being the file name without .fasta
+def listBatchGenomes(batch):
+    if (os.path.isdir(batch)):
+        paths = sorted(path for path in glob.glob(os.path.join(batch, "*")) if fastaReader.fastaGenomeId(path) is not None)
+    elif (os.path.isfile(batch) and fastaReader.fastaGenomeId(batch) is None):
+        manifest_dir = os.path.dirname(os.path.abspath(batch))
+        with open(batch) as f:
+            paths = [os.path.join(manifest_dir, line.strip()) for line in f if line.strip() != ""]
+    else:
+        paths = sorted(glob.glob(batch))
+
+    genomes = []
+    for path in paths:
+        genome_id = fastaReader.fastaGenomeId(path) or os.path.basename(path)
+        genomes.append((genome_id, os.path.abspath(path)))
+    return genomes
+
+
+# runs KMC on every genome of a batch whose KMC output is missing or older than its .fasta file (see runKMC.py)
 # parameters:
-#    csv_path: the directory to the file containing information on the MCoV-ids and the instrument
-#    mcovid: the MCoV-id for which to find the instruments
-# returns: the instrument
-def getInstrument(csv_path, genome_id):
-    data_labels = pd.read_csv(csv_path)
-    for index, row in data_labels.iterrows():
-        if (row["Genome ID"] == genome_id):
-            return row["Instrument"]
-
+#    genomes: the list of (genome_id, path) of the batch
+#    kmc_out_dir: the directory to store the output files of KMC in
+#    kmr_size: the size of the k-mers to run KMC with
+#    jobs: the number of genomes to run KMC on in parallel
+# returns: a dictionary of genome_id : error message for every genome for which KMC failed
+def runKMCBatch(genomes, kmc_out_dir, kmr_size, jobs):
+    os.makedirs(kmc_out_dir, exist_ok=True)
+    threads_per_job = max(1, (os.cpu_count() or 1) // jobs)
+    to_count = []
+    for genome_id, path in genomes:
+        kmrs_path = kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size)
+        if (not os.path.exists(kmrs_path) or os.path.getmtime(kmrs_path) < os.path.getmtime(path)):
+            to_count.append((genome_id, path))
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(runKMCGenome, path, genome_id, kmc_out_dir, kmr_size, threads_per_job) for genome_id, path in to_count]
+        for (genome_id, path), future in zip(to_count, futures):
+            try:
+                genome_id, error, seconds = future.result()
+            except Exception as e: # one genome that cannot be counted does not stop the batch
+                error = str(e)
+            if (error != None):
+                failures[genome_id] = error
+    return failures
+
+
+# maps the k-mer counts and the instrument of one genome to the columns of the matrix the model was trained on
+#  (the k-mer columns followed by the 3 one-hot encoded instrument columns), k-mers that are not in the vocabulary are skipped
+# parameters:
+#    lookup: the table returned by kmerCounts.vocabularyLookup for the vocabulary
+#    num_kmrs: the number of k-mers in the vocabulary
+#    codes: the encoded k-mers of the genome
+#    frequencies: the frequency of every k-mer of the genome
+#    instrument: the testing instrument of the genome
+# returns: the column numbers and the values of the non-zero features of the genome
+def rowFeatures(lookup, num_kmrs, codes, frequencies, instrument):
+    col_nums = kmerCounts.columnIds(lookup, codes)
+    known = col_nums >= 0
+    col_nums = col_nums[known]
+    frequencies = np.asarray(frequencies, dtype=np.uint32)[known]
+    if (instrument in metadataIndex.INSTRUMENTS):
+        col_nums = np.append(col_nums, np.int32(num_kmrs + metadataIndex.INSTRUMENTS.index(instrument)))
+        frequencies = np.append(frequencies, np.uint32(1))
+    return col_nums, frequencies
+
+
+# stacks the features of several genomes (see rowFeatures) into one sparse matrix
+# parameters:
+#    rows: a list of (column numbers, values) with one entry per genome
+#    num_kmrs: the number of k-mers in the vocabulary
+# returns: the sparse matrix (CSR), one row per genome
+def stackRows(rows, num_kmrs):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(col_nums) for col_nums, values in rows])
+    indices = np.concatenate([col_nums for col_nums, values in rows]) if len(rows) > 0 else np.zeros(0, dtype=np.int32)
+    data = np.concatenate([values for col_nums, values in rows]) if len(rows) > 0 else np.zeros(0, dtype=np.uint32)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(rows), num_kmrs + len(metadataIndex.INSTRUMENTS)))
+    matrix.sort_indices()
+    return matrix
+
+
+# counts the k-mers of every genome of a batch, with KMC (reading its output files) or in-process with kmerCounter.py
+# parameters:
+#    genomes: the list of (genome_id, path) of the batch
+#    kmc_out_dir: the directory to store the output files of KMC in
+#    kmr_size: the size of the k-mers
+#    jobs: the number of genomes to count in parallel
+#    counter: "kmc" or "python"
+#    cache_dir: optional, the directory of the k-mer count cache (see kmerCache.py), the genomes in the cache are not counted
+#               and the counts of the others are added to it
+# returns: a dictionary of genome_id : (encoded k-mers, frequencies) for every counted genome and a dictionary of
+#  genome_id : error message for every genome that could not be counted
+def countBatch(genomes, kmc_out_dir, kmr_size, jobs, counter, cache_dir=None):
+    if (cache_dir is not None):
+        cached = {}
+        keys = {}
+        for genome_id, path in genomes:
+            try:
+                keys[genome_id] = kmerCache.genomeKey(path, kmr_size, counter)
+            except (OSError, ValueError): # the genome fails to be counted below
+                continue
+            genome_counts = kmerCache.loadCounts(cache_dir, keys[genome_id])
+            if (genome_counts is not None):
+                cached[genome_id] = genome_counts
+        counts, failures = countBatch([(genome_id, path) for genome_id, path in genomes if genome_id not in cached], kmc_out_dir, kmr_size, jobs, counter)
+        for genome_id, (codes, frequencies) in counts.items():
+            if (genome_id in keys):
+                kmerCache.storeCounts(cache_dir, keys[genome_id], codes, frequencies)
+        counts.update(cached)
+        return counts, failures
+
+    if (counter == "kmc"):
+        failures = runKMCBatch(genomes, kmc_out_dir, kmr_size, jobs)
+        counts = {}
+        for genome_id, path in genomes:
+            if (genome_id not in failures):
+                counts[genome_id] = kmerCounts.readKmrsCodes(kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size), kmr_size)
+        return counts, failures
+
+    def countGenome(path):
+        try:
+            return kmerCounter.countFastaFile(path, kmr_size), None
+        except (OSError, ValueError) as e:
+            return None, str(e)
+
+    counts = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for (genome_id, path), (genome_counts, error) in zip(genomes, pool.map(countGenome, [path for genome_id, path in genomes])):
+            if (error is None):
+                counts[genome_id] = genome_counts
+            else:
+                failures[genome_id] = error
+    return counts, failures
+
+
+# creates a sparse matrix (one row per genome) from the k-mer counts of a batch of genomes, with the same features as the
+#  matrix the model was trained on
+# parameters:
+#    counts: a dictionary of genome_id : (encoded k-mers, frequencies) (see countBatch)
+#    genome_ids: the genome_ids of the batch
+#    vocabulary: the array of encoded k-mers (k-mer : column number) used to construct the matrix the model was trained on
+#    metadata: the metadata (instruments and MCoV-ids) indexed by genome_id (see metadataIndex.py)
+# returns: the sparse matrix (CSR) and the instrument of every genome
+def createMatrix(counts, genome_ids, vocabulary, metadata):
+    lookup = kmerCounts.vocabularyLookup(vocabulary)
+    instruments, cts, found = metadataIndex.lookupGenomes(metadata, genome_ids)
+
+    rows = []
+    for genome_id, instrument in zip(genome_ids, instruments):
+        codes, frequencies = counts[genome_id]
+        rows.append(rowFeatures(lookup, len(vocabulary), codes, frequencies, instrument))
+    return stackRows(rows, len(vocabulary)), instruments
+
+
+# writes the predictions of a batch as a .csv file, or as JSON lines if output_file_name ends in .jsonl
+# parameters:
+#    output_file_name: the file to write the predictions to
+#    results: a list of dictionaries with the genome_id, instrument, ct_prediction and error of every genome
+def writePredictions(output_file_name, results):
+    if (output_file_name.endswith(".jsonl")):
+        with open(output_file_name, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    else:
+        pd.DataFrame(results, columns=["genome_id", "instrument", "ct_prediction", "error"]).to_csv(output_file_name, index=False)
+
+
+# splits off the genomes whose genome_id occurred before (e.g. two records of a multi-FASTA file with the same header), which
+#  would overwrite each other's counts; they are not predicted but reported as errors, so every genome gets a result
+# parameters:
+#    genomes: the list of (genome_id, path or sequence) of the batch
+#    seen: the set of genome_ids that occurred before, the genome_ids of the batch are added to it
+# returns: the genomes with a new genome_id and a list of the error results of the others
+def dropDuplicates(genomes, seen):
+    unique = []
+    duplicates = []
+    for genome_id, genome in genomes:
+        if (genome_id in seen):
+            duplicates.append({"genome_id": genome_id, "instrument": None, "ct_prediction": None, "error": "duplicate genome_id, only its first genome is predicted"})
+        else:
+            seen.add(genome_id)
+            unique.append((genome_id, genome))
+    if (len(duplicates) > 0):
+        print("--predictCt.py-- skipped", len(duplicates), "genomes with a duplicate genome_id:", ", ".join(sorted(set(result["genome_id"] for result in duplicates))))
+    return unique, duplicates
+
+
+# predicts the Ct values of a batch of genomes with one call to the model
+# parameters:
+#    genomes: the list of (genome_id, path) of the batch
+#    kmc_out_dir: the directory to store the output files of KMC in
+#    kmr_size: the size of the k-mers
+#    vocabulary: the array of encoded k-mers used to construct the matrix the model was trained on
+#    metadata: the metadata indexed by genome_id
+#    model: the Ct value prediction model
+#    jobs: the number of genomes to count in parallel
+#    counter: "kmc" or "python" (see countBatch)
+#    cache_dir: optional, the directory of the k-mer count cache (see countBatch)
+# returns: a list of dictionaries with the genome_id, instrument, ct_prediction and error of every genome (see dropDuplicates
+#  for genomes with the same genome_id)
+def predictBatch(genomes, kmc_out_dir, kmr_size, vocabulary, metadata, model, jobs, counter="kmc", cache_dir=None):
+    genomes, duplicates = dropDuplicates(genomes, set())
+    counts, failures = countBatch(genomes, kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+    print("--predictCt.py-- counted the k-mers of", len(genomes), "genome files (", len(failures), "failed )")
+    return predictCounts([genome_id for genome_id, path in genomes], counts, failures, vocabulary, metadata, model) + duplicates
+
+
+# predicts the Ct values of counted genomes with one call to the model
+# parameters:
+#    genome_ids: the genome_ids of the batch
+#    counts: a dictionary of genome_id : (encoded k-mers, frequencies) (see countBatch)
+#    failures: a dictionary of genome_id : error message for the genomes that could not be counted
+#    vocabulary: the array of encoded k-mers used to construct the matrix the model was trained on
+#    metadata: the metadata indexed by genome_id
+#    model: the Ct value prediction model
+# returns: a list of dictionaries with the genome_id, instrument, ct_prediction and error of every genome
+def predictCounts(genome_ids, counts, failures, vocabulary, metadata, model):
+    counted = [genome_id for genome_id in genome_ids if genome_id not in failures]
+    matrix, instruments = createMatrix(counts, counted, vocabulary, metadata)
+    predictions = model.predict(matrix) if len(counted) > 0 else []
+    print("--predictCt.py-- predicted Ct values of", len(counted), "genomes")
+
+    results = []
+    for genome_id, instrument, ct_prediction in zip(counted, instruments, predictions):
+        results.append({"genome_id": genome_id, "instrument": instrument, "ct_prediction": float(ct_prediction), "error": None})
+    for genome_id in genome_ids:
+        if (genome_id in failures):
+            results.append({"genome_id": genome_id, "instrument": None, "ct_prediction": None, "error": failures[genome_id]})
+    return results
+
+
+# predicts the Ct value of every record of a multi-FASTA file
+# the records are streamed and predicted RECORDS_PER_CHUNK at a time, so only one chunk is held in memory
+# with KMC, the records of a chunk are written to temporary .fasta files in kmc_out_dir (KMC counts all records of a file together)
+# parameters:
+#    multi_fasta: the path to the (optionally gzip or bgzip compressed) multi-FASTA file
+#    kmc_out_dir: the directory to store the output files of KMC in
+#    kmr_size: the size of the k-mers
+#    vocabulary: the array of encoded k-mers used to construct the matrix the model was trained on
+#    metadata: the metadata indexed by genome_id
+#    model: the Ct value prediction model
+#    jobs: the number of genomes to count in parallel
+#    counter: "kmc" or "python"
+#    cache_dir: optional, the directory of the k-mer count cache (see countBatch)
+# returns: a list of dictionaries with the genome_id, instrument, ct_prediction and error of every record (a record whose
+#  header repeats the id of an earlier record is reported as an error, see dropDuplicates)
+def predictMultiFasta(multi_fasta, kmc_out_dir, kmr_size, vocabulary, metadata, model, jobs, counter="kmc", cache_dir=None):
+    results = []
+    seen = set()
+    records = fastaReader.readFastaRecords(multi_fasta)
+    while (True):
+        chunk = list(itertools.islice(records, RECORDS_PER_CHUNK))
+        if (len(chunk) == 0):
+            break
+        chunk, duplicates = dropDuplicates(chunk, seen)
+        results += duplicates
+        genome_ids = [genome_id for genome_id, sequence in chunk]
+
+        if (counter == "python"):
+            counts = {}
+            for genome_id, sequence in chunk:
+                counts[genome_id] = kmerCache.cachedCounts(cache_dir, sequence, kmr_size, counter, lambda: kmerCounter.countSequences([sequence], kmr_size))
+            failures = {}
+        else:
+            os.makedirs(kmc_out_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix="records_", dir=kmc_out_dir)
+            try:
+                genomes = []
+                for index, (genome_id, sequence) in enumerate(chunk):
+                    fasta_path = os.path.join(tmp_dir, str(index) + ".fasta")
+                    fastaReader.writeFastaRecord(fasta_path, genome_id, sequence)
+                    genomes.append((genome_id, fasta_path))
+                del chunk
+                counts, failures = countBatch(genomes, kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        results += predictCounts(genome_ids, counts, failures, vocabulary, metadata, model)
+        print("--predictCt.py-- predicted", len(results), "records of", multi_fasta)
+    return results
 
 
 # main function
-# predicts the Ct value of a genome
+# predicts the Ct value of a genome (or, with -b, of a batch of genomes)
 #  runs KMC on the genome to get a list of unique k-mers
 #  creates a 1D numpy array with the same features as the matrix the model was trained on
 #  predicts the Ct value of the array using the stored model
@@ -156,28 +438,61 @@ def main(argv):
     start_dir = os.getcwd()
 
     args = sys.argv
+    profiling.enableFromArgs(args, "predictCt.py")
     # reads in parameters passed in by user through the command line or setting paramters to default values
-    genomes_dir, kmc_out_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name = parseParams(args, start_dir)
-
-    # running KMC on the file containing the genome to predict
-    kmc_output_file_name = runKMC(genomes_dir, genome_name, kmr_size, kmc_out_dir)
-    print("--predictCt.py-- ran KMC on genome file")
-
-    # opening the dictionary:
-    kmr_dictionary = pickle.load(open(dictionary_name, "rb"))
-    # creating a 1D numoy array with the same features as the matrix the model was trained on:
-    row = createRow(kmc_out_dir, kmc_output_file_name, kmr_dictionary, kmr_size, csv_path)
-    print("--predictCt.py-- created numpy array from k-mer counts")
-
-    # opening the model:
-    model = pickle.load(open(model_name, 'rb'))
-
-    # predicting the ct value of the row:
-    ct_prediction = model.predict(row)
+    genomes_dir, kmc_out_dir, genome_name, kmr_size, csv_path, model_name, dictionary_name, batch, output_file_name, jobs, counter, multi_fasta, cache_dir, cache_max_size = parseParams(args, start_dir)
+
+    if (batch != "" or multi_fasta != ""):
+        # loading the vocabulary, metadata index and model (as a flat forest, see forestEngine.py) once for the whole batch:
+        with profiling.stage("load"):
+            vocabulary = kmerCounts.loadVocabulary(dictionary_name, kmr_size)
+            metadata = metadataIndex.loadMetadataCached(csv_path)
+            model = modelStore.compileModel(modelStore.loadModel(model_name))
+        with profiling.stage("predict"):
+            if (multi_fasta != ""):
+                results = predictMultiFasta(multi_fasta, kmc_out_dir, kmr_size, vocabulary, metadata, model, jobs, counter, cache_dir)
+            else:
+                results = predictBatch(listBatchGenomes(batch), kmc_out_dir, kmr_size, vocabulary, metadata, model, jobs, counter, cache_dir)
+        with profiling.stage("store"):
+            writePredictions(output_file_name, results)
+        print("--predictCt.py-- stored the predictions of", len(results), "genomes as '", output_file_name, "'")
+        if (cache_dir is not None):
+            kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
+        return
+
+    genome_id = fastaReader.fastaGenomeId(genome_name) or genome_name
+    genome_path = os.path.join(genomes_dir, genome_name)
+    with profiling.stage("count"):
+        # counting the k-mers of the genome like the genomes of a batch: with KMC (run as runKMC.py runs it) or in-process,
+        #  unless its counts are in the k-mer count cache
+        counts, failures = countBatch([(genome_id, genome_path)], kmc_out_dir, kmr_size, jobs, counter, cache_dir)
+    if (genome_id in failures):
+        print("Error: the k-mers of", genome_name, "could not be counted:", failures[genome_id])
+        sys.exit(1)
+    codes, frequencies = counts[genome_id]
+    print("--predictCt.py-- counted the k-mers of the genome file")
+    if (cache_dir is not None):
+        kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
+
+    with profiling.stage("createRow"):
+        # opening the vocabulary:
+        vocabulary = kmerCounts.loadVocabulary(dictionary_name, kmr_size)
+        # opening the metadata index (cached next to the metadata file):
+        metadata = metadataIndex.loadMetadataCached(csv_path)
+        # creating a sparse row with the same features as the matrix the model was trained on:
+        row = createRow(codes, frequencies, genome_id, vocabulary, kmr_size, metadata)
+    print("--predictCt.py-- created feature row from k-mer counts")
+
+    with profiling.stage("predict"):
+        # opening the model (as a flat forest, evaluated by forestEngine.py):
+        model = modelStore.compileModel(modelStore.loadModel(model_name))
+
+        # predicting the ct value of the row:
+        ct_prediction = model.predict(row)
     print("--predictCt.py-- predicted Ct value of genome")
 
     # printing the Ct value prediction
-    print("\n\nGenome: ", genome_name.strip(".fasta"), "  Ct value prediction:  ",  str(ct_prediction[0]))
+    print("\n\nGenome: ", genome_id, "  Ct value prediction:  ",  str(ct_prediction[0]))
 
 
 # if this is the script called by python, run main function
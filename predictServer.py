@@ -0,0 +1,434 @@
+import sys
+import os
+import json
+import time
+import queue
+import signal
+import shutil
+import tempfile
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import fastaReader
+import kmerCounter
+import kmerCounts
+import metadataIndex
+import modelStore
+import profiling
+from predictCt import rowFeatures, stackRows
+from runKMC import runKMCGenome
+
+# a local prediction service: the model and the k-mer vocabulary are loaded once and kept in memory, and Ct values are
+#  predicted for genomes sent over HTTP (and/or a Unix socket)
+# requests that arrive at the same time are collected into micro-batches, so every batch is predicted with one model.predict call
+#
+# endpoints:
+#    POST /predict: a JSON object (or a JSON list of objects, one per genome) with
+#        "genome_id": optional, used to look up the instrument in the metadata file (-c) and returned with the prediction
+#        "instrument": optional, the testing instrument (ALINITY, PANTHER or CEPHEID), overrides the metadata file
+#        and one of:
+#        "fasta": the genome as the text of a .fasta file (KMC is run on it, or it is counted in-process with -cn python)
+#        "kmrs": the text of a KMC dump (.kmrs) file with one "<k-mer> <frequency>" line per k-mer
+#        "kmers": an object of k-mer : frequency (canonical k-mers, as counted by KMC)
+#      returns {"genome_id", "instrument", "ct_prediction"} (or a list of them)
+#    GET /metrics: the request, prediction, batch and latency counters as JSON
+#    GET /health: {"status": "ok"} once the model is loaded
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: model_name, dictionary_name, kmr_size, csv_path, host, port, socket_path, batch_wait, max_batch_size, threads, counter
+def parseParams(args, start_dir):
+    # setting default values for parameters:
+    model_name = start_dir + "/ct_model.sav" # (-m) the name of the stored Ct value prediction model
+    dictionary_name = start_dir + "/kmr_vocabulary.npy" # (-i) the name of the vocabulary the model was trained with
+    kmr_size = 10 # (-s) the size of the k-mers the model was trained with
+    csv_path = "" # (-c) optional, the metadata file used to look up the instrument of a genome by its genome_id
+    host = "127.0.0.1" # (-a) the address to serve HTTP on
+    port = 8080 # (-p) the port to serve HTTP on
+    socket_path = "" # (-u) optional, the path of a Unix socket to serve HTTP on
+    batch_wait = 0.005 # (-w) the time in seconds to wait for more requests before predicting a micro-batch
+    max_batch_size = 64 # (-b) the maximal number of genomes in a micro-batch
+    threads = 1 # (-t) the number of threads for every KMC run on a .fasta request
+    counter = "kmc" # (-cn) the k-mer counter for .fasta requests: "kmc" (running KMC) or "python" (in-process, see kmerCounter.py)
+    port_given = False
+
+    # parsing any parameters passed in through the command line
+    for i in range(len(args)):
+        if (args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-m" or args[i] == "--model_name"):
+            model_name = args[i + 1]
+        elif (args[i] == "-i" or args[i] == "--dictionary_name"):
+            dictionary_name = args[i + 1]
+        elif (args[i] == "-s" or args[i] == "--kmr_size"):
+            kmr_size = int(args[i + 1])
+        elif (args[i] == "-c" or args[i] == "--csv_path"):
+            csv_path = args[i + 1]
+        elif (args[i] == "-a" or args[i] == "--host"):
+            host = args[i + 1]
+        elif (args[i] == "-p" or args[i] == "--port"):
+            port = int(args[i + 1])
+            port_given = True
+        elif (args[i] == "-u" or args[i] == "--socket_path"):
+            socket_path = args[i + 1]
+        elif (args[i] == "-w" or args[i] == "--batch_wait"):
+            batch_wait = float(args[i + 1]) / 1000
+        elif (args[i] == "-b" or args[i] == "--max_batch_size"):
+            max_batch_size = max(1, int(args[i + 1]))
+        elif (args[i] == "-t" or args[i] == "--threads"):
+            threads = max(1, int(args[i + 1]))
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+
+    if (counter not in ["kmc", "python"]):
+        print("Error: unknown counter (-cn)", counter, "(must be kmc or python)")
+        sys.exit()
+    # with a Unix socket, HTTP on a port is only served if a port was passed in
+    if (socket_path != "" and not port_given):
+        port = None
+
+    return model_name, dictionary_name, kmr_size, csv_path, host, port, socket_path, batch_wait, max_batch_size, threads, counter
+
+
+# function to return a string specifying the format of parameters
+# returns: the string with information about the parameters
+def helpOption():
+    s = "-m --model_name:\tthe name of the Ct value prediction model created by trainModel.py. The default is 'ct_model.sav'"
+    s+= "\n-i --dictionary_name:\tthe name of the k-mer vocabulary the model was trained with. The default is 'kmr_vocabulary.npy'"
+    s+= "\n-s --kmr_size:\tthe size of the k-mers the model was trained with. The default is 10"
+    s+= "\n-c --csv_path:\tthe path to the metadata .csv file, used to look up the instrument of a genome by its genome_id. There is no default for this option."
+    s+= "\n-a --host:\tthe address to serve HTTP on. The default is '127.0.0.1'"
+    s+= "\n-p --port:\tthe port to serve HTTP on. The default is 8080 (or none if -u is passed in)"
+    s+= "\n-u --socket_path:\tthe path of a Unix socket to serve HTTP on. There is no default for this option."
+    s+= "\n-w --batch_wait:\tthe time in milliseconds to wait for more requests before predicting a micro-batch. The default is 5"
+    s+= "\n-b --max_batch_size:\tthe maximal number of genomes predicted in one micro-batch. The default is 64"
+    s+= "\n-t --threads:\tthe number of threads for every KMC run on a .fasta request. The default is 1"
+    s+= "\n-cn --counter:\tthe k-mer counter for genomes sent as .fasta files: 'kmc' (running KMC) or 'python' (counting in-process with kmerCounter.py). The default is 'kmc'"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# the request, prediction, batch and latency counters of the server
+class ServerMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.requests = 0
+        self.failed_requests = 0
+        self.predictions = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.latency_sum = 0.0
+        self.latencies = deque(maxlen=1000) # the latencies of the most recent requests, for the percentiles
+
+    # records one answered request and the time it took in seconds
+    def addRequest(self, seconds, failed):
+        with self.lock:
+            self.requests += 1
+            self.failed_requests += int(failed)
+            self.latency_sum += seconds
+            self.latencies.append(seconds)
+
+    # records one predicted micro-batch of batch_size genomes
+    def addBatch(self, batch_size):
+        with self.lock:
+            self.batches += 1
+            self.predictions += batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+
+    # returns: the counters as a dictionary
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            return {
+                "uptime_seconds": round(time.time() - self.start_time, 3),
+                "requests_total": self.requests,
+                "requests_failed": self.failed_requests,
+                "predictions_total": self.predictions,
+                "batches_total": self.batches,
+                "batch_size_mean": round(self.predictions / self.batches, 3) if self.batches > 0 else 0,
+                "batch_size_max": self.max_batch_size,
+                "latency_ms_mean": round(self.latency_sum * 1000 / self.requests, 3) if self.requests > 0 else 0,
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3) if len(latencies) > 0 else 0,
+                "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3) if len(latencies) > 0 else 0,
+                "latency_ms_max": round(float(latencies.max()), 3) if len(latencies) > 0 else 0,
+            }
+
+
+# collects the genomes of concurrent requests into micro-batches and predicts every batch with one model.predict call
+# a single worker thread owns the model: it waits for a genome, then for up to batch_wait seconds for more (at most
+#  max_batch_size), and hands every genome its prediction (or the error of the batch)
+class PredictionBatcher:
+    def __init__(self, model, num_kmrs, batch_wait, max_batch_size, metrics):
+        self.model = model
+        self.num_kmrs = num_kmrs
+        self.batch_wait = batch_wait
+        self.max_batch_size = max_batch_size
+        self.metrics = metrics
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    # predicts the Ct values of several genomes, blocking until their batch has been predicted
+    # parameters:
+    #    rows: the features of every genome (see predictCt.rowFeatures)
+    # returns: the predicted Ct values
+    def predict(self, rows):
+        requests = []
+        for row in rows:
+            request = {"row": row, "done": threading.Event(), "prediction": None, "error": None}
+            self.pending.put(request)
+            requests.append(request)
+        predictions = []
+        for request in requests:
+            request["done"].wait()
+            if (request["error"] is not None):
+                raise request["error"]
+            predictions.append(request["prediction"])
+        return predictions
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.batch_wait
+            while (len(batch) < self.max_batch_size):
+                try:
+                    batch.append(self.pending.get(timeout=max(0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self.model.predict(stackRows([request["row"] for request in batch], self.num_kmrs))
+                for request, prediction in zip(batch, predictions):
+                    request["prediction"] = float(prediction)
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+            self.metrics.addBatch(len(batch))
+            for request in batch:
+                request["done"].set()
+
+
+# parses the frequencies of the k-mers of a genome sent as "kmrs" or "kmers"
+# parameters:
+#    values: the frequencies (integers, or strings of integers)
+# returns: the frequencies (uint32)
+def parseFrequencies(values):
+    frequencies = [int(value) for value in values]
+    for frequency in frequencies:
+        if (frequency < 0 or frequency > np.iinfo(np.uint32).max):
+            raise ValueError("every frequency must be between 0 and " + str(np.iinfo(np.uint32).max) + ", got " + str(frequency))
+    return np.array(frequencies, dtype=np.uint32)
+
+
+# counts the k-mers of a genome sent as the text of a .fasta file, in-process or by running KMC on it in a temporary directory
+# parameters:
+#    fasta: the text of the .fasta file
+#    kmr_size: the size of the k-mers
+#    threads: the number of threads for KMC
+#    counter: "kmc" or "python"
+# returns: the encoded k-mers (uint64) and their frequencies (uint32)
+def countFasta(fasta, kmr_size, threads, counter):
+    if (counter == "python"):
+        sequences = [sequence for record_id, sequence in fastaReader.parseFastaRecords(fasta.encode().splitlines())]
+        return kmerCounter.countSequences(sequences, kmr_size)
+    tmp_dir = tempfile.mkdtemp(prefix="predict_server_")
+    try:
+        fasta_path = os.path.join(tmp_dir, "genome.fasta")
+        with open(fasta_path, "w") as f:
+            f.write(fasta)
+        genome_id, error, seconds = runKMCGenome(fasta_path, "genome", tmp_dir, kmr_size, threads)
+        if (error is not None):
+            raise RuntimeError("KMC failed: " + error)
+        return kmerCounts.readKmrsCodes(os.path.join(tmp_dir, "genome_kmc." + str(kmr_size) + ".kmrs"), kmr_size)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# the state shared by all request handlers: the loaded model, vocabulary and metadata
+class PredictionService:
+    def __init__(self, batcher, vocabulary, kmr_size, metadata, threads, counter, metrics):
+        self.batcher = batcher
+        self.lookup = kmerCounts.vocabularyLookup(vocabulary)
+        self.num_kmrs = len(vocabulary)
+        self.kmr_size = kmr_size
+        self.metadata = metadata
+        self.threads = threads
+        self.counter = counter
+        self.metrics = metrics
+
+    # turns one genome of a /predict request into its features
+    # parameters:
+    #    genome: the JSON object of the genome
+    # returns: the genome_id, the instrument, and the features of the genome (see predictCt.rowFeatures)
+    def parseGenome(self, genome):
+        if (not isinstance(genome, dict)):
+            raise ValueError("every genome must be a JSON object")
+        genome_id = genome.get("genome_id")
+        instrument = genome.get("instrument")
+        if (instrument is None and genome_id is not None and self.metadata is not None):
+            instrument = metadataIndex.getInstrument(self.metadata, str(genome_id))
+        if (instrument is not None and instrument not in metadataIndex.INSTRUMENTS):
+            raise ValueError("unknown instrument " + str(instrument))
+
+        if ("fasta" in genome):
+            codes, frequencies = countFasta(genome["fasta"], self.kmr_size, self.threads, self.counter)
+        elif ("kmrs" in genome):
+            lines = [line.split() for line in genome["kmrs"].splitlines() if line.strip() != ""]
+            for line in lines:
+                if (len(line) != 2):
+                    raise ValueError("every line of 'kmrs' must be '<k-mer> <frequency>', got '" + " ".join(line) + "'")
+            codes = kmerCounts.encodeKmers([line[0] for line in lines], self.kmr_size)
+            frequencies = parseFrequencies([line[1] for line in lines])
+        elif ("kmers" in genome):
+            codes = kmerCounts.encodeKmers(list(genome["kmers"].keys()), self.kmr_size)
+            frequencies = parseFrequencies(genome["kmers"].values())
+        else:
+            raise ValueError("every genome needs one of 'fasta', 'kmrs' or 'kmers'")
+
+        return genome_id, instrument, rowFeatures(self.lookup, self.num_kmrs, codes, frequencies, instrument)
+
+    # answers a /predict request
+    # parameters:
+    #    body: the parsed JSON body, one genome or a list of genomes
+    # returns: the prediction (or list of predictions) to send back
+    def predict(self, body):
+        genomes = body if isinstance(body, list) else [body]
+        parsed = [self.parseGenome(genome) for genome in genomes]
+        profiling.count("genomes_predicted", len(parsed))
+        predictions = self.batcher.predict([row for genome_id, instrument, row in parsed])
+        results = []
+        for (genome_id, instrument, row), ct_prediction in zip(parsed, predictions):
+            results.append({"genome_id": genome_id, "instrument": instrument, "ct_prediction": ct_prediction})
+        return results if isinstance(body, list) else results[0]
+
+
+# handles the HTTP requests (on a port or a Unix socket), the service is attached to the server
+class PredictionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def sendJson(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if (self.path == "/metrics"):
+            self.sendJson(200, self.server.service.metrics.snapshot())
+        elif (self.path == "/health"):
+            self.sendJson(200, {"status": "ok"})
+        else:
+            self.sendJson(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        failed = True
+        try:
+            if (self.path != "/predict"):
+                self.sendJson(404, {"error": "unknown path " + self.path})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = self.server.service.predict(body)
+            self.sendJson(200, result)
+            failed = False
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError, OverflowError) as e: # a malformed request
+            self.sendJson(400, {"error": str(e)})
+        except Exception as e:
+            self.sendJson(500, {"error": str(e)})
+        finally:
+            self.server.service.metrics.addRequest(time.perf_counter() - start, failed)
+            profiling.count("requests")
+            profiling.count("requests_failed", failed)
+
+    # the client of a Unix socket has no address
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    # requests are counted in /metrics instead of being logged
+    def log_message(self, format, *args):
+        pass
+
+
+# serves HTTP on a port, one thread per connection
+# the listen backlog is raised from 5 so bursts of concurrent clients are queued instead of refused
+class PredictionHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+# serves HTTP on a Unix socket, one thread per connection
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# main function
+# loads the model, vocabulary and metadata once and serves predictions until interrupted
+def main(argv):
+    # current working directory:
+    start_dir = os.getcwd()
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "predictServer.py")
+    # reads in parameters passed in by user through the command line or setting paramters to default values
+    model_name, dictionary_name, kmr_size, csv_path, host, port, socket_path, batch_wait, max_batch_size, threads, counter = parseParams(args, start_dir)
+
+    # loading the model, vocabulary and metadata index once:
+    with profiling.stage("load"):
+        model = modelStore.compileModel(modelStore.loadModel(model_name))
+        vocabulary = kmerCounts.loadVocabulary(dictionary_name, kmr_size)
+        num_features = len(vocabulary) + len(metadataIndex.INSTRUMENTS)
+        if (getattr(model, "n_features_in_", num_features) != num_features):
+            print("Error: the model expects", model.n_features_in_, "features but the vocabulary has", num_features)
+            sys.exit()
+        metadata = metadataIndex.loadMetadataCached(csv_path) if csv_path != "" else None
+    print("--predictServer.py-- loaded model and vocabulary")
+
+    metrics = ServerMetrics()
+    batcher = PredictionBatcher(model, len(vocabulary), batch_wait, max_batch_size, metrics)
+    service = PredictionService(batcher, vocabulary, kmr_size, metadata, threads, counter, metrics)
+
+    servers = []
+    if (port is not None):
+        servers.append(PredictionHTTPServer((host, port), PredictionHandler))
+        print("--predictServer.py-- serving on http://" + host + ":" + str(servers[-1].server_address[1]))
+    if (socket_path != ""):
+        if (os.path.exists(socket_path)):
+            os.remove(socket_path)
+        servers.append(ThreadingUnixHTTPServer(socket_path, PredictionHandler))
+        print("--predictServer.py-- serving on unix socket " + socket_path)
+
+    for server in servers:
+        server.service = service
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    # stopping on SIGTERM (e.g. from a service manager) the same way as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # the requests are profiled as one stage, from the start of serving until the server is stopped
+    try:
+        with profiling.stage("serve"):
+            while True:
+                time.sleep(3600)
+    except (KeyboardInterrupt, SystemExit):
+        print("--predictServer.py-- shutting down")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if (socket_path != "" and os.path.exists(socket_path)):
+            os.remove(socket_path)
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,229 @@
+import sys
+import os
+import csv
+import json
+import time
+import atexit
+import cProfile
+import platform
+import resource
+import threading
+import contextlib
+
+# stage-level profiling of the scripts of the pipeline, enabled with the -pf (--profile) option of every script
+# a script marks its stages with "with profiling.stage(name):", and the library functions count what they process with
+#  profiling.count(name, amount) (genomes counted, k-mers parsed, bytes read, cache hits, ...); both do nothing unless profiling
+#  was enabled, so the scripts run as before without the option
+# for every stage the report has:
+#    seconds, cpu_seconds: the wall time and the CPU time of the process (all threads) spent in the stage
+#    peak_rss_mb, rss_rise_mb: the maximal resident set size of the process during the stage, and how far it rose above the
+#                              size at the start of the stage; on Linux the high-water mark of the process is reset at the start
+#                              of every stage (/proc/self/clear_refs), elsewhere the peak of the whole process so far is reported
+#    children_max_rss_mb: the maximal resident set size of the child processes (KMC) that finished so far
+#    counters: the counters counted during the stage
+# stages can be nested, a nested stage is reported as "<outer stage>/<stage>" and its time is also part of the outer stage
+# with -cp (--cprofile) every outermost stage is also run under cProfile, and its statistics are written next to the report
+#  as <report>.<stage>.prof (to be read with pstats or snakeviz)
+# the report is written when the script ends: as JSON (with the script, its arguments, the environment, the stages and the
+#  counters of the whole run), or as a .csv file with one row per stage if the report name ends in .csv
+
+# the profile of the running script, None unless profiling was enabled
+profile = None
+# the counters are counted by the threads counting genomes in parallel
+counter_lock = threading.Lock()
+
+
+# reads the current and the maximal resident set size of this process in bytes from /proc/self/status
+def readRss():
+    sizes = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if (line.startswith("VmRSS:") or line.startswith("VmHWM:")):
+                name, size = line.split(":")
+                sizes[name] = int(size.split()[0]) * 1024
+    return sizes["VmRSS"], sizes["VmHWM"]
+
+
+# resets the maximal resident set size of this process to its current size
+# returns: whether it could be reset (only on Linux)
+def resetPeakRss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# returns the maximal resident set size in bytes of this process (resource.RUSAGE_SELF) or of its finished child processes
+def maxRss(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    return resource.getrusage(who).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+# returns the maximal resident set size in MB of the (finished) child processes, e.g. KMC
+def childrenMaxRss():
+    return maxRss(resource.RUSAGE_CHILDREN) / 1e6
+
+
+# reads the current and the maximal resident set size of this process in bytes, on any platform
+# returns: the current size (None if it cannot be read) and the maximal size
+def memoryUsage():
+    try:
+        return readRss()
+    except (OSError, KeyError):
+        return None, maxRss()
+
+
+# returns a string of the profiling options of every script, appended to its -h output
+def helpOption():
+    s = "-pf --profile:\tthe file to write a report of the time, CPU time, peak memory and counters of every stage of the run to (.json, or .csv for one row per stage). There is no default for this option."
+    s+= "\n-cp --cprofile:\twith -pf, also run every stage under cProfile and write its statistics next to the report as <report>.<stage>.prof"
+    return s
+
+
+# enables profiling if the script was called with -pf (and -cp)
+# parameters:
+#    args: the list of arguments passed in through the command line
+#    script_name: the name of the script, written to the report
+def enableFromArgs(args, script_name):
+    report_name = None
+    use_cprofile = False
+    for i in range(len(args)):
+        if (args[i] == "-cp" or args[i] == "--cprofile"):
+            use_cprofile = True
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-pf" or args[i] == "--profile"):
+            report_name = args[i + 1]
+    if (report_name is not None):
+        enableProfiling(script_name, report_name, args, use_cprofile)
+
+
+# enables profiling, the report is written when the script ends
+# parameters:
+#    script_name: the name of the script
+#    report_name: the file to write the report to (.json or .csv)
+#    args: the arguments of the script, written to the report
+#    use_cprofile: True to run every outermost stage under cProfile
+def enableProfiling(script_name, report_name, args=None, use_cprofile=False):
+    global profile
+    profile = {
+        "script": script_name,
+        "report_name": os.path.abspath(report_name),
+        "args": list(args if args is not None else sys.argv),
+        "use_cprofile": use_cprofile,
+        "start_wall": time.time(),
+        "start": time.perf_counter(),
+        "start_cpu": time.process_time(),
+        "peak_rss_method": "clear_refs" if resetPeakRss() else "maxrss",
+        "stages": [], # the finished stages, in the order they finished
+        "active": [], # the stages that are running, the innermost last
+        "counters": {},
+    }
+    atexit.register(writeReport)
+
+
+# measures a stage of the script (does nothing unless profiling is enabled)
+# parameters:
+#    name: the name of the stage
+@contextlib.contextmanager
+def stage(name):
+    if (profile is None):
+        yield
+        return
+    active = profile["active"]
+    # the peak of the running outer stages so far, before the high-water mark is reset for this stage
+    rss, peak = memoryUsage()
+    for outer in active:
+        outer["peak_rss"] = max(outer["peak_rss"], peak)
+    if (profile["peak_rss_method"] == "clear_refs"):
+        resetPeakRss()
+    rss, peak = memoryUsage()
+
+    record = {"stage": "/".join([outer["stage"] for outer in active] + [name]), "start_rss": rss, "peak_rss": peak, "counters": {}}
+    profiler = None
+    if (profile["use_cprofile"] and len(active) == 0):
+        profiler = cProfile.Profile()
+    active.append(record)
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    if (profiler is not None):
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if (profiler is not None):
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - start_cpu
+        active.pop()
+        rss, peak = memoryUsage()
+        for running in active + [record]:
+            running["peak_rss"] = max(running["peak_rss"], peak)
+
+        record["seconds"] = round(seconds, 6)
+        record["cpu_seconds"] = round(cpu_seconds, 6)
+        record["peak_rss_mb"] = round(record.pop("peak_rss") / 1e6, 3)
+        start_rss = record.pop("start_rss")
+        record["rss_rise_mb"] = round(record["peak_rss_mb"] - start_rss / 1e6, 3) if start_rss is not None else None
+        record["children_max_rss_mb"] = round(childrenMaxRss(), 3)
+        if (profiler is not None):
+            record["cprofile"] = profile["report_name"] + "." + name + ".prof"
+            profiler.dump_stats(record["cprofile"])
+        record["counters"] = record.pop("counters")
+        profile["stages"].append(record)
+
+
+# adds to a counter of the running stages and of the whole run (does nothing unless profiling is enabled)
+# parameters:
+#    name: the name of the counter, e.g. "genomes_counted" or "kmrs_bytes_read"
+#    amount: the amount to add
+def count(name, amount=1):
+    if (profile is None):
+        return
+    amount = int(amount)
+    with counter_lock:
+        for running in profile["active"]:
+            running["counters"][name] = running["counters"].get(name, 0) + amount
+        profile["counters"][name] = profile["counters"].get(name, 0) + amount
+
+
+# returns the report of the run so far
+def createReport():
+    rss, peak = memoryUsage()
+    return {
+        "script": profile["script"],
+        "args": profile["args"],
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(profile["start_wall"])),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                        "hostname": platform.node()},
+        "peak_rss_method": profile["peak_rss_method"],
+        "total_seconds": round(time.perf_counter() - profile["start"], 6),
+        "total_cpu_seconds": round(time.process_time() - profile["start_cpu"], 6),
+        "max_rss_mb": round(maxRss() / 1e6, 3),
+        "children_max_rss_mb": round(childrenMaxRss(), 3),
+        "stages": profile["stages"],
+        "counters": profile["counters"],
+    }
+
+
+# writes the report of the run (called when the script ends)
+def writeReport():
+    if (profile is None):
+        return
+    report = createReport()
+    report_name = profile["report_name"]
+    if (report_name.endswith(".csv")):
+        counter_names = sorted(set(name for record in report["stages"] for name in record["counters"]))
+        columns = ["script", "stage", "seconds", "cpu_seconds", "peak_rss_mb", "rss_rise_mb", "children_max_rss_mb"] + counter_names
+        with open(report_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for record in report["stages"]:
+                row = [report["script"]] + [record[column] for column in columns[1:7]]
+                writer.writerow(row + [record["counters"].get(name, "") for name in counter_names])
+    else:
+        with open(report_name, "w") as f:
+            json.dump(report, f, indent=2)
+    print("--profiling.py-- wrote the profile of", len(report["stages"]), "stages to '", report_name, "'")
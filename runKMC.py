@@ -1,21 +1,45 @@
 import sys
 import os
+import time
+import shutil
+import tempfile
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import fastaReader
+import kmerCache
+import kmerCounter
+import kmerCounts
+import profiling
+
+# the maximal value of a k-mer counter in KMC (its default of 255 would cap the frequencies)
+KMC_MAX_COUNT = 4294967295
 
 # this function parses any parameters passed in through the command line or sets them to a default value
 # parameters:
 #    args: the list of arguments passed in through the command line
-# returns: genomes_dir, kmc_out_dir, kmr_size
+# returns: genomes_dir, kmc_out_dir, kmr_size, jobs, threads, incremental, counter, multi_fasta, cache_dir, cache_max_size
 def parseParams(args, start_dir):
     # setting default values for parameters:
     genomes_dir = start_dir + "/" # (-g) the directory with genomes as .fasta files
     kmc_out_dir = genomes_dir + "kmc_output/" # (-k) the directory for storing the output files of KMC with k-mer counts
     kmr_size = 10 # (-s) the size k-mer to run KMC with
+    jobs = 1 # (-j) the number of genomes to run KMC on at the same time
+    threads = os.cpu_count() or 1 # (-t) the total number of threads for all KMC jobs, split evenly across the jobs
+    incremental = False # (-inc) skip the genomes whose KMC output is newer than their .fasta file
+    multi_fasta = None # (-mf) a multi-FASTA file whose records (genomes) are counted instead of the .fasta files in genomes_dir
+    counter = "kmc" # (-cn) the k-mer counter to use: "kmc" (the KMC executables) or "python" (kmerCounter.py, in-process)
+    cache_dir = None # (-cd) the directory of the k-mer count cache (see kmerCache.py), genomes in the cache are not counted again
+    cache_max_size = kmerCache.DEFAULT_MAX_SIZE # (-cm) the maximal size of the k-mer count cache in MB
 
     # parsing any parameters passed in through the command line
     for i in range(len(args)):
         if(args[i] == "-h" or args[i] == "--help"):
             print(helpOption())
             sys.exit()
+        if (args[i] == "-inc" or args[i] == "--incremental"):
+            incremental = True
         if (i == len(args) - 1):
             break
         elif (args[i] == "-g" or args[i] == "--genomes_dir"):
@@ -26,54 +50,221 @@ def parseParams(args, start_dir):
             kmc_out_dir = args[i + 1]
             kmc_out_dir = os.path.abspath(kmc_out_dir) + "/"
         elif (args[i] == "-s" or args[i] == "--kmr_size"):
-            kmr_size = args[i + 1]
+            kmr_size = int(args[i + 1])
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            jobs = max(1, int(args[i + 1]))
+        elif (args[i] == "-t" or args[i] == "--threads"):
+            threads = max(1, int(args[i + 1]))
+        elif (args[i] == "-cn" or args[i] == "--counter"):
+            counter = args[i + 1]
+        elif (args[i] == "-mf" or args[i] == "--multi_fasta"):
+            multi_fasta = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cd" or args[i] == "--cache_dir"):
+            cache_dir = os.path.abspath(args[i + 1])
+        elif (args[i] == "-cm" or args[i] == "--cache_max_size"):
+            cache_max_size = float(args[i + 1])
 
+    if (counter not in ["kmc", "python"]):
+        print("Error: unknown counter (-cn)", counter, "(must be kmc or python)")
+        sys.exit()
 
-    return genomes_dir, kmc_out_dir, kmr_size
+    return genomes_dir, kmc_out_dir, kmr_size, jobs, threads, incremental, counter, multi_fasta, cache_dir, cache_max_size
 
 
 # returns a string of all the options for the script if the script was called with -h or --help
 def helpOption():
-    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, the KMC executable package, and the kmc.sh script. The default is './'"
+    s = "-g --genomes_dir:\tthe directory containing the fasta files to train the model, and the KMC executable package. The default is './'"
     s+= "\n-k --kmc_out_dir:\tthe directory for storing the output files created by KMC. The default is genomes_dir/kmc_out_dir"
     s+= "\n-s --kmr_size:\tthe size of the k-mer to run KMC with. The default is 10"
+    s+= "\n-j --jobs:\tthe number of genomes to run KMC on in parallel. The default is 1"
+    s+= "\n-t --threads:\tthe total number of threads used by KMC, split evenly across the parallel jobs. The default is the number of CPUs"
+    s+= "\n-inc --incremental:\tonly run KMC on the genomes that have no KMC output yet or whose .fasta file changed since. The default is to run KMC on all genomes"
+    s+= "\n-cn --counter:\tthe k-mer counter to use: 'kmc' (the KMC executables) or 'python' (the in-process counter in kmerCounter.py, which writes the same output files). The default is 'kmc'"
+    s+= "\n-mf --multi_fasta:\ta multi-FASTA file (optionally gzip or bgzip compressed) whose records are counted instead of the .fasta files in genomes_dir, every record is one genome named by the first word of its header. There is no default for this option."
+    s+= "\n-cd --cache_dir:\tthe directory of the k-mer count cache shared with createDataFrame.py and predictCt.py (see kmerCache.py). A genome whose counts for the k-mer size are in the cache is not counted again. The default is no cache"
+    s+= "\n-cm --cache_max_size:\tthe maximal size of the k-mer count cache in MB, the least recently used genomes are removed after the run. The default is " + str(kmerCache.DEFAULT_MAX_SIZE)
+    s+= "\n" + profiling.helpOption()
     return s
 
 
-# runs KMC on all .fasta files in a directory and puts the outputs into an output sub-directory
+# runs KMC (kmc and kmc_dump) on one genome
+# every job uses its own temporary directory for the intermediate KMC files (.kmc_pre, .kmc_suf and KMC's bins),
+#  so parallel jobs never collide, and writes the k-mer list straight to kmc_out_dir
 # parameters:
-#    genomes_dir: the directory containing the genomes as .fasta all_files
+#    input_path: the path to the genome .fasta file
+#    genome_id: the genome_id of the genome (the name of the file without .fasta)
 #    kmc_out_dir: the directory to which the output of KMC will be stored
 #    kmr_size: the size of the k-mers with which to run KMC
-def runKMC(genomes_dir, kmc_out_dir, kmr_size):
-    os.chdir(genomes_dir)
-    os.system("mkdir " + kmc_out_dir) # Create sub directory for kmc_out_dir
+#    threads: the number of threads KMC may use for this genome
+# returns: the genome_id, None or an error message if KMC failed, and the time it took in seconds
+def runKMCGenome(input_path, genome_id, kmc_out_dir, kmr_size, threads):
+    start = time.perf_counter()
+    tmp_dir = None
+    kmrs_file = kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size)
+    error = None
+    profiling.count("kmc_runs")
+    try:
+        tmp_dir = tempfile.mkdtemp(prefix=kmerCounts.fileSafeId(genome_id) + "_", dir=kmc_out_dir)
+        out_file = os.path.join(tmp_dir, "genome_kmc")
+        kmc_cmd = ["kmc", "-k" + str(kmr_size), "-t" + str(threads), "-ci1", "-cs" + str(KMC_MAX_COUNT), "-fm", input_path, out_file, tmp_dir]
+        dump_cmd = ["kmc_dump", "-ci1", "-cs" + str(KMC_MAX_COUNT), out_file, kmrs_file]
+        for cmd in [kmc_cmd, dump_cmd]:
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if (result.returncode != 0):
+                error = cmd[0] + " exited with code " + str(result.returncode) + ": " + result.stderr.strip()
+                break
+    except OSError as e: # the temporary directory could not be created or the KMC executables could not be started
+        error = str(e)
+    finally:
+        if (tmp_dir is not None):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    # iterate over all files in genomes_dir
-    #  for each .fasta file, runs kmc.sh (runs kmc and kmc_dump)
-    for filename in os.scandir(genomes_dir):
-        if (filename.path.endswith(".fasta")):
-            mcov = str(filename).strip("<DirEntry '.fasta'>")
-            input_file = mcov + ".fasta"
-            out_file = mcov + "_kmc"
+    return genome_id, error, time.perf_counter() - start
 
-            cmd = 'kmc.sh' + ' ' + str(kmr_size) + ' ' + input_file + ' ' + out_file + ' ' + kmc_out_dir
-            os.system(cmd) #runs kmc.sh for the current file
 
+# counts the k-mers of one record of a multi-FASTA bundle and writes them to its KMC output file in kmc_out_dir (see kmerCounts.kmrsPath)
+# with KMC, the record is written to a temporary .fasta file first (KMC counts all records of a file together)
+# parameters:
+#    genome_id: the id of the record
+#    sequence: the sequence of the record (bytes)
+#    kmc_out_dir: the directory to which the output of KMC will be stored
+#    kmr_size: the size of the k-mers
+#    threads: the number of threads for KMC
+#    counter: "kmc" or "python"
+# returns: the genome_id, an error message (None if KMC succeeded), and the time taken in seconds
+def runKMCRecord(genome_id, sequence, kmc_out_dir, kmr_size, threads, counter):
+    start = time.perf_counter()
+    fasta_path = None
+    try:
+        if (counter == "python"):
+            codes, frequencies = kmerCounter.countSequences([sequence], kmr_size)
+            kmerCounter.writeKmrsFile(kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size), codes, frequencies, kmr_size)
+            return genome_id, None, time.perf_counter() - start
+        fd, fasta_path = tempfile.mkstemp(prefix="record_", suffix=".fasta", dir=kmc_out_dir)
+        os.close(fd)
+        fastaReader.writeFastaRecord(fasta_path, genome_id, sequence)
+        return runKMCGenome(fasta_path, genome_id, kmc_out_dir, kmr_size, threads)
+    except (OSError, ValueError) as e: # e.g. a record id that is not a valid file name
+        return genome_id, str(e), time.perf_counter() - start
+    finally:
+        if (fasta_path is not None):
+            os.remove(fasta_path)
+
+
+# counts the k-mers of one genome through the k-mer count cache (see kmerCache.py)
+# if the counts of the genome are in the cache, its KMC output file is written from them without counting the genome,
+#  otherwise the genome is counted with count_genome and its counts are added to the cache
+# parameters:
+#    cache_dir: the directory of the cache, or None to count the genome without a cache
+#    genome: the path to the .fasta file of the genome or its sequence (bytes), see kmerCache.genomeKey
+#    genome_id: the genome_id of the genome
+#    kmc_out_dir: the directory to which the output of KMC will be stored
+#    kmr_size: the size of the k-mers
+#    counter: "kmc" or "python"
+#    count_genome: the function counting the genome and writing its KMC output file (runKMCGenome, runKMCRecord or kmerCounter.countGenome)
+#    count_args: the arguments of count_genome
+# returns: the genome_id, an error message (None if the genome was counted), the time taken in seconds, and whether the
+#  counts came from the cache
+def countGenomeCached(cache_dir, genome, genome_id, kmc_out_dir, kmr_size, counter, count_genome, count_args):
+    if (cache_dir is None):
+        return count_genome(*count_args) + (False,)
+    start = time.perf_counter()
+    kmrs_file = kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size)
+    try:
+        key = kmerCache.genomeKey(genome, kmr_size, counter)
+        counts = kmerCache.loadCounts(cache_dir, key)
+        if (counts is not None):
+            kmerCounter.writeKmrsFile(kmrs_file, counts[0], counts[1], kmr_size)
+            return genome_id, None, time.perf_counter() - start, True
+        genome_id, error, seconds = count_genome(*count_args)
+        if (error is None):
+            codes, frequencies = kmerCounts.readKmrsCodes(kmrs_file, kmr_size)
+            kmerCache.storeCounts(cache_dir, key, codes, frequencies)
+        return genome_id, error, time.perf_counter() - start, False
+    except (OSError, ValueError) as e: # e.g. an unreadable .fasta file
+        return genome_id, str(e), time.perf_counter() - start, False
 
 
-# deletes all temporary files that end in .suf or .pre (generated by KMC)
-# moves the output files from KMC into the output directory
+# runs KMC on all .fasta files in a directory (or on all records of a multi-FASTA bundle) and puts the outputs into an output sub-directory
+# up to jobs genomes are processed at the same time, each KMC run gets threads / jobs threads
+# a genome for which KMC fails is reported and skipped, the rest of the batch keeps running
+# the records of a multi-FASTA bundle are read one at a time, with at most 2 * jobs records held in memory
+# the time taken for every genome is written to kmc_timing.csv in kmc_out_dir
 # parameters:
 #    genomes_dir: the directory containing the genomes as .fasta all_files
 #    kmc_out_dir: the directory to which the output of KMC will be stored
-def cleanDir(genomes_dir, kmc_out_dir):
-    for filename in os.scandir(genomes_dir):
-        if (filename.path.endswith("suf") or filename.path.endswith("pre")):
-            os.system("rm " + filename.path) #removes .pre and .suf files from KMC
-        elif (filename.path.endswith("kmrs")):
-            cmd = "mv " + filename.path + " " + kmc_out_dir
-            os.system(cmd)
+#    kmr_size: the size of the k-mers with which to run KMC
+#    jobs: the number of genomes to run KMC on in parallel
+#    threads: the total number of threads for all KMC jobs
+#    incremental: whether to skip the genomes whose KMC output is newer than their .fasta file
+#    counter: "kmc" to run KMC, or "python" to count the k-mers in-process (kmerCounter.py) and write the same output files
+#    multi_fasta: optional, a multi-FASTA file (optionally gzip or bgzip compressed) whose records are counted instead of
+#                 the files in genomes_dir, every record is one genome named by its header
+#    cache_dir: optional, the directory of the k-mer count cache (see kmerCache.py), genomes in the cache are not counted again
+#    cache_max_size: the maximal size of the cache in MB, the least recently used genomes are removed after the run
+# returns: a list of (genome_id, error message) for every genome for which KMC failed
+def runKMC(genomes_dir, kmc_out_dir, kmr_size, jobs, threads, incremental=False, counter="kmc", multi_fasta=None,
+           cache_dir=None, cache_max_size=kmerCache.DEFAULT_MAX_SIZE):
+    os.makedirs(kmc_out_dir, exist_ok=True) # Create sub directory for kmc_out_dir
+    threads_per_job = max(1, threads // jobs)
+
+    # whether the KMC output of a genome is newer than the file it was counted from
+    def isCounted(genome_id, fasta_mtime):
+        kmrs_file = kmerCounts.kmrsPath(kmc_out_dir, genome_id, kmr_size)
+        return os.path.exists(kmrs_file) and os.path.getmtime(kmrs_file) >= fasta_mtime
+
+    # the function and arguments to count every genome, created lazily so the records of a bundle are read as they are needed
+    def listTasks():
+        if (multi_fasta is not None):
+            fasta_mtime = os.path.getmtime(multi_fasta)
+            for genome_id, sequence in fastaReader.readFastaRecords(multi_fasta):
+                if (incremental and isCounted(genome_id, fasta_mtime)):
+                    continue # the genome was already counted
+                yield sequence, genome_id, runKMCRecord, (genome_id, sequence, kmc_out_dir, kmr_size, threads_per_job, counter)
+            return
+
+        count_genome = kmerCounter.countGenome if counter == "python" else runKMCGenome
+        for filename in os.scandir(genomes_dir):
+            genome_id = fastaReader.fastaGenomeId(filename.name)
+            if (genome_id is None):
+                continue
+            if (incremental and isCounted(genome_id, filename.stat().st_mtime)):
+                continue # the genome was already counted
+            input_path = os.path.abspath(filename.path)
+            yield input_path, genome_id, count_genome, (input_path, genome_id, kmc_out_dir, kmr_size, threads_per_job)
+
+    # runs KMC for every genome in a pool of jobs worker threads (every worker waits on its own KMC process)
+    start = time.perf_counter()
+    results = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for genome, genome_id, count_genome, count_args in listTasks():
+            pending.append(pool.submit(countGenomeCached, cache_dir, genome, genome_id, kmc_out_dir, kmr_size, counter, count_genome, count_args))
+            while (len(pending) >= 2 * jobs or (len(pending) > 0 and pending[0].done())):
+                results.append(pending.popleft().result())
+        while (len(pending) > 0):
+            results.append(pending.popleft().result())
+    total_time = time.perf_counter() - start
+    for genome_id, error, seconds, cached in results:
+        if (error != None):
+            print("  KMC failed for genome ", genome_id, ": ", error)
+
+    # writing the time taken for every genome:
+    with open(os.path.join(kmc_out_dir, "kmc_timing.csv"), "w") as f:
+        f.write("genome_id,status,seconds\n")
+        for genome_id, error, seconds, cached in results:
+            status = "failed" if error != None else ("cached" if cached else "ok")
+            f.write(genome_id + "," + status + "," + str(round(seconds, 4)) + "\n")
+
+    failures = [(genome_id, error) for genome_id, error, seconds, cached in results if error != None]
+    profiling.count("genomes_processed", len(results))
+    profiling.count("genomes_failed", len(failures))
+    if (total_time > 0):
+        print("--runKMC.py-- processed", len(results), "genomes (", len(failures), "failed,", sum(result[3] for result in results),
+              "from the cache ) in", round(total_time, 2), "seconds:", round(len(results) / total_time * 60, 1), "genomes/minute")
+    if (cache_dir is not None):
+        kmerCache.evictCache(cache_dir, cache_max_size * 1e6)
+    return failures
 
 
 
@@ -85,15 +276,16 @@ def main(argv):
     print(start_dir)
 
     args = sys.argv
+    profiling.enableFromArgs(args, "runKMC.py")
     # reads in parameters passed in by user through the command line or setting paramters to default values
-    genomes_dir, kmc_out_dir, kmr_size = parseParams(args, start_dir)
+    genomes_dir, kmc_out_dir, kmr_size, jobs, threads, incremental, counter, multi_fasta, cache_dir, cache_max_size = parseParams(args, start_dir)
 
-    #runs kmc.sh (kmc and kmc_dump) for every file in genomes_dir directory
-    runKMC(genomes_dir, kmc_out_dir, kmr_size)
+    #runs kmc and kmc_dump for every file in genomes_dir directory, writing the outputs to kmc_out_dir
+    with profiling.stage("count"):
+        failures = runKMC(genomes_dir, kmc_out_dir, kmr_size, jobs, threads, incremental, counter, multi_fasta, cache_dir, cache_max_size)
     print("--runKMC.py-- finished running KMC")
-
-    #calls cleanDir which moves all files to an output directory and deletes extra kmc files .suf and .pre
-    cleanDir(genomes_dir, kmc_out_dir)
+    if (len(failures) > 0):
+        print("--runKMC.py-- KMC failed for", len(failures), "genomes:", ", ".join(genome_id for genome_id, error in failures))
 
 
 
@@ -0,0 +1,243 @@
+import sys
+import os
+import time
+import math
+import itertools
+import numpy as np
+import pandas as pd
+import joblib
+
+import featureStore
+import profiling
+import selectFeatures
+import trainModel
+
+from sklearn.model_selection import KFold
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
+from sklearn.metrics import mean_squared_error
+
+# searches the parameters of the Random Forest regressor of trainModel.py with k-fold cross-validation
+# the search only uses the train set of trainModel.py (the same train test split), the test set is left for the final evaluation
+# every (configuration, fold) pair is fit by a worker process; the workers read the rows of their folds from the memory-mapped
+#  feature store, so the k-mer matrix is shared through the page cache instead of being copied to every worker
+# two search methods:
+#    grid: every combination of the listed parameter values is evaluated on all rows
+#    halving: successive halving over a random sample of the combinations, the candidates are first evaluated on a fraction
+#             of the rows of every fold and only the best 1/factor of them go on to the next round, which uses factor times more rows
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: df_name, output_file_name, test_size, num_folds, jobs, method, num_candidates, factor, grid
+def parseParams(args, start_dir):
+    # setting default values for parameters:
+    df_name = "kmr_df" # (-d) the name of the feature store with the sparse k-mer matrix (in start_dir)
+    output_file_name = "search_results.csv" # (-f) the name of the .csv file to which to write the ranked results
+    test_size = 0.2 # (-ts) the test size used by trainModel.py, the test set is not used by the search
+    num_folds = 5 # (-k) the number of cross-validation folds
+    jobs = 1 # (-j) the number of worker processes, -1 for one per core
+    method = "grid" # (-sm) the search method: "grid" or "halving"
+    num_candidates = 20 # (-nc) the number of random combinations to start successive halving with
+    factor = 3 # (-hf) the fraction (1/factor) of candidates kept by every round of successive halving
+    # (-nt, -td, -rs, -mx) comma-separated values to search for every parameter of the model
+    grid = {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [None, 10, 20],
+        "max_samples": [0.25, 0.5, 1.0],
+        "max_features": [1.0, 0.3, "sqrt"],
+    }
+
+    # parsing any parameters passed in through the command line
+    for i in range(len(args)):
+        if(args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-d" or args[i] == "--df_name"):
+            df_name = args[i + 1]
+        elif (args[i] == "-f" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-ts" or args[i] == "--test_size"):
+            test_size = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-k" or args[i] == "--folds"):
+            num_folds = int(args[i + 1])
+        elif (args[i] == "-j" or args[i] == "--jobs"):
+            jobs = int(args[i + 1])
+        elif (args[i] == "-sm" or args[i] == "--search_method"):
+            method = args[i + 1]
+        elif (args[i] == "-nc" or args[i] == "--num_candidates"):
+            num_candidates = int(args[i + 1])
+        elif (args[i] == "-hf" or args[i] == "--halving_factor"):
+            factor = int(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            grid["n_estimators"] = [int(value) for value in args[i + 1].split(",")]
+        elif (args[i] == "-td" or args[i] == "--tree_depth"):
+            grid["max_depth"] = [trainModel.parseNumber(value) for value in args[i + 1].split(",")]
+        elif (args[i] == "-rs" or args[i] == "--row_subsampling"):
+            grid["max_samples"] = [trainModel.parseNumber(value) for value in args[i + 1].split(",")]
+        elif (args[i] == "-mx" or args[i] == "--max_features"):
+            grid["max_features"] = [trainModel.parseMaxFeatures(value) for value in args[i + 1].split(",")]
+
+    if (method not in ["grid", "halving"]):
+        print("Error: unknown search method (-sm)", method, "(must be grid or halving)")
+        sys.exit()
+    if (factor < 2):
+        print("Error: the halving factor (-hf) must be at least 2")
+        sys.exit()
+
+    return df_name, output_file_name, test_size, num_folds, jobs, method, num_candidates, factor, grid
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-d --df_name:\tthe name of the feature store with the sparse k-mer matrix to search the parameters on. The default is 'kmr_df'"
+    s+= "\n-f --output_file_name:\tthe name of the .csv file to write the ranked results to. The default is 'search_results.csv'"
+    s+= "\n-ts --test_size:\tthe test size passed to trainModel.py, the test set is not used by the search. The default is 0.2"
+    s+= "\n-k --folds:\tthe number of cross-validation folds. The default is 5"
+    s+= "\n-j --jobs:\tthe number of worker processes fitting the configurations and folds in parallel, -1 for one per CPU core. The default is 1"
+    s+= "\n-sm --search_method:\t'grid' (every combination of the parameter values) or 'halving' (successive halving over a random sample of the combinations). The default is 'grid'"
+    s+= "\n-nc --num_candidates:\tthe number of random combinations successive halving starts with. The default is 20"
+    s+= "\n-hf --halving_factor:\tevery round of successive halving keeps the best 1/factor of the candidates and gives them factor times more rows. The default is 3"
+    s+= "\n-nt --num_trees:\tthe comma-separated 'n_estimators' values to search. The default is '100,200,400'"
+    s+= "\n-td --tree_depth:\tthe comma-separated 'max_depth' values to search. The default is 'None,10,20'"
+    s+= "\n-rs --row_subsampling:\tthe comma-separated 'max_samples' values to search. The default is '0.25,0.5,1.0'"
+    s+= "\n-mx --max_features:\tthe comma-separated 'max_features' values to search. The default is '1.0,0.3,sqrt'"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# lists the parameter combinations to evaluate
+# parameters:
+#    grid: the values to search for every parameter
+#    method: "grid" (all combinations) or "halving" (a random sample of num_candidates combinations)
+#    num_candidates: the number of combinations to sample for "halving"
+# returns: a list of dictionaries of parameter : value
+def listCandidates(grid, method, num_candidates):
+    names = list(grid)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    if (method == "halving" and num_candidates < len(candidates)):
+        rng = np.random.default_rng(42)
+        candidates = [candidates[i] for i in sorted(rng.choice(len(candidates), size=num_candidates, replace=False))]
+    return candidates
+
+
+# fits one configuration on the train rows of one fold and evaluates it on the validation rows
+# runs in a worker process, kmr_matrix is backed by the memory-mapped feature store so only the rows of the fold are read
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix (CSR) of the feature store
+#    ct_values: the Ct value of every row of the feature store
+#    train_rows, validation_rows: the row indices of the fold
+#    params: the parameters of the Random Forest regressor
+# returns: the RMSE and R2 on the validation rows and the time taken to fit in seconds
+def evaluateFold(kmr_matrix, ct_values, train_rows, validation_rows, params):
+    model = RandomForestRegressor(random_state=42, n_jobs=1, **params)
+    start = time.perf_counter()
+    model.fit(kmr_matrix[train_rows], ct_values[train_rows])
+    fit_time = time.perf_counter() - start
+    predictions = model.predict(kmr_matrix[validation_rows])
+    rmse = math.sqrt(mean_squared_error(ct_values[validation_rows], predictions))
+    r2 = r2_score(ct_values[validation_rows], predictions)
+    return rmse, r2, fit_time
+
+
+# evaluates every candidate on every fold, running the (candidate, fold) pairs in a pool of worker processes
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix (CSR) of the feature store
+#    ct_values: the Ct value of every row of the feature store
+#    folds: a list of (train rows, validation rows) of every fold
+#    candidates: the parameter combinations to evaluate
+#    fraction: the fraction of the train rows of every fold to fit on
+#    jobs: the number of worker processes
+# returns: a DataFrame with the parameters, the mean and standard deviation of the RMSE and R2, and the mean fit time of every candidate
+def evaluateCandidates(kmr_matrix, ct_values, folds, candidates, fraction, jobs):
+    rng = np.random.default_rng(42)
+    # the same subsample of every fold is used for all candidates of a round
+    subsampled = []
+    for train_rows, validation_rows in folds:
+        if (fraction < 1):
+            train_rows = np.sort(rng.choice(train_rows, size=min(len(train_rows), max(10, int(len(train_rows) * fraction))), replace=False))
+        subsampled.append((train_rows, validation_rows))
+
+    tasks = [(c, f) for c in range(len(candidates)) for f in range(len(subsampled))]
+    scores = joblib.Parallel(n_jobs=jobs, backend="loky")(
+        joblib.delayed(evaluateFold)(kmr_matrix, ct_values, subsampled[f][0], subsampled[f][1], candidates[c]) for c, f in tasks)
+
+    scores = pd.DataFrame(scores, columns=["rmse", "r2", "fit_time"])
+    scores["candidate"] = [c for c, f in tasks]
+    summary = scores.groupby("candidate").agg(mean_rmse=("rmse", "mean"), std_rmse=("rmse", "std"), mean_r2=("r2", "mean"),
+                                              std_r2=("r2", "std"), mean_fit_time=("fit_time", "mean"))
+    # the parameters are written as they are passed to trainModel.py (e.g. "None" for no maximal depth)
+    results = pd.DataFrame([{name: str(value) for name, value in candidate.items()} for candidate in candidates])
+    results["num_train_rows"] = int(np.mean([len(train_rows) for train_rows, validation_rows in subsampled]))
+    return pd.concat([results, summary.reset_index(drop=True)], axis=1)
+
+
+# runs the search
+# parameters:
+#    kmr_matrix: the sparse k-mer matrix (CSR) of the feature store
+#    ct_values: the Ct value of every row of the feature store
+#    rows: the row indices to cross-validate on (the train set of trainModel.py)
+#    num_folds, jobs, method, num_candidates, factor, grid: see parseParams
+# returns: the results of every round, ranked by the last round each candidate reached and its mean RMSE
+def searchParams(kmr_matrix, ct_values, rows, num_folds, jobs, method, num_candidates, factor, grid):
+    folds = [(rows[train], rows[validation]) for train, validation in KFold(n_splits=num_folds, shuffle=True, random_state=42).split(rows)]
+    candidates = listCandidates(grid, method, num_candidates)
+    # the number of rounds of successive halving, the last round evaluates at most factor candidates on all rows
+    num_rounds = 1
+    remaining = len(candidates)
+    while (method == "halving" and remaining > factor):
+        remaining = math.ceil(remaining / factor)
+        num_rounds += 1
+
+    rounds = []
+    for r in range(num_rounds):
+        fraction = 1.0 / factor ** (num_rounds - 1 - r)
+        results = evaluateCandidates(kmr_matrix, ct_values, folds, candidates, fraction, jobs)
+        results.insert(0, "round", r)
+        rounds.append(results)
+        print("--searchParams.py-- round", r, "evaluated", len(candidates), "candidates on", results["num_train_rows"].iloc[0], "rows per fold")
+        # keeping the best 1/factor of the candidates for the next round
+        best = results.sort_values("mean_rmse", kind="stable").index[:max(1, math.ceil(len(candidates) / factor))]
+        candidates = [candidates[i] for i in sorted(best)]
+
+    results = pd.concat(rounds, ignore_index=True)
+    results = results.sort_values(["round", "mean_rmse"], ascending=[False, True], kind="stable")
+    results.insert(0, "rank", np.arange(1, len(results) + 1))
+    return results
+
+
+# main function
+# cross-validates the parameter combinations on the train set of the feature store and writes the ranked results to a .csv file
+def main(argv):
+    # current working directory:
+    start_dir = os.getcwd()
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "searchParams.py")
+    # reads in parameters passed in by user through the command line or setting paramters to default values
+    df_name, output_file_name, test_size, num_folds, jobs, method, num_candidates, factor, grid = parseParams(args, start_dir)
+
+    # opening the memory-mapped feature store, the workers read their rows from it
+    with profiling.stage("load"):
+        kmr_matrix, genome_ids, ct_values, header = featureStore.loadFeatureStore(os.path.join(start_dir, df_name))
+        ct_values = np.asarray(ct_values)
+        # the same train set as trainModel.py
+        rows = selectFeatures.trainRows(ct_values, test_size)
+    print("--searchParams.py-- opened k-mer matrix, searching on", len(rows), "genomes")
+
+    with profiling.stage("search"):
+        results = searchParams(kmr_matrix, ct_values, rows, num_folds, jobs, method, num_candidates, factor, grid)
+    results.to_csv(output_file_name, index=False)
+
+    best = results.iloc[0]
+    print("--searchParams.py-- best parameters: -nt", best["n_estimators"], "-td", best["max_depth"], "-rs", best["max_samples"],
+          "-mx", best["max_features"], "(RMSE", round(best["mean_rmse"], 4), " R2", round(best["mean_r2"], 4), ")")
+    print("--searchParams.py-- stored the ranked results as '", output_file_name, "'")
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
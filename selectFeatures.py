@@ -0,0 +1,269 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+import featureStore
+import kmerCounts
+import profiling
+import trainModel
+
+from sklearn.ensemble import RandomForestRegressor
+
+# selects the k-mer columns of the feature store created by createDataFrame.py that are worth training on
+# writes a narrower feature store (for trainModel.py) and the reduced vocabulary of the kept k-mers (for predictCt.py and
+#  predictServer.py, which ignore k-mers that are not in the vocabulary), so training and prediction both use the reduced matrix
+# the k-mers are filtered in this order:
+#    prevalence: k-mers present in fewer than min_genomes genomes, or in more than max_prevalence of the genomes, are dropped
+#    variance: k-mers whose frequency varies by no more than min_variance across the genomes are dropped
+#    ranking (optional): only the num_features k-mers most correlated with the Ct value, or most important to a Random Forest, are kept
+# the statistics are computed on the rows trainModel.py trains on (the same train test split), so the test set is not used
+# the instrument columns are always kept (as the last columns)
+
+# the number of non-zero values of the matrix read at a time while computing the statistics of the columns
+BLOCK_NNZ = 10000000
+
+
+# this function parses any parameters passed in through the command line or sets them to a default value
+# parameters:
+#    args: the list of arguments passed in through the command line
+# returns: df_name, dictionary_name, selected_df_name, selected_dictionary_name, output_file_name, min_genomes, max_prevalence,
+#          min_variance, rank, num_features, test_size, num_trees
+def parseParams(args, start_dir):
+    # setting default values for parameters:
+    df_name = "kmr_df" # (-d) the name of the feature store created by createDataFrame.py
+    dictionary_name = "kmr_vocabulary.npy" # (-i) the name of the vocabulary created by createDataFrame.py
+    selected_df_name = "kmr_df_selected" # (-sd) the name to store the feature store with only the selected k-mers as
+    selected_dictionary_name = "kmr_vocabulary_selected.npy" # (-si) the name to store the vocabulary of the selected k-mers as
+    output_file_name = "selected_kmrs.csv" # (-f) the name of the file to which to write the statistics of the selected k-mers
+    min_genomes = 2 # (-mg) the minimal number of genomes a k-mer must be present in
+    max_prevalence = 1.0 # (-mp) the maximal fraction of genomes a k-mer may be present in
+    min_variance = 0.0 # (-mv) k-mers whose frequency has a variance of at most this value are dropped
+    rank = "none" # (-r) how to rank the remaining k-mers: "none", "correlation" or "importance"
+    num_features = 10000 # (-n) the number of k-mers to keep after ranking
+    test_size = 0.2 # (-ts) the test size used by trainModel.py, the test set is left out of the statistics
+    num_trees = 100 # (-nt) the number of trees of the Random Forest used to rank by importance
+
+    # parsing any parameters passed in through the command line
+    for i in range(len(args)):
+        if(args[i] == "-h" or args[i] == "--help"):
+            print(helpOption())
+            sys.exit()
+        if (i == len(args) - 1):
+            break
+        elif (args[i] == "-d" or args[i] == "--df_name"):
+            df_name = args[i + 1]
+        elif (args[i] == "-i" or args[i] == "--dictionary_name"):
+            dictionary_name = args[i + 1]
+        elif (args[i] == "-sd" or args[i] == "--selected_df_name"):
+            selected_df_name = args[i + 1]
+        elif (args[i] == "-si" or args[i] == "--selected_dictionary_name"):
+            selected_dictionary_name = args[i + 1]
+        elif (args[i] == "-f" or args[i] == "--output_file_name"):
+            output_file_name = args[i + 1]
+        elif (args[i] == "-mg" or args[i] == "--min_genomes"):
+            min_genomes = int(args[i + 1])
+        elif (args[i] == "-mp" or args[i] == "--max_prevalence"):
+            max_prevalence = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-mv" or args[i] == "--min_variance"):
+            min_variance = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-r" or args[i] == "--rank"):
+            rank = args[i + 1]
+        elif (args[i] == "-n" or args[i] == "--num_features"):
+            num_features = int(args[i + 1])
+        elif (args[i] == "-ts" or args[i] == "--test_size"):
+            test_size = trainModel.parseNumber(args[i + 1])
+        elif (args[i] == "-nt" or args[i] == "--num_trees"):
+            num_trees = int(args[i + 1])
+
+    if (rank not in ["none", "correlation", "importance"]):
+        print("Error: unknown ranking (-r)", rank, "(must be none, correlation or importance)")
+        sys.exit()
+
+    return df_name, dictionary_name, selected_df_name, selected_dictionary_name, output_file_name, min_genomes, max_prevalence, min_variance, rank, num_features, test_size, num_trees
+
+
+# returns a string of all the options for the script if the script was called with -h or --help
+def helpOption():
+    s = "-d --df_name:\tthe name of the feature store with the sparse k-mer matrix created by createDataFrame.py. The default is 'kmr_df'"
+    s+= "\n-i --dictionary_name:\tthe name of the vocabulary created by createDataFrame.py (must be a .npy file). The default is 'kmr_vocabulary.npy'"
+    s+= "\n-sd --selected_df_name:\tthe name to store the feature store with only the selected k-mers as (to train the model on). The default is 'kmr_df_selected'"
+    s+= "\n-si --selected_dictionary_name:\tthe name to store the vocabulary of the selected k-mers as (to predict with). The default is 'kmr_vocabulary_selected.npy'"
+    s+= "\n-f --output_file_name:\tthe name of the .csv file to write the selected k-mers and their statistics to. The default is 'selected_kmrs.csv'"
+    s+= "\n-mg --min_genomes:\tthe minimal number of genomes a k-mer must be present in to be kept. The default is 2"
+    s+= "\n-mp --max_prevalence:\tthe maximal fraction of genomes a k-mer may be present in to be kept. The default is 1.0"
+    s+= "\n-mv --min_variance:\tk-mers whose frequency has a variance of at most this value are dropped. The default is 0.0 (only constant k-mers are dropped)"
+    s+= "\n-r --rank:\thow to rank the k-mers left after filtering: 'none' (keep them all), 'correlation' (absolute correlation with the Ct value) or 'importance' (Random Forest feature importance). The default is 'none'"
+    s+= "\n-n --num_features:\tthe number of top ranked k-mers to keep (with -r correlation or importance). The default is 10000"
+    s+= "\n-ts --test_size:\tthe test size passed to trainModel.py, the test set is not used to select k-mers. The default is 0.2"
+    s+= "\n-nt --num_trees:\tthe number of trees of the Random Forest used by -r importance. The default is 100"
+    s+= "\n" + profiling.helpOption()
+    return s
+
+
+# picks the rows the k-mers are selected on: the train set of trainModel.py (rows with a Ct value, split with trainModel.splitRows)
+# parameters:
+#    ct_values: the Ct value of every row of the feature store
+#    test_size: the test set size, parsed like the -ts option of trainModel.py (a fraction, or a number of rows); 0 for all rows
+# returns: the sorted row indices of the train set
+def trainRows(ct_values, test_size):
+    if (test_size is None or test_size <= 0):
+        return np.flatnonzero(~np.isnan(ct_values))
+    train_rows, train_labels, test_rows, test_labels = trainModel.splitRows(ct_values, test_size)
+    return np.sort(train_rows)
+
+
+# computes the statistics of every k-mer column over a set of rows, reading the column (CSC) layout of the store one block at a time
+# parameters:
+#    store_dir: the directory of the feature store
+#    header: the header of the feature store
+#    rows: the row indices to compute the statistics over
+#    ct_values: the Ct value of every row of the feature store
+# returns: a DataFrame with the number of genomes every k-mer is present in, and the mean and variance of its frequency and its
+#          correlation with the Ct value (one row per k-mer column)
+def columnStatistics(store_dir, header, rows, ct_values):
+    num_kmrs = header["num_kmrs"]
+    indptr = np.load(os.path.join(store_dir, "csc_indptr.npy"), mmap_mode="r")[:num_kmrs + 1]
+    indices = np.load(os.path.join(store_dir, "csc_indices.npy"), mmap_mode="r")
+    data = np.load(os.path.join(store_dir, "csc_data.npy"), mmap_mode="r")
+
+    # the weight of every row (1 for the rows the statistics are computed over) and its centered Ct value
+    num_rows = len(rows)
+    weights = np.zeros(header["num_rows"])
+    weights[rows] = 1
+    centered = np.zeros(header["num_rows"])
+    centered[rows] = ct_values[rows] - ct_values[rows].mean()
+    ct_std = np.sqrt((centered ** 2).sum() / num_rows)
+
+    num_genomes = np.zeros(num_kmrs)
+    sums = np.zeros(num_kmrs)
+    square_sums = np.zeros(num_kmrs)
+    ct_sums = np.zeros(num_kmrs)
+
+    # splitting the columns into blocks of about BLOCK_NNZ non-zero values
+    starts = np.unique(np.searchsorted(indptr, np.arange(0, indptr[-1], BLOCK_NNZ), side="right") - 1)
+    ends = np.append(starts[1:], num_kmrs)
+    for start, end in zip(starts, ends):
+        block_indptr = np.asarray(indptr[start:end + 1])
+        block_rows = np.asarray(indices[block_indptr[0]:block_indptr[-1]])
+        block_data = np.asarray(data[block_indptr[0]:block_indptr[-1]], dtype=np.float64)
+        block_cols = np.repeat(np.arange(end - start), np.diff(block_indptr))
+        block_weights = weights[block_rows]
+        num_genomes[start:end] = np.bincount(block_cols, weights=block_weights, minlength=end - start)
+        sums[start:end] = np.bincount(block_cols, weights=block_data * block_weights, minlength=end - start)
+        square_sums[start:end] = np.bincount(block_cols, weights=block_data * block_data * block_weights, minlength=end - start)
+        ct_sums[start:end] = np.bincount(block_cols, weights=block_data * centered[block_rows], minlength=end - start)
+
+    means = sums / num_rows
+    variances = np.maximum(square_sums / num_rows - means ** 2, 0)
+    # the correlation of a constant column (or with a constant Ct value) is set to 0
+    stds = np.sqrt(variances) * ct_std
+    correlations = np.divide(ct_sums / num_rows, stds, out=np.zeros(num_kmrs), where=stds > 0)
+
+    return pd.DataFrame({"num_genomes": num_genomes.astype(np.int64), "mean": means, "variance": variances, "correlation": correlations})
+
+
+# ranks k-mers by the feature importance of a Random Forest trained on them (and the instrument columns)
+# parameters:
+#    store_dir: the directory of the feature store
+#    header: the header of the feature store
+#    rows: the row indices of the train set
+#    columns: the k-mer columns to rank
+#    num_trees: the number of trees of the Random Forest
+# returns: the feature importance of every k-mer column in columns
+def featureImportances(store_dir, header, rows, columns, num_trees):
+    instrument_columns = np.arange(header["num_kmrs"], header["num_cols"])
+    train_set, genome_ids, train_labels, header = featureStore.loadFeatureStore(store_dir, rows=rows, columns=np.concatenate([columns, instrument_columns]))
+    model = RandomForestRegressor(n_estimators=num_trees, random_state=42, max_samples=0.25, n_jobs=-1)
+    model.fit(train_set, np.asarray(train_labels))
+    return model.feature_importances_[:len(columns)]
+
+
+# selects the k-mer columns to keep
+# parameters:
+#    store_dir: the directory of the feature store
+#    header: the header of the feature store
+#    statistics: the statistics of every k-mer column (see columnStatistics), an "importance" column is added with -r importance
+#    rows: the row indices of the train set
+#    min_genomes, max_prevalence, min_variance, rank, num_features, num_trees: see parseParams
+# returns: the sorted indices of the selected k-mer columns
+def selectColumns(store_dir, header, statistics, rows, min_genomes, max_prevalence, min_variance, rank, num_features, num_trees):
+    num_genomes = statistics["num_genomes"].to_numpy()
+    keep = (num_genomes >= min_genomes) & (num_genomes <= max_prevalence * len(rows))
+    print("--selectFeatures.py--", int(keep.sum()), "of", len(keep), "k-mers pass the prevalence filter")
+    keep &= statistics["variance"].to_numpy() > min_variance
+    print("--selectFeatures.py--", int(keep.sum()), "k-mers pass the variance filter")
+    columns = np.flatnonzero(keep)
+
+    if (rank != "none" and len(columns) > num_features):
+        if (rank == "correlation"):
+            scores = np.abs(statistics["correlation"].to_numpy()[columns])
+        else:
+            scores = featureImportances(store_dir, header, rows, columns, num_trees)
+            statistics["importance"] = np.nan
+            statistics.loc[columns, "importance"] = scores
+        # the num_features k-mers with the highest scores, in column order
+        columns = np.sort(columns[np.argsort(-scores, kind="stable")[:num_features]])
+        print("--selectFeatures.py-- kept the", len(columns), "k-mers with the highest", rank)
+
+    return columns
+
+
+# writes the feature store and vocabulary of the selected k-mers
+# parameters:
+#    store_dir: the directory of the feature store
+#    header: the header of the feature store
+#    vocabulary: the vocabulary of the feature store
+#    columns: the sorted indices of the selected k-mer columns
+#    selected_store_dir: the directory to write the feature store with the selected k-mers to
+#    selected_dictionary_name: the path to store the vocabulary of the selected k-mers as
+def storeSelection(store_dir, header, vocabulary, columns, selected_store_dir, selected_dictionary_name):
+    instrument_columns = np.arange(header["num_kmrs"], header["num_cols"])
+    kmr_matrix, genome_ids, ct_values, header = featureStore.loadFeatureStore(store_dir, columns=np.concatenate([columns, instrument_columns]))
+    selected_vocabulary = np.asarray(vocabulary)[columns]
+    featureStore.writeFeatureStore(selected_store_dir, kmr_matrix, genome_ids, ct_values, header["kmr_size"], featureStore.vocabularyHash(selected_vocabulary))
+    kmerCounts.storeVocabulary(selected_vocabulary, selected_dictionary_name)
+
+
+# main function
+# computes the statistics of every k-mer column of the feature store, selects the k-mers to keep, and stores the reduced
+#  feature store and vocabulary along with a .csv file of the selected k-mers
+def main(argv):
+    # current working directory:
+    start_dir = os.getcwd()
+
+    args = sys.argv
+    profiling.enableFromArgs(args, "selectFeatures.py")
+    # reads in parameters passed in by user through the command line or setting paramters to default values
+    df_name, dictionary_name, selected_df_name, selected_dictionary_name, output_file_name, min_genomes, max_prevalence, min_variance, rank, num_features, test_size, num_trees = parseParams(args, start_dir)
+
+    store_dir = os.path.join(start_dir, df_name)
+    with profiling.stage("load"):
+        header = featureStore.readHeader(store_dir)
+        vocabulary = kmerCounts.loadVocabulary(dictionary_name, header["kmr_size"])
+        if (header["vocabulary_hash"] != featureStore.vocabularyHash(vocabulary)):
+            print("Error: the vocabulary", dictionary_name, "was not used to build the feature store", df_name)
+            sys.exit(1)
+        ct_values = np.asarray(np.load(os.path.join(store_dir, "ct_values.npy"), mmap_mode="r"))
+    print("--selectFeatures.py-- opened feature store with", header["num_kmrs"], "k-mers")
+
+    # computing the statistics of the k-mers on the train set:
+    with profiling.stage("statistics"):
+        rows = trainRows(ct_values, test_size)
+        statistics = columnStatistics(store_dir, header, rows, ct_values)
+    print("--selectFeatures.py-- computed the statistics of the k-mers on", len(rows), "genomes")
+
+    with profiling.stage("select"):
+        columns = selectColumns(store_dir, header, statistics, rows, min_genomes, max_prevalence, min_variance, rank, num_features, num_trees)
+
+    with profiling.stage("store"):
+        storeSelection(store_dir, header, vocabulary, columns, os.path.join(start_dir, selected_df_name), selected_dictionary_name)
+        selected = statistics.iloc[columns].copy()
+        selected.insert(0, "kmer", kmerCounts.decodeKmers(np.asarray(vocabulary)[columns], header["kmr_size"]))
+        selected.to_csv(output_file_name, index=False)
+    print("--selectFeatures.py-- stored", len(columns), "of", header["num_kmrs"], "k-mers as '", selected_df_name, "' and '", selected_dictionary_name, "'")
+
+
+# if this is the script called by python, run main function
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,117 @@
+import sys
+import os
+import shutil
+import collections
+import numpy as np
+import pytest
+
+# the scripts of the pipeline are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import kmerCounter
+import kmerCounts
+import runKMC
+
+# checks that kmerCounter.py counts k-mers like KMC does (kmc -ci1 -fm, then kmc_dump, as runKMC.py runs them):
+#    against a brute-force count of the canonical k-mers of short sequences, written out as a KMC dump and read back
+#    against KMC itself, if kmc and kmc_dump are on the PATH (the test is skipped otherwise)
+
+COMPLEMENT = {"A": "T", "C": "G", "G": "C", "T": "A"}
+
+
+# counts the canonical k-mers of the sequences one k-mer at a time, as KMC defines them: the lexicographically smaller of
+#  the k-mer and its reverse complement, k-mers with a base other than A, C, G or T are skipped, lower-case bases are counted
+#  and k-mers do not span two sequences
+# returns: a dictionary of k-mer : frequency
+def bruteForceCounts(sequences, kmr_size):
+    counts = collections.Counter()
+    for sequence in sequences:
+        sequence = sequence.upper()
+        for i in range(len(sequence) - kmr_size + 1):
+            kmr = sequence[i:i + kmr_size]
+            if (any(base not in COMPLEMENT for base in kmr)):
+                continue
+            reverse = "".join(COMPLEMENT[base] for base in reversed(kmr))
+            counts[min(kmr, reverse)] += 1
+    return dict(counts)
+
+
+# returns the counts of kmerCounter.countSequences as a dictionary of k-mer : frequency
+def counterCounts(sequences, kmr_size):
+    codes, frequencies = kmerCounter.countSequences([sequence.encode() for sequence in sequences], kmr_size)
+    assert np.all(codes[1:] > codes[:-1]) # sorted like a KMC dump
+    return dict(zip(kmerCounts.decodeKmers(codes, kmr_size), frequencies.tolist()))
+
+
+# writes the sequences to a .fasta file, one record per sequence
+def writeFasta(fasta_path, sequences):
+    with open(fasta_path, "w") as f:
+        for r, sequence in enumerate(sequences):
+            f.write(">record_" + str(r) + "\n")
+            for start in range(0, len(sequence), 60):
+                f.write(sequence[start:start + 60] + "\n")
+
+
+# random sequences with N runs, lower-case stretches, a palindrome and records shorter than the k-mers
+def sampleSequences(seed=0):
+    rng = np.random.default_rng(seed)
+    sequences = ["".join(rng.choice(list("ACGT"), size=length)) for length in [500, 137, 64]]
+    sequences[0] = sequences[0][:100] + "NNNN" + sequences[0][104:200] + sequences[0][200:260].lower() + sequences[0][260:]
+    sequences[1] = sequences[1][:40] + "N" + sequences[1][41:]
+    return sequences + ["ACGTACGT" * 4, "AC", "acgtnacgt"]
+
+
+@pytest.mark.parametrize("kmr_size", [1, 2, 3, 5, 7, 10, 15, 21, 31])
+def test_counts_match_brute_force(kmr_size):
+    sequences = sampleSequences()
+    assert counterCounts(sequences, kmr_size) == bruteForceCounts(sequences, kmr_size)
+
+
+def test_counts_of_many_kmers_match_brute_force():
+    # more k-mers than possible codes, counted with np.bincount instead of np.unique
+    sequences = ["".join(np.random.default_rng(1).choice(list("ACGTN"), size=5000))]
+    assert counterCounts(sequences, 4) == bruteForceCounts(sequences, 4)
+
+
+def test_compare_with_kmc_dump(tmp_path):
+    # a dump in the format of kmc_dump, written from the brute-force counts and compared with compareWithKMC
+    kmr_size = 5
+    sequences = sampleSequences()
+    genomes_dir = tmp_path / "genomes"
+    kmc_out_dir = genomes_dir / "kmc_output"
+    kmc_out_dir.mkdir(parents=True)
+    writeFasta(str(genomes_dir / "SAMPLE-1.fasta"), sequences)
+    expected = bruteForceCounts(sequences, kmr_size)
+    with open(kmc_out_dir / ("SAMPLE-1_kmc." + str(kmr_size) + ".kmrs"), "w") as f:
+        f.writelines(kmr + "\t" + str(expected[kmr]) + "\n" for kmr in sorted(expected))
+    assert kmerCounter.compareWithKMC(str(genomes_dir), str(kmc_out_dir), kmr_size) == (1, [])
+
+    # a count that differs from the dump is reported
+    writeFasta(str(genomes_dir / "SAMPLE-1.fasta"), sequences + ["ACGTA"])
+    assert kmerCounter.compareWithKMC(str(genomes_dir), str(kmc_out_dir), kmr_size) == (1, ["SAMPLE-1"])
+
+
+def test_counted_file_matches_brute_force(tmp_path):
+    # the .kmrs file written by countGenome reads back (as every KMC dump is read) to the brute-force counts
+    kmr_size = 7
+    sequences = sampleSequences(2)
+    writeFasta(str(tmp_path / "SAMPLE-2.fasta"), sequences)
+    genome_id, error, seconds = kmerCounter.countGenome(str(tmp_path / "SAMPLE-2.fasta"), "SAMPLE-2", str(tmp_path), kmr_size)
+    assert error is None
+    codes, frequencies = kmerCounts.readKmrsCodes(str(tmp_path / ("SAMPLE-2_kmc." + str(kmr_size) + ".kmrs")), kmr_size)
+    assert dict(zip(kmerCounts.decodeKmers(codes, kmr_size), frequencies.tolist())) == bruteForceCounts(sequences, kmr_size)
+
+
+@pytest.mark.skipif(shutil.which("kmc") is None or shutil.which("kmc_dump") is None, reason="KMC is not installed")
+@pytest.mark.parametrize("kmr_size", [5, 10])
+def test_counts_match_kmc(tmp_path, kmr_size):
+    # KMC counts the records of a file together, so every record is counted from a .fasta file of its own, as runKMC.py does
+    sequences = [sequence for sequence in sampleSequences(3) if len(sequence) >= kmr_size]
+    genomes_dir = tmp_path / "genomes"
+    kmc_out_dir = genomes_dir / "kmc_output"
+    kmc_out_dir.mkdir(parents=True)
+    for r, sequence in enumerate(sequences):
+        fasta_path = str(genomes_dir / ("SAMPLE-" + str(r) + ".fasta"))
+        writeFasta(fasta_path, [sequence])
+        genome_id, error, seconds = runKMC.runKMCGenome(fasta_path, "SAMPLE-" + str(r), str(kmc_out_dir), kmr_size, 1)
+        assert error is None
+    assert kmerCounter.compareWithKMC(str(genomes_dir), str(kmc_out_dir), kmr_size) == (len(sequences), [])
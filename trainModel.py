@@ -1,32 +1,42 @@
 import sys
 import os
-import pandas as pd
+import math
 import numpy as np
-import pickle
+import shutil
+import tempfile
+import joblib
+from scipy import sparse
+
+import evaluation
+import featureStore
+import modelStore
+import profiling
 
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 
-# For the model evaulation:
-import math
-from sklearn.metrics import r2_score
-from sklearn.metrics import mean_squared_error
 
 
 # this function parses any parameters passed in through the command line or sets them to a default value
 # parameters:
 #    args: the list of arguments passed in through the command line
-# returns: df_name, dictionary_name, model_name, output_file_name, num_features, test_size, nt, td, rs
+# returns: df_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, intervals, num_resamples
 def parseParams(args, start_dir):
     # setting default values for parameters:
-    df_name = "kmr_df.csv" # (-d) the name that of the k-mer dataFrame (in start_dir)
+    df_name = "kmr_df" # (-d) the name of the feature store with the sparse k-mer matrix (in start_dir)
     model_name = "ct_model.sav" # (-m) the name to store the Ct value prediction model as (in start_dir)
-    output_file_name = "output_file_trainModel" # (-f) the name of the file to which to write the results
+    output_file_name = "output_file_trainModel.json" # (-f) the name of the JSON file to which to write the evaluation of the model
     test_size = 0.2 # (-ts) the test size for the train test split of the data
     # parameters for the model, default values are the optimal ones found during prameter tuning
     num_trees = 400 # (-nt) number of trees
     tree_depth = None # (-td) tree depth
     row_subsampling = 0.25 # (-rs) row subsampling
+    max_features = 1.0 # (-mx) the number (or fraction, "sqrt" or "log2") of features considered at every split
+    jobs = 1 # (-j) the number of trees to fit (and predict) in parallel, -1 for one per core
+    intervals = evaluation.INTERVALS # (-iv) the intervals to compute the accuracy of the model within
+    num_resamples = 1000 # (-bs) the number of bootstrap resamples for the confidence intervals of the evaluation
+    backend = "threading" # (-bk) the joblib backend the trees are fit with: "threading" or "loky" (worker processes)
+    chunk_size = None # (-cs) train out of core, reading at most chunk_size rows of the k-mer matrix into memory at once
 
 
     # parsing any parameters passed in through the command line
@@ -43,133 +53,263 @@ def parseParams(args, start_dir):
         elif (args[i] == "-f" or args[i] == "--output_file_name"):
             output_file_name = args[i + 1]
         elif( args[i] == "-ts" or args[i] == "--test_size"):
-            test_size = args[i + 1]
+            test_size = parseNumber(args[i + 1])
         elif( args[i] == "-nt" or args[i] == "--num_trees"):
-            num_trees = args[i + 1]
+            num_trees = int(args[i + 1])
         elif( args[i] == "-td" or args[i] == "--tree_depth"):
-            tree_depth = args[i + 1]
+            tree_depth = parseNumber(args[i + 1])
         elif( args[i] == "-rs" or args[i] == "--row_subsampling"):
-            row_subsampling = args[i + 1]
+            row_subsampling = parseNumber(args[i + 1])
+        elif( args[i] == "-mx" or args[i] == "--max_features"):
+            max_features = parseMaxFeatures(args[i + 1])
+        elif( args[i] == "-j" or args[i] == "--jobs"):
+            jobs = int(args[i + 1])
+        elif( args[i] == "-iv" or args[i] == "--intervals"):
+            intervals = evaluation.parseIntervals(args[i + 1])
+        elif( args[i] == "-bs" or args[i] == "--bootstrap"):
+            num_resamples = int(args[i + 1])
+        elif( args[i] == "-bk" or args[i] == "--backend"):
+            backend = args[i + 1]
+        elif( args[i] == "-cs" or args[i] == "--chunk_size"):
+            chunk_size = int(args[i + 1])
+
+    if (backend not in ["threading", "loky"]):
+        print("Error: unknown backend (-bk)", backend, "(must be threading or loky)")
+        sys.exit()
+
+    if (chunk_size is not None and chunk_size < 1):
+        print("Error: the chunk size (-cs) must be at least 1")
+        sys.exit()
+
+    return df_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, intervals, num_resamples, chunk_size
+
+
+# parses a hyperparameter passed in through the command line
+# "None" is None, a value with a decimal point or exponent is a float (a fraction, e.g. of the rows) and anything else an int (a count)
+def parseNumber(value):
+    if (value == "None"):
+        return None
+    if ("." in value or "e" in value.lower()):
+        return float(value)
+    return int(value)
 
-    return df_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling
+
+# parses the max_features parameter, which is a number or the name of a rule ("sqrt" or "log2")
+def parseMaxFeatures(value):
+    if (value in ["sqrt", "log2"]):
+        return value
+    return parseNumber(value)
 
 
 
 
 # returns a string of all the options for the script if the script was called with -h or --help
 def helpOption():
-    s+= "\n-d --df_name:\tthe name of the k-mer DataFrame to train the model on (must be a .csv file). The default is 'kmr_df.csv'"
+    s = "-d --df_name:\tthe name of the feature store with the sparse k-mer matrix to train the model on. The default is 'kmr_df'"
     s+= "\n-m --model_name:\tthe name to store the Ct value prediction model created by the script as (must be a .sav file). The default is 'ct_model.sav'"
-    s+= "\n-f --output_file_name:\tthe name of the output file for this script. This file will be created in the directory from which the script is run. The default is 'output_file_trainModel'"
+    s+= "\n-f --output_file_name:\tthe name of the JSON file to write the evaluation of the model to. This file will be created in the directory from which the script is run. The default is 'output_file_trainModel.json'"
     s+= "\n-ts --test_size:\tthe size of the test set to be used in the train_test_split during model training and evaluation. The default is 0.2"
     s+="\n-nt --num_trees:\tthe 'n_estimators' (number of trees) parameter in the Random Forest regressor. The default is 400"
     s+="\n-td --tree_depth:\tthe 'max_depth' (tree depth) parameter in the Random Forest regressor. The default is None"
     s+="\n-rs --row_subsampling:\tthe 'max_samples' parameter in the Random Forest regressor. the default is 0.25"
+    s+="\n-mx --max_features:\tthe 'max_features' parameter in the Random Forest regressor: a number of features, a fraction of the features, 'sqrt' or 'log2'. The default is 1.0"
+    s+="\n-j --jobs:\tthe number of trees to fit and predict in parallel ('n_jobs' of the Random Forest regressor), -1 for one per CPU core. The default is 1"
+    s+="\n-iv --intervals:\tthe comma-separated intervals (in Ct) to compute the accuracy of the model within. The default is '6,5,4,3,2,1'"
+    s+="\n-bs --bootstrap:\tthe number of bootstrap resamples for the confidence intervals of the evaluation, 0 for none. The default is 1000"
+    s+="\n-cs --chunk_size:\ttrain out of core: the train and test sets are split by row index and the model is fit by batched bagging, every batch of trees on a float32 copy of at most chunk_size random train rows read from the memory-mapped feature store, so the whole matrix is never in memory at once. There is no default for this option (the train set is read into memory at once)"
+    s+="\n-bk --backend:\tthe joblib backend the trees are fit with: 'threading' (threads sharing the matrix) or 'loky' (worker processes sharing the matrix through memory-mapped files). The default is 'threading'"
+    s+= "\n" + profiling.helpOption()
     return s
 
 
-# opens the DataFrame (stored as a .csv file)
+# opens the sparse k-mer matrix (stored as a feature store by createDataFrame.py, see featureStore.py)
+# the matrix is memory-mapped, so rows are only read from disk once they are used
+# rows without a Ct value are dropped
 # parameters:
-#    df_dir: the directory in which the DataFrame is stored
-#    df_name: the name that the DataFrame is stored as
-# returns: the DataFrame
-def openDataFrame(df_dir, df_name, start_dir):
-    os.chdir(df_dir)
-    df_path = df_dir + "/" + df_name
-    df = pd.read_csv(df_path)
-    df = df.dropna()   #dropping any Nans
-    os.chdir(start_dir)
+#    df_dir: the directory in which the feature store is stored
+#    df_name: the name of the feature store directory
+# returns: the sparse k-mer matrix (CSR) and the Ct value of every row
+def openDataFrame(df_dir, df_name):
+    kmr_matrix, genome_ids, ct_values, header = featureStore.loadFeatureStore(os.path.join(df_dir, df_name))
 
-    return df
+    # dropping any rows without a Ct value
+    has_ct = ~np.isnan(ct_values)
+    if (not has_ct.all()):
+        kmr_matrix = kmr_matrix[has_ct]
+        ct_values = ct_values[has_ct]
 
+    return kmr_matrix, np.asarray(ct_values)
 
-# splits the DataFrame into a train set and a test set and converts them to numpy array
+
+# splits the k-mer matrix into a train set and a test set
+# the sets stay sparse, only the rows are split
 # parameter:
-#    df: the DataFrame to be split into a train and test set
+#    kmr_matrix: the sparse k-mer matrix to be split into a train and test set
+#    ct_values: the Ct value of every row of kmr_matrix
 #    ts: the test set size (as a decimal)
 # returns: the train set, train labels, test set, and test labels
-def splitDf(df, ts):
-    mat = pd.DataFrame(df).to_numpy()
-    train_set, test_set = train_test_split(mat, test_size=ts, random_state=42)
+def splitDf(kmr_matrix, ct_values, ts):
+    train_set, test_set, train_labels, test_labels = train_test_split(kmr_matrix, ct_values, test_size=ts, random_state=42)
 
-    r, c = train_set.shape
-    train_labels = train_set[:,(c-1)].copy() # copying the Ct values into train_labels
-    #dropping the columns for the ct_value (c-1), index (1), and genome_id (0)
-    train_set = np.delete(train_set, [(c - 1), 1, 0], 1)
+    return train_set, train_labels, test_set, test_labels
 
-    r, c = test_set.shape
-    test_labels = test_set[:,(c - 1)].copy() # copying the Ct values into test_labels
-    #dropping the columns for the ct_value (c-1), index (1), and genome_id (0)
-    test_set = np.delete(test_set, [(c - 1), 1, 0], 1)
 
-    return train_set, train_labels, test_set, test_labels
+# stores the train set as a float32 CSC matrix in memory-mapped files
+# float32 CSC is the format the trees are fit on, so the Random Forest uses the matrix as it is instead of converting (copying) it,
+#  and worker processes (-bk loky) map the same files instead of each receiving a copy of the matrix
+# parameters:
+#    train_set: the sparse train set
+#    temp_dir: the directory to store the files in
+# returns: the train set backed by the memory-mapped files
+def memmapTrainSet(train_set, temp_dir):
+    train_set = sparse.csc_matrix(train_set, dtype=np.float32)
+    train_set.sort_indices()
+    arrays = []
+    for name in ["data", "indices", "indptr"]:
+        path = os.path.join(temp_dir, "train_" + name + ".npy")
+        np.save(path, getattr(train_set, name))
+        arrays.append(np.load(path, mmap_mode="r"))
+    return sparse.csc_matrix(tuple(arrays), shape=train_set.shape, copy=False)
+
+
+# fits the Random Forest regressor, fitting jobs trees at a time
+# with the threading backend the trees are fit by threads of this process that share the matrix (the tree building releases the GIL)
+# with the loky backend they are fit by worker processes that map the train set from memory-mapped files (see memmapTrainSet)
+# the trees are the same with either backend and any number of jobs
+# parameters:
+#    train_set, train_labels: the train set and its labels
+#    num_trees, tree_depth, row_subsampling, max_features: the parameters of the model
+#    jobs: the number of trees to fit in parallel (-1 for one per CPU core)
+#    backend: "threading" or "loky"
+#    random_state: the seed of the Random Forest
+# returns: the fitted model
+def fitModel(train_set, train_labels, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, random_state=42):
+    model = RandomForestRegressor(n_estimators=num_trees, max_depth=tree_depth, random_state=random_state, max_samples=row_subsampling, max_features=max_features, n_jobs=jobs)
+    if (backend != "loky"):
+        model.fit(train_set, train_labels)
+        return model
+
+    temp_dir = tempfile.mkdtemp(prefix="ct_train_")
+    try:
+        train_set = memmapTrainSet(train_set, temp_dir)
+        with joblib.parallel_backend("loky", n_jobs=jobs):
+            model.fit(train_set, train_labels)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return model
 
 
 # evaluates the model on the test set
-# calculates the R2 and RMSE using the model's predictions on the test set
-# calls getAccuracyWithinIntervals to compute the model's accuracy within a set of intervals
-# writes the results to a file
+# calculates the R2, RMSE and accuracy within intervals of the model's predictions on the test set, overall and for every
+#  testing instrument (read from the instrument columns of the test set), with bootstrapped confidence intervals (see evaluation.py)
+# writes the results to a JSON file
 # parameters:
 #    model: the fitted  model to evaluate
 #    test set: the test set to predict
 #    test_labels: the true values for the test set
 #    output_file_path: the path to the file to which to write the results
-def evaluateModel(model, test_set, test_labels, output_file_path):
+#    intervals: the intervals to compute the accuracy within
+#    num_resamples: the number of bootstrap resamples (0 for no confidence intervals)
+# returns: the report
+def evaluateModel(model, test_set, test_labels, output_file_path, intervals=evaluation.INTERVALS, num_resamples=1000):
     # predicting the test set:
     predictions = model.predict(test_set)
     print("--trainMode.py-- predicted test set")
 
-    mse = mean_squared_error(test_labels, predictions)
-    rmse = math.sqrt(mse)
-    r2 = r2_score(test_labels, predictions)
+    report = evaluation.evaluationReport(predictions, test_labels, evaluation.rowInstruments(test_set), intervals, num_resamples)
+    evaluation.writeReport(report, output_file_path)
+    return report
 
-    #Writing the R2 and RMSE to the output file
-    f = open((output_file_path), "a")
-    s = "\nModel Accuracy: \nR2: " + str(r2) + "\nRMSE: " + str(rmse)
-    f.write(s)
-    f.close()
 
-    # calculating the accuracy within intervals
-    getAccuracyWithinIntervals(predictions, test_labels, output_file_path)
-
-
-# computes model's accuracy within intervals as % of times prediction was within interval of actual and writes the results to a file
+# splits the rows of the k-mer matrix into a train set and a test set by their indices, without reading the matrix
+# the rows without a Ct value are left out, and the sets are the same as the ones splitDf makes after openDataFrame
 # parameters:
-#    predictions and true_values: the model's predictions and the true_values it was predicting
-#    output_file_path: the path to the output file to which to write the results
-def getAccuracyWithinIntervals(predictions, true_values, output_file_path):
-    intervals = [6, 5, 4, 3, 2, 1] # the intervals within which to calculate the model' accuracy
-
-    # accuracies will keep track of the total times that the model's prediction was within the interval of the true value
-    accuracies = []
-    for i in range(len(intervals)):
-        accuracies.append(0)
-
-    # iterating through all the predictions and actuals and updates the accuracies list
-    for i in range(len(predictions)):
-        true = true_values.item(i)
-        predicted = predictions.item(i)
-        # iterates through all the intervals to calculate whether the prediction was within that interval of the true value
-        for j in range(len(intervals)):
-           intv = intervals[j]
-           if (abs(true - predicted) <= intv): #checking if the true was within the interval of the prediction
-               accuracies[j] = accuracies[j] + 1
-
-
-    f = open((output_file_path), "a")
-    f.write("\n\nAccuracy Within Intervals:\n")
-
-    for i in range(len(accuracies)):
-        # dividing the number of times the prediction was within the interval of the true value by the total number of predictions
-        accuracies[i] = accuracies[i] / len(predictions)
-        #Writing the accuracy of the model within the interval to the output file
-        f.write("within " + str(intervals[i]) + ":  " + str(accuracies[i]) + "\n")
+#    ct_values: the Ct value of every row of the k-mer matrix
+#    ts: the test set size (as a decimal)
+# returns: the row indices and labels of the train set and of the test set (in the order of splitDf)
+def splitRows(ct_values, ts):
+    labeled = np.flatnonzero(~np.isnan(ct_values))
+    train_rows, test_rows = train_test_split(labeled, test_size=ts, random_state=42)
+    return train_rows, np.asarray(ct_values[train_rows]), test_rows, np.asarray(ct_values[test_rows])
+
+
+# fits the Random Forest regressor out of core, by batched bagging over chunks of the train rows
+# the train rows are split into chunks of at most chunk_size random rows; the trees are divided evenly among the chunks, and
+#  the trees of a chunk are fit (with fitModel) on a float32 copy of the rows of the chunk read from the memory-mapped matrix,
+#  so only one chunk is in memory at a time; the trees of all chunks are then put together into one forest
+# the number of chunks depends only on chunk_size, every chunk gets at least one tree, so there must be at least as many trees
+#  as chunks (a ValueError is raised otherwise)
+# every tree is still fit on a sample of row_subsampling of all train rows (but at most the rows of its chunk), drawn from
+#  its chunk, which is itself a random sample of the train rows
+# with a single chunk (chunk_size at least the number of train rows) the model is the same as the one fitModel fits
+# parameters:
+#    kmr_matrix: the memory-mapped k-mer matrix (CSR) of the feature store
+#    train_rows, train_labels: the row indices of the train set (see splitRows) and their labels
+#    num_trees, tree_depth, row_subsampling, max_features: the parameters of the model
+#    jobs: the number of trees to fit in parallel
+#    backend: "threading" or "loky"
+#    chunk_size: the maximal number of rows read into memory at once
+# returns: the fitted model
+def fitModelChunked(kmr_matrix, train_rows, train_labels, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, chunk_size):
+    num_chunks = max(1, math.ceil(len(train_rows) / chunk_size))
+    if (num_chunks > num_trees):
+        raise ValueError("the number of trees (-nt) must be at least the number of chunks, ceil(" + str(len(train_rows)) + " train rows / " + str(chunk_size) + ") = " + str(num_chunks))
+    # the train rows are in the random order of the split, so consecutive rows are random chunks
+    chunks = np.array_split(np.arange(len(train_rows)), num_chunks)
+    trees = np.array_split(np.arange(num_trees), num_chunks)
+
+    model = None
+    for c in range(num_chunks):
+        samples = row_subsampling
+        if (num_chunks > 1):
+            # the number of rows every tree is fit on, as without chunks (but no more than the rows of the chunk)
+            if (samples is None):
+                samples = len(train_rows)
+            elif (isinstance(samples, float)):
+                samples = max(1, round(samples * len(train_rows)))
+            samples = min(samples, len(chunks[c]))
+        with profiling.stage("chunk"):
+            chunk_set = sparse.csr_matrix(kmr_matrix[train_rows[chunks[c]]], dtype=np.float32)
+            profiling.count("rows_read", chunk_set.shape[0])
+            chunk_model = fitModel(chunk_set, train_labels[chunks[c]], len(trees[c]), tree_depth, samples, max_features, jobs, backend, 42 + c)
+        del chunk_set
+        print("--trainModel.py-- fit", len(trees[c]), "trees on chunk", c + 1, "of", num_chunks, "(", len(chunks[c]), "rows )")
+        if (model is None):
+            model = chunk_model
+        else:
+            model.estimators_ += chunk_model.estimators_
+    model.n_estimators = len(model.estimators_)
+    return model
+
+
+# evaluates the model on the test set like evaluateModel, predicting the rows of the test set chunk_size rows at a time
+# parameters:
+#    model: the fitted model to evaluate
+#    kmr_matrix: the memory-mapped k-mer matrix (CSR) of the feature store
+#    test_rows, test_labels: the row indices of the test set (see splitRows) and their labels
+#    output_file_path: the path to the file to which to write the results
+#    intervals: the intervals to compute the accuracy within
+#    num_resamples: the number of bootstrap resamples (0 for no confidence intervals)
+#    chunk_size: the maximal number of rows read into memory at once
+# returns: the report
+def evaluateModelChunked(model, kmr_matrix, test_rows, test_labels, output_file_path, intervals, num_resamples, chunk_size):
+    predictions = []
+    instruments = []
+    for start in range(0, len(test_rows), chunk_size):
+        chunk_set = kmr_matrix[test_rows[start:start + chunk_size]]
+        predictions.append(model.predict(chunk_set))
+        instruments.append(evaluation.rowInstruments(chunk_set))
+    print("--trainMode.py-- predicted test set")
 
-    f.close()
+    predictions = np.concatenate(predictions) if len(predictions) > 0 else np.zeros(0)
+    instruments = np.concatenate(instruments) if len(instruments) > 0 else np.zeros(0, dtype=object)
+    report = evaluation.evaluationReport(predictions, test_labels, instruments, intervals, num_resamples)
+    evaluation.writeReport(report, output_file_path)
+    return report
 
 
 # main function
-# trains a model on the k-mer dataFrame created by createDataFrame.py
+# trains a model on the sparse k-mer matrix created by createDataFrame.py
 # evaluates the model's accuracy (r2 score, RMSE, accuracy within intervals)
 # prints a list of the top features (k-mers) of the model
 def main(argv):
@@ -177,35 +317,55 @@ def main(argv):
     start_dir = os.getcwd()
 
     args = sys.argv
+    profiling.enableFromArgs(args, "trainModel.py")
     # reads in parameters passed in by user through the command line or setting paramters to default values
-    df_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling = parseParams(args, start_dir)
+    df_name, model_name, output_file_name, test_size, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, intervals, num_resamples, chunk_size = parseParams(args, start_dir)
 
 
-    # opening the DataFrame
-    df = openDataFrame(start_dir, df_name, start_dir)
-    print("--trainModel.py-- opened DataFrame")
+    if (chunk_size is not None):
+        # training out of core: the k-mer matrix stays memory-mapped and at most chunk_size of its rows are read at once
+        with profiling.stage("load"):
+            kmr_matrix, genome_ids, ct_values, header = featureStore.loadFeatureStore(os.path.join(start_dir, df_name))
+        print("--trainModel.py-- opened k-mer matrix")
 
-    #splitting the DataFrame into a train and test set
-    train_set, train_labels, test_set, test_labels = splitDf(df, test_size)
-    print("--trainModel.py-- split the DataFrame into train and test sets")
+        with profiling.stage("split"):
+            train_rows, train_labels, test_rows, test_labels = splitRows(ct_values, test_size)
+        print("--trainModel.py-- split the rows of the k-mer matrix into train and test sets")
 
-    model =  RandomForestRegressor(n_estimators=num_trees, max_depth=tree_depth, random_state=42, max_samples=row_subsampling)
+        with profiling.stage("fit"):
+            model = fitModelChunked(kmr_matrix, train_rows, train_labels, num_trees, tree_depth, row_subsampling, max_features, jobs, backend, chunk_size)
+        print("--trainModel.py-- trained the model")
 
-    # training the model:
-    model.fit(train_set, train_labels)
-    print("--trainModel.py-- trained the model")
+        with profiling.stage("evaluate"):
+            report = evaluateModelChunked(model, kmr_matrix, test_rows, test_labels, os.path.join(start_dir, output_file_name), intervals, num_resamples, chunk_size)
+        print("--trainModel.py-- RMSE:", report["overall"].get("rmse"), " R2:", report["overall"].get("r2"))
 
-    # creating the output file:
-    os.chdir(start_dir)
-    os.system("touch " + output_file_name)
+    else:
+        # opening the sparse k-mer matrix
+        with profiling.stage("load"):
+            kmr_matrix, ct_values = openDataFrame(start_dir, df_name)
+        print("--trainModel.py-- opened k-mer matrix")
+
+        #splitting the k-mer matrix into a train and test set
+        with profiling.stage("split"):
+            train_set, train_labels, test_set, test_labels = splitDf(kmr_matrix, ct_values, test_size)
+        print("--trainModel.py-- split the k-mer matrix into train and test sets")
+
+        # training the model:
+        with profiling.stage("fit"):
+            model = fitModel(train_set, train_labels, num_trees, tree_depth, row_subsampling, max_features, jobs, backend)
+        print("--trainModel.py-- trained the model")
 
-    # evaluating the model's accuracy and writing the results to a file
-    evaluateModel(model, test_set, test_labels, (start_dir + "/" + output_file_name))
+        # evaluating the model's accuracy and writing the results to a file
+        with profiling.stage("evaluate"):
+            report = evaluateModel(model, test_set, test_labels, os.path.join(start_dir, output_file_name), intervals, num_resamples)
+        print("--trainModel.py-- RMSE:", report["overall"].get("rmse"), " R2:", report["overall"].get("r2"))
 
 
     # storing the model to start_dir
     os.chdir(start_dir)
-    pickle.dump(model, open(model_name, "wb"))
+    with profiling.stage("store"):
+        modelStore.storeModel(model, model_name)
     print("--trainModel.py-- stored results as '", output_file_name, "' in  '", start_dir, "'")
 
 